@@ -6,29 +6,336 @@ import threading
 from pathlib import Path
 import telegram
 from telegram import Bot
-import json
-from datetime import datetime
+from telegram.request import HTTPXRequest
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dtime
 import glob
+import logging.handlers
+from collections import deque
+from state_store import FileStateStore
+from journal import AlertJournal
+from archive import AlertArchive, format_digest
+from sender import TelegramSender
+from batcher import AlertBatcher
+from routing import Router
+from dedup import AlertDeduplicator, symbol_from_file
+from rules import RuleEngine
+import metrics
+import settings
+from control import ControlServer
+from commands import BotCommands, TelegramUpdateSource
+from charts import ChartRenderer
+from shards import ShardCoordinator
+from sessions import build_schedule
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+ENCODINGS = ('utf-8', 'big5')
+TAIL_CHECK_BYTES = 64  # 用來偵測檔案被改寫的位移前內容長度
+DEFAULT_TAIL_BUFFER = 1024 * 1024  # 每個檔案每次最多讀取的位元組數
+RESET_REASONS = {'replaced': "替換", 'truncated': "截斷", 'rewritten': "改寫"}
+
+def decode_line(raw):
+    """解碼單行內容，UTF-8 失敗時改用 Big5"""
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('big5', errors='replace')
+
+def decode_chunk(data, encoding=None):
+    """
+    解碼一段新增內容，回傳 (文字, 使用的編碼)
+
+    優先使用上次偵測到的編碼，只有失敗時才嘗試其他編碼；
+    全部失敗（例如混用編碼）時逐行解碼。
+    """
+    candidates = (encoding,) + tuple(e for e in ENCODINGS if e != encoding) if encoding else ENCODINGS
+    for candidate in candidates:
+        try:
+            return data.decode(candidate), candidate
+        except UnicodeDecodeError:
+            continue
+    return '\n'.join(decode_line(raw) for raw in data.split(b'\n')), encoding
+
+def line_hash(line):
+    """計算單行內容的短雜湊"""
+    return hashlib.sha1(line.encode('utf-8')).hexdigest()[:16]
+
+def list_log_files(directory):
+    """只列出目錄中的 .log 檔案路徑，不呼叫 stat（在執行緒池中執行）"""
+    with os.scandir(directory) as entries:
+        return [Path(entry.path) for entry in entries if entry.name.endswith('.log') and entry.is_file()]
+
+def stat_files(file_paths):
+    """批次取得多個檔案的 stat，已消失的檔案略過（在執行緒池中執行）"""
+    results = []
+    for file_path in file_paths:
+        try:
+            results.append((file_path, os.stat(file_path)))
+        except FileNotFoundError:
+            continue
+    return results
+
+def eof_state_from_stat(stat):
+    """由 stat 結果建立指向檔案結尾的狀態"""
+    return {
+        'offset': stat.st_size,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'inode': stat.st_ino,
+        'last_line_hash': None,
+        'encoding': None,
+        'tail_hash': None
+    }
+
+def file_changed(state, stat):
+    """依記錄的狀態判斷檔案：新檔案回傳 True，有更新回傳 False，沒有變更回傳 None"""
+    if state is None:
+        return True
+    if stat.st_mtime_ns > state['mtime_ns'] or stat.st_size != state['offset']:
+        return False
+    return None
+
+def scan_directories(directories, scanner):
+    """對每個監控目錄執行 scanner 並合併結果，不存在的目錄略過（在執行緒池中執行）"""
+    results = []
+    for directory in directories:
+        try:
+            results.extend(scanner(directory))
+        except FileNotFoundError:
+            logger.warning(f"監控目錄不存在: {directory}")
+    return results
+
+def scan_log_files(directory):
+    """列出目錄中所有 .log 檔案及其 stat 結果（在執行緒池中執行）"""
+    results = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.log') and entry.is_file():
+                try:
+                    results.append((Path(entry.path), entry.stat()))
+                except FileNotFoundError:
+                    continue
+    return results
+
+def content_hash(data):
+    """計算一段位元組的短雜湊"""
+    return hashlib.sha1(data).hexdigest()[:16]
+
+def resume_offset(f, file_path, state, stat):
+    """
+    決定從哪個位移繼續讀取
+
+    檔案被替換（inode 改變）、被截斷（大小小於位移），或位移前的內容與上次記錄的
+    不同（截斷後又寫回同樣或更大的大小）時從頭讀取。
+    """
+    if not state:
+        return 0
+    offset = state.get('offset', stat.st_size)
+    inode = state.get('inode')
+    if inode is not None and inode != stat.st_ino:
+        reason = "replaced"
+    elif stat.st_size < offset:
+        reason = "truncated"
+    else:
+        tail_hash = state.get('tail_hash')
+        if not tail_hash or not offset:
+            return offset
+        start = max(0, offset - TAIL_CHECK_BYTES)
+        f.seek(start)
+        if content_hash(f.read(offset - start)) == tail_hash:
+            return offset
+        reason = "rewritten"
+
+    logger.info(f"檔案被{RESET_REASONS[reason]}，從頭讀取: {Path(file_path).name}")
+    metrics.files_reset.inc(reason=reason)
+    return 0
+
+def read_appended_lines(file_path, state, include_partial=False, tail_buffer=DEFAULT_TAIL_BUFFER):
+    """
+    從上次記錄的位元組位移開始讀取新增內容，回傳 (新增行列表, 新狀態)
+
+    檔案被截斷、替換或改寫時從頭讀取（見 resume_offset）。
+    只有以換行結尾的完整行會被讀取；結尾沒有換行的最後一段保留到下次，
+    除非 include_partial 為 True（檔案已停止寫入）。
+    每次最多讀取 tail_buffer 位元組（到其中最後一個換行為止），記憶體用量不隨檔案大小
+    增加；未讀取的內容超過這個大小時，新位移停在讀到的位置，其餘內容由呼叫端再次呼叫讀取。
+    """
+    stat = os.stat(file_path)
+    with open(file_path, 'rb') as f:
+        offset = resume_offset(f, file_path, state, stat)
+
+        f.seek(offset)
+        data = f.read(tail_buffer)
+
+        if not include_partial or len(data) == tail_buffer:
+            # 只取到最後一個換行為止，未完成的行留待下次讀取
+            # （單行超過 tail_buffer 時整段讀取，避免卡住）
+            end = data.rfind(b'\n') + 1
+            if end or len(data) < tail_buffer:
+                data = data[:end]
+        new_offset = offset + len(data)
+
+        # 記錄位移前的一小段內容，用來偵測檔案被改寫
+        start = max(0, new_offset - TAIL_CHECK_BYTES)
+        if new_offset - start <= len(data):
+            tail = data[len(data) - (new_offset - start):]
+        else:
+            f.seek(start)
+            tail = f.read(new_offset - start)
+    metrics.bytes_read.inc(len(data))
+
+    encoding = (state or {}).get('encoding')
+    text, encoding = decode_chunk(data, encoding)
+    new_lines = [line.strip() for line in text.split('\n') if line.strip()]
+
+    new_state = {
+        'offset': new_offset,
+        'size': new_offset,
+        'mtime_ns': stat.st_mtime_ns,
+        'inode': stat.st_ino,
+        'last_line_hash': line_hash(new_lines[-1]) if new_lines else (state or {}).get('last_line_hash'),
+        'encoding': encoding,
+        'tail_hash': content_hash(tail) if tail else None
+    }
+    return new_lines, new_state
+
+class SettleTracker:
+    """
+    追蹤檔案是否已停止寫入
+
+    檔案的大小與修改時間在 settle_window 秒內都沒有變化，才視為寫入完成。
+    """
+
+    def __init__(self, settle_window=0.5):
+        self.settle_window = settle_window
+        self.observations = {}  # file_key -> (size, mtime_ns, 首次看到此狀態的時間)
+
+    def is_settled(self, file_key, stat):
+        """記錄本次觀察，回傳檔案是否已穩定"""
+        now = time.monotonic()
+        signature = (stat.st_size, stat.st_mtime_ns)
+        previous = self.observations.get(file_key)
+        if previous is None or previous[:2] != signature:
+            self.observations[file_key] = signature + (now,)
+            return False
+        return now - previous[2] >= self.settle_window
+
+    def clear(self, file_key):
+        """檔案內容已處理完畢，移除追蹤紀錄"""
+        self.observations.pop(file_key, None)
+
+class LogEventHandler(FileSystemEventHandler):
+    """把 watchdog 的 .log 建立/修改事件轉交給事件迴圈"""
+
+    def __init__(self, loop, callback):
+        super().__init__()
+        self.loop = loop
+        self.callback = callback
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in ('created', 'modified', 'moved'):
+            return
+        path = getattr(event, 'dest_path', '') or event.src_path
+        if path.endswith('.log'):
+            # watchdog 在自己的執行緒呼叫，需切回事件迴圈
+            self.loop.call_soon_threadsafe(self.callback, path)
+
 class XQDirectoryMonitor:
-    def __init__(self, telegram_bot, chat_id, watch_directory):
+    def __init__(self, telegram_bot, chat_id, watch_directory, watch_mode="polling", reconcile_interval=30,
+                 settle_window=0.5, sender_options=None, batching_options=None, io_workers=4, router=None,
+                 dedup_options=None, metrics_options=None, rule_engine=None, service_options=None,
+                 journal_options=None, archive_options=None, tail_buffer=DEFAULT_TAIL_BUFFER,
+                 commands_options=None, update_source=None, charts_options=None, shard_options=None,
+                 schedule_options=None):
         self.telegram_bot = telegram_bot
         self.chat_id = chat_id
-        self.watch_directory = Path(watch_directory)
+        # 可以監控多個目錄；狀態與待發送訊息存放在第一個目錄
+        if isinstance(watch_directory, (list, tuple)):
+            self.watch_directories = [Path(directory) for directory in watch_directory]
+        else:
+            self.watch_directories = [Path(watch_directory)]
+        self.watch_directory = self.watch_directories[0]
+        self.router = router or Router.from_config(None, chat_id)
+        self.rule_engine = rule_engine or RuleEngine()
         self.file_states = {}  # 儲存每個檔案的狀態
         self.running = False
-        self.state_file = self.watch_directory / ".xq_file_states.json"  # 狀態檔案
+        self.paused = False  # 暫停時不讀取檔案，恢復後從記錄的位置繼續
+        self.started_at = None
+        self.muted = {}  # 商品代號 -> 靜音到期時間
+        self.watch_mode = watch_mode  # "polling" 或 "watchdog"
+        self.reconcile_interval = reconcile_interval  # watchdog 模式下的校正掃描間隔（秒）
+        self.observer = None
+        self.event_handler = None
+        self.watches = {}  # 目錄 -> watchdog 監看項目
+        self.event_queue = None
+        self.pending_paths = set()  # 已排入佇列、尚未處理的檔案（合併重複事件）
+        self.settle_tracker = SettleTracker(settle_window)
+        self.file_locks = {}  # 每個檔案一把鎖，確保同一檔案的通知依序處理
+        self.tasks = set()  # 事件模式下處理中的檔案工作
+        self.sender_options = sender_options or {}
+        self.sender = None
+        self.batching_options = batching_options or {}
+        self.batcher = None
+        self.executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="xq-io")
+        self.baseline_pending = set()  # 啟動時已存在、尚未建立基準的檔案
+        self.baseline_task = None
+        self.startup_stats = {}
+        dedup_options = dict(dedup_options or {})
+        self.deduplicator = None
+        if dedup_options.pop("enabled", True):
+            self.deduplicator = AlertDeduplicator(self.watch_directory / ".xq_dedup.json", **dedup_options)
+        self.metrics_options = metrics_options or {}
+        self.metrics_server = None
+        self.service_options = service_options or {}
+        self.control_server = None
+        self.recent_alerts = deque(maxlen=100)  # 最近的通知，供控制通道查詢
+        self.last_stats_log = time.monotonic()
+        metrics.metrics.gauge("xq_tracked_files", "追蹤中的檔案數", lambda: len(self.file_states))
+        metrics.metrics.gauge(
+            "xq_alerts_suppressed", "因重複而略過的通知數",
+            lambda: self.deduplicator.suppressed if self.deduplicator else 0
+        )
+        self.state_store = None
+        self.journal_options = journal_options or {}
+        self.journal = None
+        self.archive_options = archive_options or {}
+        self.archive = None
+        self.tail_buffer = tail_buffer  # 每個檔案每次最多讀取的位元組數
+        self.commands_options = commands_options or {}
+        self.update_source = update_source  # 測試時可換成 LocalUpdateSource
+        self.commands = None
+        self.charts_options = charts_options or {}
+        self.charts = None
+        self.shard_options = shard_options or {}
+        self.shards = None
+        self.schedule = build_schedule(schedule_options or {})  # 未啟用交易時段排程時為 None
+        self.wakeup = asyncio.Event()  # 停止、恢復或排程變更時提早結束等待
+        metrics.metrics.gauge(
+            "xq_in_session", "是否在交易時段內（未啟用排程時為 1）",
+            lambda: 1 if self.in_session() else 0
+        )
 
     def load_file_states(self):
-        """載入檔案狀態"""
+        """載入檔案狀態（首次執行時自動轉移舊版 JSON 狀態）"""
         try:
-            if self.state_file.exists():
-                with open(self.state_file, 'r', encoding='utf-8') as f:
-                    self.file_states = json.load(f)
+            if self.state_store is None:
+                self.state_store = FileStateStore(self.watch_directory / ".xq_file_states.db")
+            for directory in self.watch_directories:
+                self.state_store.migrate_from_json(directory / ".xq_file_states.json")  # 舊版狀態檔案
+            self.file_states = self.state_store.load()
+            if self.file_states:
                 logger.info(f"載入檔案狀態: {len(self.file_states)} 個檔案")
             else:
                 logger.info("沒有找到檔案狀態記錄，將記錄現有檔案")
@@ -36,250 +343,910 @@ class XQDirectoryMonitor:
             logger.error(f"載入檔案狀態時發生錯誤: {e}")
             self.file_states = {}
 
-    def save_file_states(self):
-        """儲存檔案狀態"""
+    async def run_io(self, func, *args, **kwargs):
+        """在 I/O 執行緒池中執行阻塞的檔案操作，避免卡住事件迴圈"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def set_file_state(self, file_key, state):
+        """更新單一檔案狀態，並排入狀態儲存"""
+        self.file_states[file_key] = state
+        if self.state_store:
+            self.state_store.update(file_key, state)
+
+    async def save_file_states(self):
+        """儲存檔案狀態（只寫入有變更的檔案，與通知日誌一起提交）與重複通知紀錄"""
         try:
-            # 使用臨時檔案避免寫入時程式崩潰導致狀態檔案損壞
-            temp_file = self.state_file.with_suffix('.tmp')
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(self.file_states, f, indent=2, ensure_ascii=False)
-            # 原子性移動檔案
-            temp_file.replace(self.state_file)
+            if self.journal:
+                with metrics.state_save_duration.time():
+                    await self.journal.commit()
+            elif self.state_store:
+                with metrics.state_save_duration.time():
+                    await self.run_io(self.state_store.flush)
         except Exception as e:
             logger.error(f"儲存檔案狀態時發生錯誤: {e}")
+        if self.deduplicator:
+            self.deduplicator.save()
 
     async def initialize_existing_files(self):
-        """初始化現有檔案，記錄其狀態但不發送通知"""
+        """
+        初始化現有檔案，記錄其狀態但不發送通知
+
+        這裡只列出檔名，找出尚未記錄的檔案後立即返回讓監控開始；
+        這些檔案的基準（檔案結尾位移）由背景工作平行取得 stat 建立，不讀取內容。
+        """
+        started = time.monotonic()
         try:
             # 載入之前記錄的檔案狀態
             self.load_file_states()
+            if self.deduplicator:
+                self.deduplicator.load()
 
             # 只搜尋 .log 檔案
-            all_files = list(self.watch_directory.glob("*.log"))
+            all_files = await self.run_io(scan_directories, self.watch_directories, list_log_files)
+            untracked = [file_path for file_path in all_files if str(file_path) not in self.file_states]
+            self.baseline_pending = {str(file_path) for file_path in untracked}
 
-            for file_path in all_files:
-                if not file_path.exists():
-                    continue
+            self.startup_stats = {
+                'files': len(all_files),
+                'untracked': len(untracked),
+                'ready_seconds': time.monotonic() - started
+            }
+            logger.info(
+                f"找到 {len(all_files)} 個 .log 檔案，其中 {len(untracked)} 個需建立基準 "
+                f"(耗時 {self.startup_stats['ready_seconds']:.3f} 秒)"
+            )
+
+            if untracked:
+                self.baseline_task = asyncio.create_task(self.build_baseline(untracked, started))
+
+        except Exception as e:
+            logger.error(f"初始化現有檔案時發生錯誤: {e}")
+
+    async def build_baseline(self, file_paths, started, chunk_size=256):
+        """背景建立現有檔案的基準狀態，分批在執行緒池中平行 stat"""
+        try:
+            chunks = [file_paths[i:i + chunk_size] for i in range(0, len(file_paths), chunk_size)]
+            results = await asyncio.gather(*(self.run_io(stat_files, chunk) for chunk in chunks))
 
-                file_key = str(file_path)
-                current_modified = file_path.stat().st_mtime
-
-                # 如果檔案不在之前記錄中，才記錄為現有檔案
-                if file_key not in self.file_states:
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as file:
-                            content = file.read().strip()
-                    except UnicodeDecodeError:
-                        try:
-                            with open(file_path, 'r', encoding='big5') as file:
-                                content = file.read().strip()
-                        except:
-                            content = ""
-
-                    # 記錄現有檔案狀態，不發送通知
-                    self.file_states[file_key] = {
-                        'modified': current_modified,
-                        'content': content,
-                        'initialized': True
-                    }
-                    logger.info(f"已記錄現有檔案: {file_path.name}")
+            recorded = 0
+            for chunk_result in results:
+                for file_path, stat in chunk_result:
+                    file_key = str(file_path)
+                    # 監控迴圈可能已先處理過這個檔案
+                    if file_key in self.baseline_pending:
+                        self.set_file_state(file_key, eof_state_from_stat(stat))
+                        self.baseline_pending.discard(file_key)
+                        recorded += 1
 
+            self.baseline_pending.clear()
             # 儲存更新後的檔案狀態
-            self.save_file_states()
+            await self.save_file_states()
 
+            self.startup_stats['baseline_seconds'] = time.monotonic() - started
+            logger.info(
+                f"已記錄 {recorded} 個現有檔案的基準 "
+                f"(耗時 {self.startup_stats['baseline_seconds']:.3f} 秒)"
+            )
         except Exception as e:
-            logger.error(f"初始化現有檔案時發生錯誤: {e}")
+            logger.error(f"建立現有檔案基準時發生錯誤: {e}")
+
+    def prepare_alerts(self, file_path, line, is_new_file, detected_at):
+        """
+        套用規則、過濾重複並決定路由，把要發送的通知記錄到 journal
+
+        這裡不會讓出事件迴圈：同一次讀取的所有通知與檔案位移會在同一次提交中寫入。
+        回傳 (chat_id, 序號, 內容, 完整訊息) 列表。
+        """
+        decision = self.rule_engine.evaluate(file_path.name, line)
+        if decision is None:
+            metrics.alerts_dropped.inc()
+            logger.debug(f"通知被規則丟棄: {file_path.name} - {line[:50]}")
+            return []
+
+        symbol = decision.fields.get('symbol') or symbol_from_file(file_path.name)
+        if self.muted and symbol in self.active_mutes():
+            metrics.alerts_muted.inc()
+            logger.debug(f"商品已靜音，不發送通知: {file_path.name} - {line[:50]}")
+            return []
+
+        if self.deduplicator and self.deduplicator.is_duplicate(file_path.name, line):
+            logger.info(f"重複的通知，不發送 (累計略過 {self.deduplicator.suppressed} 則): {file_path.name} - {line[:50]}")
+            return []
+
+        if decision.chat_ids:
+            # 規則指定了聊天室，取代檔名路由
+            chat_ids = decision.chat_ids
+            route_names = "規則指定"
+        else:
+            routes = self.router.match(file_path.name)
+            if not routes:
+                logger.debug(f"沒有符合的路由，不發送通知: {file_path.name}")
+                return []
+
+            # 同一則通知符合多條路由時，每個聊天室只送一次
+            chat_ids = []
+            for route in routes:
+                route.alerts += 1
+                metrics.route_alerts.inc(route=route.name)
+                chat_ids.extend(chat_id for chat_id in route.chat_ids if chat_id not in chat_ids)
+            route_names = ", ".join(route.name for route in routes)
+
+        # 加上時間戳記和檔案名稱
+        text = decision.text
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        label = "新檔案" if is_new_file else "檔案更新"
+        message = f"🔔 XQ 全球贏家通知 [{timestamp}]\n📁 {label}: {file_path.name}\n\n{text}"
+
+        self.recent_alerts.append({
+            'time': timestamp, 'file': file_path.name, 'text': text, 'chat_ids': [str(chat_id) for chat_id in chat_ids]
+        })
+        if self.archive:
+            value = decision.fields.get('value')
+            self.archive.add(
+                detected_at, symbol, file_path.name, chat_ids, text, value if isinstance(value, float) else None
+            )
+        photo = None
+        if self.charts and not self.batcher and self.charts.wants(file_path.name, text):
+            # 只排入繪製工作，發送端在送出前才等待結果
+            photo = self.charts.request(
+                file_path, self.rule_engine.field_parser(file_path.name), detected_at, self.sender.pending
+            )
+        logger.info(f"{label}訊息已排入發送佇列: {file_path.name} -> {route_names}")
+        return [
+            (chat_id, self.journal.append(chat_id, file_path.name, text, message, detected_at),
+             file_path.name, text, message, detected_at, photo)
+            for chat_id in chat_ids
+        ]
+
+    async def dispatch_alerts(self, alerts):
+        """將已記錄到 journal 的通知排入發送佇列（啟用合併模式時交給 batcher）"""
+        for chat_id, seq, file_name, text, message, detected_at, photo in alerts:
+            if self.batcher:
+                await self.batcher.add(chat_id, file_name, text, detected_at, seq)
+            else:
+                await self.sender.enqueue(chat_id, message, detected_at, [seq], photo)
+
+    async def maintain_archive(self):
+        """寫入新的歷史紀錄；到了 digest_time 時由索引產生當日摘要並發送"""
+        if not self.archive:
+            return
+        try:
+            self.archive.flush()
+            digest_time = self.archive_options.get("digest_time")
+            if not digest_time:
+                return
+            now = datetime.now()
+            today = now.date().isoformat()
+            if now.time() < dtime.fromisoformat(digest_time) or self.archive.get_meta("last_digest") == today:
+                return
+
+            text = format_digest(self.archive.digest(now.date()))
+            chat_ids = self.archive_options.get("digest_chat_ids") or self.router.chat_ids()
+            sent_at = time.time()
+            # 摘要也記錄到通知日誌，確保當機後仍會送出且只送一次
+            seqs = [self.journal.append(chat_id, None, text, text, sent_at) for chat_id in chat_ids]
+            await self.journal.commit()
+            self.archive.set_meta("last_digest", today)
+            self.archive.prune()
+            for chat_id, seq in zip(chat_ids, seqs):
+                await self.sender.enqueue(chat_id, text, sent_at, [seq])
+            logger.info(f"已產生每日摘要: {today}")
+        except Exception as e:
+            logger.error(f"處理歷史紀錄時發生錯誤: {e}")
+
+    def log_route_stats(self):
+        """記錄自上次以來有通知的路由，用來找出較繁忙的路由"""
+        changes = self.router.report()
+        if changes:
+            summary = ", ".join(f"{name}: +{delta} (累計 {total})" for name, (delta, total) in changes.items())
+            logger.info(f"路由通知統計: {summary}")
+
+    async def process_file(self, file_path, stat=None):
+        """檢查單一檔案，有新增內容時發送通知"""
+        file_key = str(file_path)
+        lock = self.file_locks.setdefault(file_key, asyncio.Lock())
+        async with lock:
+            await self._process_file(file_path, file_key, stat)
+
+    async def _process_file(self, file_path, file_key, stat):
+        detected_at = time.time()
+        if stat is None:
+            try:
+                stat = await self.run_io(os.stat, file_path)
+            except FileNotFoundError:
+                return
+        state = self.file_states.get(file_key)
+
+        if state is None and file_key in self.baseline_pending:
+            # 啟動時已存在但背景基準還沒處理到：直接以目前結尾為基準，不發送通知
+            self.baseline_pending.discard(file_key)
+            self.set_file_state(file_key, eof_state_from_stat(stat))
+            return
+
+        # 如果是新檔案或檔案有更新
+        is_new_file = file_changed(state, stat)
+        if is_new_file is None:
+            return
+
+        # 每次最多讀取 tail_buffer 位元組；一次新增的內容較多時分段讀取，每段各自提交位移
+        while True:
+            try:
+                # 以換行結尾的完整行立即讀取；結尾未完成的行等檔案穩定後才一併讀取
+                settled = self.settle_tracker.is_settled(file_key, stat)
+                new_lines, new_state = await self.run_io(
+                    read_appended_lines, file_path, state, include_partial=settled, tail_buffer=self.tail_buffer
+                )
+            except Exception as e:
+                logger.error(f"讀取檔案失敗: {file_path.name} - {e}")
+                return
+
+            if is_new_file and not new_lines and new_state['offset'] < stat.st_size:
+                self.schedule_settle_check(file_path)
+                return  # 新檔案仍在寫入中，下次再處理
+            if new_state != state:
+                await self.handle_changes(file_path, file_key, new_lines, new_state, is_new_file, detected_at)
+            if new_state['offset'] >= stat.st_size:
+                self.settle_tracker.clear(file_key)
+                return
+            if state is not None and new_state['offset'] == state['offset']:
+                self.schedule_settle_check(file_path)  # 只剩未完成的行，等檔案穩定後再讀取
+                return
+            state, is_new_file = new_state, False
+
+    async def handle_changes(self, file_path, file_key, new_lines, new_state, is_new_file, detected_at):
+        """處理一個檔案讀取到的新增內容：發送通知並更新狀態（由呼叫端持有檔案鎖）"""
+        if is_new_file:
+            logger.info(f"發現新檔案: {file_path.name}")
+
+        if new_lines:
+            metrics.files_changed.inc()
+            metrics.alerts_detected.inc(len(new_lines))
+            logger.info(f"檢測到 {len(new_lines)} 行新內容，準備發送: {file_path.name} - {new_lines[-1][:50]}...")
+            # 每一行新增的內容各自發送一則通知；先全部記錄到 journal 再更新位移，
+            # 兩者會在同一次提交中寫入
+            alerts = [
+                alert for line in new_lines
+                for alert in self.prepare_alerts(file_path, line, is_new_file, detected_at)
+            ]
+        else:
+            alerts = []
+            if is_new_file:
+                logger.warning(f"檔案內容為空，不發送通知: {file_path.name}")
+
+        # 更新檔案狀態
+        self.set_file_state(file_key, new_state)
+        await self.dispatch_alerts(alerts)
+
+        if is_new_file:
+            logger.info(f"已記錄檔案狀態: {file_path.name}")
+            # 立即保存新檔案狀態，確保不會重複發送
+            await self.save_file_states()
+            logger.info("狀態檔案已保存")
+
+    async def forget_deleted_files(self, file_keys):
+        """
+        停止追蹤已刪除的檔案；之後重新建立時視為新檔案
+
+        只處理所在目錄仍存在的檔案，監控目錄暫時無法存取時保留狀態。
+        """
+        deleted = await self.run_io(
+            lambda: [key for key in file_keys if not os.path.exists(key) and os.path.isdir(os.path.dirname(key))]
+        )
+        for file_key in deleted:
+            lock = self.file_locks.get(file_key)
+            if lock is not None and lock.locked():
+                continue  # 正在處理中，下次掃描再確認
+            self.file_states.pop(file_key, None)
+            self.file_locks.pop(file_key, None)
+            self.settle_tracker.clear(file_key)
+            if self.state_store:
+                self.state_store.delete(file_key)
+            metrics.files_removed.inc()
+            logger.info(f"檔案已刪除，停止追蹤: {Path(file_key).name}")
+
+    def schedule_settle_check(self, file_path):
+        """事件模式下，在穩定時間過後重新檢查尚未寫完的檔案（輪詢模式會在下次掃描處理）"""
+        if self.event_queue is not None:
+            asyncio.get_running_loop().call_later(
+                self.settle_tracker.settle_window, self.enqueue_path, str(file_path)
+            )
 
     async def check_and_send_updates(self):
         try:
-            # 只搜尋 .log 檔案
-            all_files = list(self.watch_directory.glob("*.log"))
-            logger.info(f"掃描到 {len(all_files)} 個 .log 檔案")
+            with metrics.scan_duration.time():
+                # 只搜尋 .log 檔案（目錄掃描與 stat 在執行緒池中一次完成）
+                all_files = await self.run_io(scan_directories, self.watch_directories, scan_log_files)
+                metrics.files_scanned.inc(len(all_files))
+                logger.debug(f"掃描到 {len(all_files)} 個 .log 檔案")
 
-            for file_path in all_files:
-                if not file_path.exists():
-                    continue
+                # 各檔案同時處理，避免單一檔案拖慢其他檔案的通知
+                results = await asyncio.gather(
+                    *(self.process_file(file_path, stat) for file_path, stat in all_files),
+                    return_exceptions=True
+                )
+            for (file_path, _), result in zip(all_files, results):
+                if isinstance(result, Exception):
+                    logger.error(f"處理檔案時發生錯誤: {file_path.name} - {result}")
 
-                file_key = str(file_path)
-                current_modified = file_path.stat().st_mtime
-
-                # 如果是新檔案或檔案有更新
-                if file_key not in self.file_states:
-                    logger.info(f"發現新檔案: {file_path.name}")
-                    # 新檔案 - 需要發送通知
-                    await asyncio.sleep(0.5)  # 等待檔案寫入完成
-
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as file:
-                            content = file.read().strip()
-                        logger.info(f"成功讀取檔案內容 (UTF-8): {content[:50]}...")
-                    except UnicodeDecodeError:
-                        try:
-                            with open(file_path, 'r', encoding='big5') as file:
-                                content = file.read().strip()
-                            logger.info(f"成功讀取檔案內容 (Big5): {content[:50]}...")
-                        except Exception as e:
-                            content = ""
-                            logger.error(f"讀取檔案失敗: {e}")
-
-                    if content:
-                        logger.info(f"檢測到新檔案，準備發送: {file_path.name} - {content[:50]}...")
-
-                        # 只發送最後一行內容（最新的訊息）
-                        lines = content.strip().split('\n')
-                        latest_line = lines[-1].strip() if lines else content.strip()
-
-                        # 加上時間戳記和檔案名稱
-                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        message = f"🔔 XQ 全球贏家通知 [{timestamp}]\n📁 新檔案: {file_path.name}\n\n{latest_line}"
-
-                        try:
-                            await self.telegram_bot.send_message(
-                                chat_id=self.chat_id,
-                                text=message
-                            )
-                            logger.info(f"✅ 新檔案訊息已發送到 Telegram: {file_path.name}")
-                        except Exception as e:
-                            logger.error(f"發送 Telegram 訊息失敗: {e}")
-                    else:
-                        logger.warning(f"檔案內容為空，不發送通知: {file_path.name}")
-
-                    # 記錄檔案狀態並立即保存
-                    self.file_states[file_key] = {
-                        'modified': current_modified,
-                        'content': content
-                    }
-                    logger.info(f"已記錄檔案狀態: {file_path.name}")
-                    # 立即保存新檔案狀態，確保不會重複發送
-                    self.save_file_states()
-                    logger.info("狀態檔案已保存")
-
-                elif current_modified > self.file_states[file_key]['modified']:
-                    # 現有檔案有更新 - 只有內容變更時才發送
-                    await asyncio.sleep(0.5)
-
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as file:
-                            content = file.read().strip()
-                    except UnicodeDecodeError:
-                        try:
-                            with open(file_path, 'r', encoding='big5') as file:
-                                content = file.read().strip()
-                        except:
-                            content = ""
-
-                    last_content = self.file_states[file_key].get('content', '')
-
-                    if content and content != last_content:
-                        logger.info(f"檔案內容更新，準備發送: {file_path.name} - {content[:50]}...")
-
-                        # 找出新增的內容（最新的一行）
-                        if last_content:
-                            # 分割成行
-                            old_lines = last_content.strip().split('\n')
-                            new_lines = content.strip().split('\n')
-
-                            # 找出新增的行
-                            if len(new_lines) > len(old_lines):
-                                # 取最新加入的行
-                                new_content = new_lines[-1].strip()
-                            else:
-                                # 如果行數相同，可能是最後一行有變化
-                                new_content = new_lines[-1].strip() if new_lines else content.strip()
-                        else:
-                            # 如果沒有之前的內容，取最後一行
-                            lines = content.strip().split('\n')
-                            new_content = lines[-1].strip() if lines else content.strip()
-
-                        # 加上時間戳記和檔案名稱
-                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        message = f"🔔 XQ 全球贏家通知 [{timestamp}]\n📁 檔案更新: {file_path.name}\n\n{new_content}"
-
-                        try:
-                            await self.telegram_bot.send_message(
-                                chat_id=self.chat_id,
-                                text=message
-                            )
-                            logger.info(f"✅ 檔案更新訊息已發送到 Telegram: {file_path.name}")
-                        except Exception as e:
-                            logger.error(f"發送檔案更新訊息失敗: {e}")
-
-                    # 更新檔案狀態
-                    self.file_states[file_key] = {
-                        'modified': current_modified,
-                        'content': content
-                    }
+            # 監控目錄中已消失的檔案
+            seen = {str(file_path) for file_path, _ in all_files}
+            directories = {str(directory) for directory in self.watch_directories}
+            missing = [
+                key for key in self.file_states
+                if key not in seen and key not in self.baseline_pending and os.path.dirname(key) in directories
+            ]
+            if missing:
+                await self.forget_deleted_files(missing)
 
         except Exception as e:
             logger.error(f"檢查檔案更新時發生錯誤: {e}")
 
-    async def start_monitoring(self):
-        """開始監控目錄"""
-        self.running = True
-        logger.info(f"開始監控目錄: {self.watch_directory}")
+    def enqueue_path(self, path):
+        """將檔案事件排入佇列，同一檔案尚未處理前的重複事件會被合併"""
+        if path in self.pending_paths:
+            return
+        self.pending_paths.add(path)
+        self.event_queue.put_nowait(path)
 
-        # 首先初始化現有檔案（不發送通知）
-        await self.initialize_existing_files()
-        logger.info("現有檔案初始化完成，開始監控新增檔案...")
+    def start_observer(self):
+        """啟動 watchdog 觀察者，無法啟動時回傳 False"""
+        if Observer is None:
+            logger.warning("未安裝 watchdog，改用輪詢模式")
+            return False
 
-        save_counter = 0
         try:
-            while self.running:
+            self.event_queue = asyncio.Queue()
+            self.event_handler = LogEventHandler(asyncio.get_running_loop(), self.enqueue_path)
+            self.observer = Observer()
+            for directory in self.watch_directories:
+                self.watches[directory] = self.observer.schedule(self.event_handler, str(directory), recursive=False)
+            self.observer.start()
+            logger.info("已啟動 watchdog 事件監控")
+            return True
+        except Exception as e:
+            logger.error(f"啟動 watchdog 失敗，改用輪詢模式: {e}")
+            self.observer = None
+            return False
+
+    def stop_observer(self):
+        """停止 watchdog 觀察者"""
+        if self.observer:
+            self.observer.stop()
+            self.observer.join(timeout=5)
+            self.observer = None
+            self.watches = {}
+
+    def update_session(self):
+        """更新交易時段狀態，剛進入交易時段時回傳 True（需要補上休眠期間的內容）"""
+        if self.schedule is None:
+            return False
+        woke = self.schedule.update()
+        if woke:
+            metrics.session_wakeups.inc()
+        return woke
+
+    def in_session(self):
+        return self.schedule is None or bool(self.schedule.active)
+
+    def should_scan(self):
+        """目前是否要讀取檔案（暫停中或交易時段外暫停掃描時為 False）"""
+        return not self.paused and (self.schedule is None or self.schedule.scanning())
+
+    def scan_interval(self, default):
+        """目前的掃描間隔：未啟用排程時為 default，否則依是否在交易時段內決定"""
+        if self.schedule is None:
+            return default
+        return self.schedule.session_interval if self.schedule.active else self.schedule.idle_interval
+
+    async def wait_next_scan(self, default):
+        """等到下次掃描；交易時段外會在下一個時段開始時醒來，停止或恢復時立即返回"""
+        timeout = default if self.schedule is None else self.schedule.interval()
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.wakeup.clear()
+
+    def log_stats(self):
+        """每隔 log_interval 秒在日誌中寫入一行指標摘要"""
+        interval = self.metrics_options.get("log_interval", 60)
+        now = time.monotonic()
+        if interval and now - self.last_stats_log >= interval:
+            logger.info(f"統計: {metrics.stats_line()}")
+            self.last_stats_log = now
+
+    async def run_polling_loop(self):
+        """
+        輪詢模式：每秒掃描一次目錄
+
+        啟用交易時段排程時，時段內每 session_interval 秒掃描，時段外每 idle_interval 秒
+        （或暫停掃描）；檔案位移不變，進入時段後的第一次掃描會補上時段外寫入的內容。
+        """
+        last_save = time.monotonic()
+        while self.running:
+            try:
+                self.update_session()
+                if self.should_scan():
+                    await self.check_and_send_updates()
+                await self.maintain_archive()
+                self.log_stats()
+
+                # 每30秒保存一次狀態檔案
+                now = time.monotonic()
+                if now - last_save >= 30:
+                    await self.save_file_states()
+                    self.log_route_stats()
+                    last_save = now
+
+            except Exception as e:
+                logger.error(f"監控循環中發生錯誤: {e}")
+                await asyncio.sleep(5)  # 發生錯誤時等待5秒再繼續
+                continue
+
+            await self.wait_next_scan(1)  # 預設每秒檢查一次
+
+    async def run_event_loop(self):
+        """
+        事件模式：處理 watchdog 事件，並定期完整掃描以補上漏掉的事件
+
+        啟用交易時段排程時，時段外略過事件，改為每 idle_interval 秒完整掃描一次
+        （或暫停掃描），進入時段時立即完整掃描一次。
+        """
+        last_reconcile = time.monotonic()
+        last_save = time.monotonic()
+        while self.running:
+            try:
                 try:
+                    # 最多等待1秒，讓停止旗標能及時生效
+                    path = await asyncio.wait_for(self.event_queue.get(), timeout=1)
+                except asyncio.TimeoutError:
+                    path = None
+
+                if path is not None:
+                    self.pending_paths.discard(path)
+                woke = self.update_session()
+
+                # 暫停中或交易時段外略過事件，恢復或進入交易時段時會完整掃描一次
+                if path is not None and not self.paused and self.in_session():
+                    # 每個事件各自成為一個工作，不必等待前一個檔案發送完畢
+                    task = asyncio.create_task(self.process_file(Path(path)))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+
+                await self.maintain_archive()
+                self.log_stats()
+                now = time.monotonic()
+                reconcile_interval = self.reconcile_interval if self.in_session() else self.schedule.idle_interval
+                if self.should_scan() and (woke or now - last_reconcile >= reconcile_interval):
                     await self.check_and_send_updates()
-                    save_counter += 1
+                    last_reconcile = now
+
+                if now - last_save >= 30:
+                    await self.save_file_states()
+                    self.log_route_stats()
+                    last_save = now
+
+            except Exception as e:
+                logger.error(f"監控循環中發生錯誤: {e}")
+                await asyncio.sleep(5)  # 發生錯誤時等待5秒再繼續
 
-                    # 每30次循環保存一次狀態檔案（約30秒）
-                    if save_counter >= 30:
-                        self.save_file_states()
-                        save_counter = 0
+    async def run_shard_loop(self):
+        """分片模式：由工作行程掃描檔案，這裡監督工作行程並執行定期工作"""
+        if self.baseline_task:
+            # 工作行程依主行程的狀態接手檔案，先等基準建立完成
+            await asyncio.gather(self.baseline_task, return_exceptions=True)
+        self.shards = ShardCoordinator(self, **self.shard_options)
+        last_save = time.monotonic()
+        try:
+            await self.shards.start()
+            while self.running:
+                try:
+                    await asyncio.sleep(1)
+                    self.update_session()
+                    self.shards.supervise()
+                    await self.maintain_archive()
+                    self.log_stats()
+
+                    now = time.monotonic()
+                    if now - last_save >= 30:
+                        await self.save_file_states()
+                        self.log_route_stats()
+                        self.shards.log_summary()
+                        last_save = now
 
                 except Exception as e:
                     logger.error(f"監控循環中發生錯誤: {e}")
                     await asyncio.sleep(5)  # 發生錯誤時等待5秒再繼續
-                    continue
+        finally:
+            await self.shards.stop()
+            self.shards = None
+
+    async def apply_config(self, config):
+        """
+        套用重新載入的設定（路由、規則、速率限制、合併、重複過濾、排程與監控目錄）
+
+        可能失敗的步驟（建立路由、規則、排程、重複過濾與合併的新物件，以及建立新增的
+        監控目錄並記錄現有檔案）全部完成後才替換設定，任何一步失敗時維持目前的設定；
+        處理中的通知不會看到一半的設定，檔案狀態、發送佇列與尚未送出的訊息都保留。
+        """
+        router = settings.build_router(config)
+        rule_engine = settings.build_rule_engine(config)
+        schedule = build_schedule(config["schedule"])
+        deduplicator = self.build_deduplicator(config["dedup"])
+        batcher = self.build_batcher(config["batching"])
+        directories = [Path(directory) for directory in settings.watch_directories(config)]
+        added_files = await self.prepare_watch_directories(directories)
+
+        # 以下不會失敗
+        self.chat_id = config["telegram_chat_id"]
+        self.router = router
+        self.rule_engine = rule_engine
+        self.reconcile_interval = config["reconcile_interval"]
+        self.settle_tracker.settle_window = config["settle_window"]
+        self.tail_buffer = config["tail_buffer"]
+        self.sender_options = config["sender"]
+        if self.sender:
+            self.sender.set_limits(**self.sender_options)
+        self.metrics_options = config["metrics"]
+        self.archive_options = config["archive"]
+        if self.commands:
+            self.commands.allowed_chat_ids = {str(chat_id) for chat_id in config["commands"]["allowed_chat_ids"]}
+        self.set_schedule(schedule)
+        self.apply_deduplicator(deduplicator)
+        await self.apply_batcher(config["batching"], batcher)
+        self.set_watch_directories(directories, added_files)
+
+    def set_schedule(self, schedule):
+        """換上 build_schedule 建立的交易時段排程，監控迴圈立即依新的排程重新計算等待時間"""
+        self.schedule = schedule
+        self.wakeup.set()
+
+    def build_deduplicator(self, dedup_options):
+        """依設定建立重複通知過濾器（尚未載入紀錄），未啟用時回傳 None"""
+        dedup_options = dict(dedup_options)
+        if not dedup_options.pop("enabled", True):
+            return None
+        return AlertDeduplicator(self.watch_directory / ".xq_dedup.json", **dedup_options)
+
+    def apply_deduplicator(self, deduplicator):
+        """套用 build_deduplicator 的結果；已啟用時只更新設定，key 不變時保留已記錄的通知"""
+        if deduplicator is None:
+            if self.deduplicator:
+                self.deduplicator.save()
+            self.deduplicator = None
+        elif self.deduplicator is None:
+            deduplicator.load()
+            self.deduplicator = deduplicator
+        else:
+            if deduplicator.key != self.deduplicator.key:
+                self.deduplicator.entries.clear()
+            self.deduplicator.key = deduplicator.key
+            self.deduplicator.configure(deduplicator.ttl, deduplicator.max_entries)
+
+    def build_batcher(self, batching_options):
+        """依設定建立合併器，未啟用（或發送佇列尚未啟動）時回傳 None"""
+        batching = dict(batching_options)
+        if not batching.pop("enabled", False) or self.sender is None:
+            return None
+        return AlertBatcher(self.sender, **batching)
+
+    async def apply_batcher(self, batching_options, batcher):
+        """套用 build_batcher 的結果；停用時先送出累積中的通知，已啟用時只更新設定"""
+        self.batching_options = batching_options
+        if batcher is None:
+            if self.batcher:
+                old_batcher, self.batcher = self.batcher, None
+                await old_batcher.stop()
+        elif self.batcher is None:
+            self.batcher = batcher
+        else:
+            for name in ("window", "max_lines", "max_chars", "max_latency"):
+                setattr(self.batcher, name, getattr(batcher, name))
+
+    async def prepare_watch_directories(self, directories):
+        """
+        建立新增的監控目錄並取得其中現有的檔案（尚未開始監控）
+
+        回傳 {目錄: [(檔案, stat), ...]}，交給 set_watch_directories 記錄為基準。
+        """
+        added_files = {}
+        for directory in directories:
+            if directory not in self.watch_directories:
+                os.makedirs(directory, exist_ok=True)
+                file_paths = await self.run_io(list_log_files, directory)
+                added_files[directory] = await self.run_io(stat_files, file_paths)
+        return added_files
+
+    def set_watch_directories(self, directories, added_files):
+        """
+        變更監控目錄
+
+        新增的目錄先把 prepare_watch_directories 取得的現有檔案記錄為基準再開始監控，
+        不會推播既有內容；移除的目錄停止監控並清除其檔案狀態。狀態與待送訊息仍存放在
+        原本的第一個目錄。
+        """
+        removed = [directory for directory in self.watch_directories if directory not in directories]
 
-                await asyncio.sleep(1)  # 每秒檢查一次
+        for directory, files in added_files.items():
+            for file_path, stat in files:
+                if str(file_path) not in self.file_states:
+                    self.set_file_state(str(file_path), eof_state_from_stat(stat))
+            if self.observer:
+                try:
+                    self.watches[directory] = self.observer.schedule(
+                        self.event_handler, str(directory), recursive=False
+                    )
+                except Exception as e:
+                    logger.error(f"無法監看新目錄的事件，改由定期完整掃描偵測: {directory} - {e}")
+            logger.info(f"新增監控目錄: {os.path.abspath(directory)} ({len(files)} 個現有檔案)")
+
+        for directory in removed:
+            watch = self.watches.pop(directory, None)
+            if watch is not None:
+                self.observer.unschedule(watch)
+            for file_key in [key for key in self.file_states if Path(key).parent == directory]:
+                del self.file_states[file_key]
+                if self.state_store:
+                    self.state_store.delete(file_key)
+            logger.info(f"停止監控目錄: {os.path.abspath(directory)}")
+
+        if added_files or removed:
+            self.watch_directories = directories
+            if self.shards:
+                self.shards.rebalance()
+
+    async def start_monitoring(self):
+        """開始監控目錄"""
+        self.running = True
+        self.started_at = time.time()
+        logger.info(f"開始監控目錄: {', '.join(map(str, self.watch_directories))} (模式: {self.watch_mode})")
+
+        # 通知日誌與檔案狀態放在同一個資料庫，才能在同一個交易中提交
+        self.state_store = FileStateStore(self.watch_directory / ".xq_file_states.db")
+        self.journal = AlertJournal(self.state_store, **self.journal_options)
+        self.journal.start()
+        if self.archive_options.get("enabled", True):
+            self.archive = AlertArchive(
+                self.watch_directory / ".xq_archive.db", self.archive_options.get("retention_days", 365)
+            )
+
+        charts = dict(self.charts_options)
+        photo_timeout = charts.pop("timeout", 5.0)
+        if charts.pop("enabled", False):
+            self.charts = ChartRenderer(**charts)
+
+        # 啟動發送佇列（會先補送上次未送達的訊息）
+        self.sender = TelegramSender(
+            self.telegram_bot, self.journal, photo_timeout=photo_timeout, **self.sender_options
+        )
+        await self.sender.start()
+        if self.metrics_options.get("port"):
+            self.metrics_server = metrics.MetricsServer(
+                self.metrics_options.get("host", "127.0.0.1"), self.metrics_options["port"]
+            )
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logger.error(f"無法啟動指標端點: {e}")
+                self.metrics_server = None
+        if self.service_options.get("control_port"):
+            self.control_server = ControlServer(
+                self, self.service_options.get("control_host", "127.0.0.1"), self.service_options["control_port"]
+            )
+            try:
+                await self.control_server.start()
+            except OSError as e:
+                logger.error(f"無法啟動控制通道: {e}")
+                self.control_server = None
+        batching = dict(self.batching_options)
+        if batching.pop("enabled", False):
+            self.batcher = AlertBatcher(self.sender, **batching)
+        if self.commands_options.get("enabled", False):
+            self.commands = BotCommands(
+                self, self.update_source or TelegramUpdateSource(self.telegram_bot),
+                self.commands_options.get("allowed_chat_ids", ()), self.commands_options.get("poll_timeout", 30)
+            )
+            self.commands.start()
+            logger.info("已啟用 Bot 指令")
+
+        # 首先初始化現有檔案（不發送通知）
+        await self.initialize_existing_files()
+        logger.info("現有檔案初始化完成，開始監控新增檔案...")
+
+        try:
+            if self.shard_options.get("workers", 0) > 1:
+                await self.run_shard_loop()
+            elif self.watch_mode == "watchdog" and self.start_observer():
+                # 啟動後先掃描一次，補上初始化與觀察者啟動之間的變更
+                await self.check_and_send_updates()
+                await self.run_event_loop()
+            else:
+                await self.run_polling_loop()
 
         finally:
+            self.stop_observer()
+            if self.commands:
+                await self.commands.stop()
+                self.commands = None
+            if self.baseline_task:
+                await asyncio.gather(self.baseline_task, return_exceptions=True)
+            if self.tasks:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+            if self.batcher:
+                await self.batcher.stop()
+            await self.sender.stop()
+            if self.charts:
+                self.charts.close()
+                self.charts = None
+            await self.journal.stop()
+            self.journal = None
+            if self.metrics_server:
+                await self.metrics_server.stop()
+            if self.control_server:
+                await self.control_server.stop()
             # 程式結束時保存狀態
-            self.save_file_states()
+            await self.save_file_states()
+            if self.archive:
+                self.archive.close()
+                self.archive = None
+            if self.state_store:
+                self.state_store.close()
+                self.state_store = None
+            self.executor.shutdown(wait=False)
+            self.log_route_stats()
             logger.info("監控已停止，狀態已保存")
 
+    def status(self):
+        """目前的執行狀態，供控制通道與 Bot 指令查詢"""
+        queue_depth = metrics.metrics.metrics.get("xq_send_queue_depth")
+        return {
+            'running': self.running,
+            'paused': self.paused,
+            'watch_mode': "shards" if self.shards else "watchdog" if self.observer else "polling",
+            'directories': [str(directory) for directory in self.watch_directories],
+            'tracked_files': len(self.file_states),
+            'uptime': time.time() - self.started_at if self.started_at else 0,
+            'alerts': metrics.alerts_detected.total(),
+            'sent': metrics.telegram_sent.total(),
+            'errors': metrics.telegram_errors.total(),
+            'queue_depth': queue_depth.value() if queue_depth else 0,
+            'muted': sorted(self.active_mutes()),
+            'shards': self.shards.status() if self.shards else [],
+            'in_session': self.in_session(),
+            'next_open': self.next_open()
+        }
+
+    def next_open(self):
+        """交易時段外時下一個時段開始的時間（ISO 格式），否則為 None"""
+        if self.schedule is None or self.schedule.active is not False:
+            return None
+        opening = self.schedule.calendar.next_open(datetime.now())
+        return opening.isoformat(timespec="minutes") if opening else None
+
+    def mute(self, symbol, minutes):
+        """暫時不推播指定商品的通知；minutes 為 0 時取消靜音"""
+        if minutes > 0:
+            self.muted[symbol] = time.time() + minutes * 60
+            logger.info(f"商品 {symbol} 靜音 {minutes} 分鐘")
+        elif self.muted.pop(symbol, None) is not None:
+            logger.info(f"商品 {symbol} 取消靜音")
+
+    def active_mutes(self):
+        """回傳 {商品代號: 到期時間}，並移除已到期的靜音"""
+        now = time.time()
+        for symbol in [symbol for symbol, until in self.muted.items() if until <= now]:
+            del self.muted[symbol]
+        return self.muted
+
+    def pause(self):
+        """暫停讀取檔案；已排入佇列的訊息仍會送出"""
+        if not self.paused:
+            self.paused = True
+            logger.info("監控已暫停")
+
+    def resume(self):
+        """恢復監控，暫停期間寫入的內容會在下次掃描時送出"""
+        if self.paused:
+            self.paused = False
+            logger.info("監控已恢復")
+            self.wakeup.set()
+            if self.event_queue is not None:
+                # 事件模式下暫停期間的事件已略過，立即完整掃描一次
+                task = asyncio.create_task(self.check_and_send_updates())
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
     def stop_monitoring(self):
         """停止監控"""
         self.running = False
+        self.wakeup.set()
 
 class XQTelegramNotifier:
-    def __init__(self, bot_token, chat_id, watch_directory="./local"):
+    def __init__(self, bot_token, chat_id, watch_directory="./local", watch_mode="polling", reconcile_interval=30,
+                 settle_window=0.5, sender_options=None, batching_options=None, io_workers=4, routes=None,
+                 dedup_options=None, metrics_options=None, parsers=None, rules=None, service_options=None,
+                 journal_options=None, archive_options=None, tail_buffer=DEFAULT_TAIL_BUFFER,
+                 commands_options=None, http_options=None, charts_options=None, shard_options=None,
+                 schedule_options=None, config_file=None, config=None):
         self.bot_token = bot_token
         self.chat_id = chat_id
         self.watch_directory = watch_directory
-        self.bot = Bot(token=bot_token)
+        self.watch_mode = watch_mode
+        self.reconcile_interval = reconcile_interval
+        self.settle_window = settle_window
+        self.sender_options = sender_options
+        self.batching_options = batching_options
+        self.io_workers = io_workers
+        self.router = Router.from_config(routes, chat_id)
+        self.rule_engine = RuleEngine.from_config(parsers, rules)
+        self.dedup_options = dedup_options
+        self.metrics_options = metrics_options
+        self.service_options = service_options
+        self.journal_options = journal_options
+        self.archive_options = archive_options
+        self.tail_buffer = tail_buffer
+        self.commands_options = commands_options
+        self.charts_options = charts_options
+        self.shard_options = shard_options
+        self.schedule_options = schedule_options
+        self.bot = build_bot(bot_token, http_options)
         self.monitor = None
+        # 提供設定檔時，檔案變更後自動重新載入
+        self.config_watcher = settings.ConfigWatcher(config_file, config, self.apply_config) if config_file else None
 
         # 確保監控目錄存在
-        os.makedirs(watch_directory, exist_ok=True)
-        logger.info(f"監控目錄: {os.path.abspath(watch_directory)}")
+        directories = watch_directory if isinstance(watch_directory, (list, tuple)) else [watch_directory]
+        for directory in directories:
+            os.makedirs(directory, exist_ok=True)
+            logger.info(f"監控目錄: {os.path.abspath(directory)}")
 
     async def start_monitoring(self):
         """啟動檔案監控"""
         try:
-            # 測試 Telegram Bot 連接
+            # 建立連線池並測試 Telegram Bot 連接
+            await self.bot.initialize()
             bot_info = await self.bot.get_me()
             logger.info(f"Telegram Bot 已連接: {bot_info.first_name}")
 
             # 設定目錄監控
-            self.monitor = XQDirectoryMonitor(self.bot, self.chat_id, self.watch_directory)
-
-            # 發送啟動通知
-            await self.bot.send_message(
-                chat_id=self.chat_id,
-                text="✅ XQ Telegram 通知服務已啟動\n正在監控目錄中的 .log 檔案...\n\n註：現有檔案不會推播，只推播新增的檔案"
+            self.monitor = XQDirectoryMonitor(
+                self.bot, self.chat_id, self.watch_directory,
+                watch_mode=self.watch_mode,
+                reconcile_interval=self.reconcile_interval,
+                settle_window=self.settle_window,
+                sender_options=self.sender_options,
+                batching_options=self.batching_options,
+                io_workers=self.io_workers,
+                router=self.router,
+                dedup_options=self.dedup_options,
+                metrics_options=self.metrics_options,
+                rule_engine=self.rule_engine,
+                service_options=self.service_options,
+                journal_options=self.journal_options,
+                archive_options=self.archive_options,
+                tail_buffer=self.tail_buffer,
+                commands_options=self.commands_options,
+                charts_options=self.charts_options,
+                shard_options=self.shard_options,
+                schedule_options=self.schedule_options
             )
 
-            # 啟動監控
-            await self.monitor.start_monitoring()
+            # 發送啟動通知到所有路由的聊天室
+            for chat_id in self.router.chat_ids():
+                await self.bot.send_message(
+                    chat_id=chat_id,
+                    text="✅ XQ Telegram 通知服務已啟動\n正在監控目錄中的 .log 檔案...\n\n註：現有檔案不會推播，只推播新增的檔案"
+                )
+
+            # 啟動監控（同時監看設定檔）
+            watcher_task = asyncio.create_task(self.config_watcher.run()) if self.config_watcher else None
+            try:
+                await self.monitor.start_monitoring()
+            finally:
+                if watcher_task:
+                    watcher_task.cancel()
+                    await asyncio.gather(watcher_task, return_exceptions=True)
 
         except KeyboardInterrupt:
             logger.info("收到中斷信號，正在關閉...")
@@ -288,6 +1255,52 @@ class XQTelegramNotifier:
         except Exception as e:
             logger.error(f"啟動監控時發生錯誤: {e}")
             raise
+        finally:
+            # 監控停止後（發送佇列已清空）關閉連線池
+            await self.bot.shutdown()
+
+    async def apply_config(self, config):
+        """套用重新載入的設定檔"""
+        if self.monitor:
+            await self.monitor.apply_config(config)
+        self.chat_id = config["telegram_chat_id"]
+        self.router = self.monitor.router if self.monitor else settings.build_router(config)
+
+def build_bot(bot_token, http_options=None):
+    """
+    建立使用持久連線池的 Bot
+
+    發送訊息共用一個可設定大小與逾時的 keep-alive 連線池；getUpdates 長輪詢使用
+    另一個連線，不會佔用發送的連線。http_version 設為 "2" 需要安裝 httpx[http2]，
+    未安裝時改用 HTTP/1.1。
+    """
+    options = dict(settings.DEFAULT_CONFIG["http"], **(http_options or {}))
+    timeouts = {
+        key: options[key] for key in ("connect_timeout", "read_timeout", "write_timeout", "pool_timeout")
+    }
+    try:
+        request = HTTPXRequest(
+            connection_pool_size=options["pool_size"], http_version=options["http_version"], **timeouts
+        )
+    except RuntimeError as e:
+        logger.warning(f"無法使用 HTTP/2，改用 HTTP/1.1: {e}")
+        request = HTTPXRequest(connection_pool_size=options["pool_size"], http_version="1.1", **timeouts)
+    # 長輪詢的讀取逾時由每次請求指定
+    get_updates_request = HTTPXRequest(connection_pool_size=1, **timeouts)
+    return Bot(token=bot_token, request=request, get_updates_request=get_updates_request)
+
+def setup_log_file(service_options):
+    """將日誌另外寫入會自動輪替的檔案（背景執行時不依賴主控台輸出）"""
+    log_file = service_options.get("log_file")
+    if not log_file:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=service_options.get("log_max_bytes", 5 * 1024 * 1024),
+        backupCount=service_options.get("log_backups", 5), encoding='utf-8'
+    )
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logging.getLogger().addHandler(handler)
 
 async def main():
     # 讀取設定檔
@@ -295,36 +1308,45 @@ async def main():
 
     if not os.path.exists(config_file):
         # 建立範例設定檔
-        config = {
-            "telegram_bot_token": "YOUR_BOT_TOKEN_HERE",
-            "telegram_chat_id": "YOUR_CHAT_ID_HERE",
-            "watch_directory": "./local"
-        }
-
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-
+        settings.write_default_config(config_file)
         logger.error(f"請先設定 {config_file} 檔案中的 Telegram Bot Token 和 Chat ID")
         return
 
-    # 載入設定
-    with open(config_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
-
-    bot_token = config.get("telegram_bot_token")
-    chat_id = config.get("telegram_chat_id")
-    watch_directory = config.get("watch_directory", "./local")
-
-    if not bot_token or bot_token == "YOUR_BOT_TOKEN_HERE":
-        logger.error("請在 config.json 中設定有效的 Telegram Bot Token")
+    # 載入並驗證設定
+    try:
+        config = settings.load_config(config_file)
+    except ValueError as e:
+        logger.error(f"config.json 設定錯誤: {e}")
         return
 
-    if not chat_id or chat_id == "YOUR_CHAT_ID_HERE":
-        logger.error("請在 config.json 中設定有效的 Telegram Chat ID")
-        return
+    setup_log_file(config["service"])
 
     # 啟動通知服務
-    notifier = XQTelegramNotifier(bot_token, chat_id, watch_directory)
+    notifier = XQTelegramNotifier(
+        config["telegram_bot_token"], config["telegram_chat_id"], settings.watch_directories(config),
+        watch_mode=config["watch_mode"],
+        reconcile_interval=config["reconcile_interval"],
+        settle_window=config["settle_window"],
+        sender_options=config["sender"],
+        batching_options=config["batching"],
+        io_workers=config["io_workers"],
+        routes=config.get("routes"),
+        dedup_options=config["dedup"],
+        metrics_options=config["metrics"],
+        parsers=config.get("parsers"),
+        rules=config.get("rules"),
+        service_options=config["service"],
+        journal_options=config["journal"],
+        archive_options=config["archive"],
+        tail_buffer=config["tail_buffer"],
+        commands_options=config["commands"],
+        http_options=config["http"],
+        charts_options=config["charts"],
+        shard_options=config["shards"],
+        schedule_options=config["schedule"],
+        config_file=config_file,
+        config=config
+    )
     await notifier.start_monitoring()
 
 if __name__ == "__main__":
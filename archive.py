@@ -0,0 +1,275 @@
+"""
+通知歷史紀錄
+
+每則送出的通知都會寫入 SQLite 資料庫（.xq_archive.db），依商品代號、來源檔案與
+時間建立索引；可用命令列查詢，或由索引產生每日摘要，不需要重新掃描 .log 檔案。
+
+範例：
+    python archive.py query --symbol 2330.TW --since week
+    python archive.py query --file "*.TW.log" --since 2024-05-01 --until 2024-05-03
+    python archive.py digest --date 2024-05-02
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+RELATIVE = re.compile(r'^(\d+)([dh])$')
+
+class AlertArchive:
+    """
+    通知歷史資料庫
+
+    新增的紀錄先累積在記憶體，flush 時以單一交易寫入；查詢使用
+    (symbol, ts)、(file_name, ts) 與 (ts) 索引。
+    """
+
+    def __init__(self, db_path, retention_days=365):
+        self.db_path = Path(db_path)
+        self.retention_days = retention_days
+        self.pending = []
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS alerts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL, symbol TEXT, file_name TEXT, "
+            "chat_ids TEXT, text TEXT, value REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS alerts_symbol_ts ON alerts (symbol, ts)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS alerts_file_ts ON alerts (file_name, ts)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS alerts_ts ON alerts (ts)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def add(self, ts, symbol, file_name, chat_ids, text, value=None):
+        """記錄一則排入發送的通知（下次 flush 時寫入）"""
+        self.pending.append((ts, symbol, file_name, ",".join(map(str, chat_ids)), text, value))
+
+    def flush(self):
+        """寫入累積的紀錄，回傳筆數"""
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, []
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO alerts (ts, symbol, file_name, chat_ids, text, value) VALUES (?, ?, ?, ?, ?, ?)",
+                pending
+            )
+        return len(pending)
+
+    def prune(self):
+        """刪除超過保留天數的紀錄"""
+        if not self.retention_days:
+            return 0
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM alerts WHERE ts < ?", (time.time() - self.retention_days * 86400,)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+
+    def query(self, symbol=None, file_pattern=None, since=None, until=None, match=None, chat_id=None, limit=100):
+        """
+        查詢通知紀錄，回傳 (ts, symbol, file_name, text) 列表（依時間排序）
+
+        file_pattern 可使用萬用字元；match 為內容的正規表示式，在索引篩選後套用；
+        chat_id 只列出送到該聊天室的通知。
+        """
+        conditions, params = [], []
+        if symbol:
+            conditions.append("symbol = ?")
+            params.append(symbol)
+        if file_pattern and any(char in file_pattern for char in "*?["):
+            conditions.append("file_name GLOB ?")
+            params.append(file_pattern)
+        elif file_pattern:
+            conditions.append("file_name = ?")
+            params.append(file_pattern)
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("ts < ?")
+            params.append(until)
+        if chat_id is not None:
+            # chat_ids 以逗號分隔，前後補上逗號才不會把 100 比對到 1001
+            conditions.append("instr(',' || chat_ids || ',', ?) > 0")
+            params.append(f",{chat_id},")
+
+        sql = "SELECT ts, symbol, file_name, text FROM alerts"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY ts DESC"
+        if not match:
+            sql += f" LIMIT {int(limit)}"
+        rows = self.conn.execute(sql, params)
+
+        if match:
+            regex = re.compile(match)
+            results = []
+            for row in rows:
+                if regex.search(row[3]):
+                    results.append(row)
+                    if len(results) >= limit:
+                        break
+            rows = results
+        return list(reversed(list(rows)))
+
+    def digest(self, day):
+        """
+        由索引統計某一天（date 物件）的通知摘要
+
+        回傳 {'day', 'total', 'symbols', 'top', 'hours', 'first', 'last'}。
+        """
+        start = datetime.combine(day, datetime.min.time()).timestamp()
+        end = start + 86400
+        total, symbols, first, last = self.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT symbol), MIN(ts), MAX(ts) FROM alerts WHERE ts >= ? AND ts < ?",
+            (start, end)
+        ).fetchone()
+        top = self.conn.execute(
+            "SELECT symbol, COUNT(*) AS n FROM alerts WHERE ts >= ? AND ts < ? "
+            "GROUP BY symbol ORDER BY n DESC, symbol LIMIT 10",
+            (start, end)
+        ).fetchall()
+        hours = self.conn.execute(
+            "SELECT CAST(strftime('%H', ts, 'unixepoch', 'localtime') AS INTEGER) AS hour, COUNT(*) "
+            "FROM alerts WHERE ts >= ? AND ts < ? GROUP BY hour ORDER BY hour",
+            (start, end)
+        ).fetchall()
+        return {
+            'day': day, 'total': total, 'symbols': symbols, 'top': top,
+            'hours': hours, 'first': first, 'last': last
+        }
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+def format_digest(summary):
+    """將 digest() 的結果排成一則 Telegram 訊息"""
+    day = summary['day'].isoformat()
+    if not summary['total']:
+        return f"📊 XQ 每日通知摘要 {day}\n\n今日沒有通知"
+
+    lines = [
+        f"📊 XQ 每日通知摘要 {day}",
+        f"共 {summary['total']} 則通知，{summary['symbols']} 檔商品",
+        f"時間: {datetime.fromtimestamp(summary['first']):%H:%M:%S} ~ {datetime.fromtimestamp(summary['last']):%H:%M:%S}",
+        "",
+        "最多通知的商品:"
+    ]
+    lines.extend(f"  {symbol}: {count} 則" for symbol, count in summary['top'])
+    lines.append("")
+    lines.append("各時段:")
+    lines.extend(f"  {hour:02d} 時: {count} 則" for hour, count in summary['hours'])
+    return "\n".join(lines)
+
+def format_rows(rows):
+    return "\n".join(
+        f"{datetime.fromtimestamp(ts):%Y-%m-%d %H:%M:%S}  {symbol:<12} {text}" for ts, symbol, file_name, text in rows
+    )
+
+def parse_time(value, now=None, end=False):
+    """
+    解析查詢時間：today、yesterday、week（本週一）、month、7d、12h 或 YYYY-MM-DD[ HH:MM]
+
+    日期格式在 end 為 True 時表示「該日結束」。回傳 timestamp。
+    """
+    now = now or datetime.now()
+    today = datetime.combine(now.date(), datetime.min.time())
+    if value == 'today':
+        return today.timestamp()
+    if value == 'yesterday':
+        return (today - timedelta(days=1)).timestamp()
+    if value == 'week':
+        return (today - timedelta(days=today.weekday())).timestamp()
+    if value == 'month':
+        return today.replace(day=1).timestamp()
+
+    relative = RELATIVE.match(value)
+    if relative:
+        amount = int(relative.group(1))
+        delta = timedelta(days=amount) if relative.group(2) == 'd' else timedelta(hours=amount)
+        return (now - delta).timestamp()
+
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"無法解析時間: {value}")
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.timestamp()
+
+def default_db_path(config_file="config.json"):
+    """由設定檔的第一個監控目錄推算資料庫位置"""
+    import settings
+
+    config = dict(settings.DEFAULT_CONFIG)
+    if os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    return Path(settings.watch_directories(config)[0]) / ".xq_archive.db"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查詢 XQ 通知歷史紀錄")
+    parser.add_argument("--db", help="資料庫路徑（預設為第一個監控目錄下的 .xq_archive.db）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="查詢通知")
+    query.add_argument("--symbol", help="商品代號，例如 2330.TW")
+    query.add_argument("--file", help="來源檔名，可使用萬用字元")
+    query.add_argument("--since", default="today", help="開始時間 (today, week, 7d, 2024-05-01 ...)")
+    query.add_argument("--until", help="結束時間")
+    query.add_argument("--match", help="內容的正規表示式")
+    query.add_argument("--chat", help="只列出送到這個聊天室的通知")
+    query.add_argument("--limit", type=int, default=100)
+
+    digest = commands.add_parser("digest", help="每日摘要")
+    digest.add_argument("--date", help="日期 YYYY-MM-DD（預設今天）")
+
+    args = parser.parse_args(argv)
+    db_path = Path(args.db) if args.db else default_db_path()
+    if not db_path.exists():
+        parser.error(f"找不到歷史資料庫: {db_path}")
+    archive = AlertArchive(db_path)
+
+    try:
+        if args.command == "query":
+            started = time.perf_counter()
+            rows = archive.query(
+                symbol=args.symbol, file_pattern=args.file,
+                since=parse_time(args.since), until=parse_time(args.until, end=True) if args.until else None,
+                match=args.match, chat_id=args.chat, limit=args.limit
+            )
+            elapsed = (time.perf_counter() - started) * 1000
+            if rows:
+                print(format_rows(rows))
+            print(f"共 {len(rows)} 筆 ({elapsed:.1f} ms)")
+        else:
+            day = datetime.fromisoformat(args.date).date() if args.date else datetime.now().date()
+            print(format_digest(archive.digest(day)))
+    except (ValueError, re.error) as e:
+        parser.error(str(e))
+    finally:
+        archive.conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import time
+import asyncio
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class AlertBatcher:
+    """
+    合併短時間內大量湧入的通知
+
+    同一聊天室在 window 秒內陸續到達的通知會合併成一則訊息，依檔案分組；
+    達到 max_lines 行或 max_chars 字元時立即送出，且第一則通知最多只會被
+    延遲 max_latency 秒。
+    """
+
+    def __init__(self, sender, window=2.0, max_lines=20, max_chars=4096, max_latency=5.0):
+        self.sender = sender
+        self.window = window
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.max_latency = max_latency
+        self.batches = {}  # chat_id -> 累積中的通知
+        self.timers = {}  # chat_id -> 等待送出的計時工作
+
+    async def add(self, chat_id, file_name, line, detected_at, seq=None):
+        """加入一則通知（seq 為其在 journal 中的序號），必要時立即送出目前累積的內容"""
+        line = line[:self.max_chars - 200]  # 預留標題與檔名的空間
+        batch = self.batches.get(chat_id)
+        if batch and (len(batch['lines']) >= self.max_lines
+                      or batch['chars'] + len(file_name) + len(line) + 10 > self.max_chars):
+            await self.flush(chat_id)
+            batch = None
+
+        now = time.monotonic()
+        if batch is None:
+            batch = {'lines': [], 'seqs': [], 'chars': 100, 'first_at': now, 'detected_at': detected_at}
+            self.batches[chat_id] = batch
+            self.timers[chat_id] = asyncio.create_task(self.flush_later(chat_id))
+
+        batch['lines'].append((file_name, line))
+        if seq is not None:
+            batch['seqs'].append(seq)
+        batch['chars'] += len(file_name) + len(line) + 10
+        batch['last_at'] = now
+
+        if len(batch['lines']) >= self.max_lines:
+            await self.flush(chat_id)
+
+    async def flush_later(self, chat_id):
+        """等到沒有新通知超過 window 秒，或已達 max_latency 時送出"""
+        while True:
+            batch = self.batches.get(chat_id)
+            if batch is None:
+                return
+            deadline = min(batch['last_at'] + self.window, batch['first_at'] + self.max_latency)
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+
+        self.timers.pop(chat_id, None)
+        await self.flush(chat_id)
+
+    async def flush(self, chat_id):
+        """送出指定聊天室目前累積的通知"""
+        batch = self.batches.pop(chat_id, None)
+        timer = self.timers.pop(chat_id, None)
+        if timer and timer is not asyncio.current_task():
+            timer.cancel()
+        if not batch:
+            return
+
+        await self.sender.enqueue(chat_id, format_batch(batch['lines']), batch['detected_at'], batch['seqs'])
+        logger.info(f"已合併 {len(batch['lines'])} 則通知並排入發送佇列")
+
+    async def stop(self):
+        """送出所有尚未送出的通知"""
+        for chat_id in list(self.batches):
+            await self.flush(chat_id)
+
+def format_batch(lines):
+    """將 (檔名, 內容) 列表依檔案分組成一則訊息"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if len(lines) == 1:
+        file_name, line = lines[0]
+        return f"🔔 XQ 全球贏家通知 [{timestamp}]\n📁 檔案更新: {file_name}\n\n{line}"
+
+    grouped = {}
+    for file_name, line in lines:
+        grouped.setdefault(file_name, []).append(line)
+
+    parts = [f"🔔 XQ 全球贏家通知 [{timestamp}] 共 {len(lines)} 則"]
+    for file_name, file_lines in grouped.items():
+        parts.append(f"\n📁 {file_name}")
+        parts.extend(file_lines)
+    return "\n".join(parts)
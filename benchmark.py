@@ -0,0 +1,264 @@
+"""
+XQDirectoryMonitor 效能測試
+
+以模擬的 XQ print(file(...)) 輸出對監控程式施加負載，透過本機假的 Telegram Bot
+量測偵測延遲（寫入 -> 呼叫 send_message）、吞吐量、CPU 時間與記憶體峰值。
+
+範例：
+    python benchmark.py --modes polling,watchdog --sizes 100,1000 --duration 20
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組
+    resource = None
+
+BENCH_LINE = re.compile(r'BENCH (\d+) ([\d.]+)')
+
+class FakeBot:
+    """本機假的 Telegram Bot，記錄每則通知從寫入到被發送的延遲"""
+
+    def __init__(self, send_delay=0.0):
+        self.send_delay = send_delay
+        self.latencies = []
+        self.messages = 0
+        self.last_sent = None
+
+    async def send_message(self, chat_id, text, **kwargs):
+        now = time.time()
+        self.messages += 1
+        self.last_sent = time.monotonic()
+        # 合併模式下一則訊息可能包含多行通知
+        for _, written_at in BENCH_LINE.findall(text):
+            self.latencies.append(now - float(written_at))
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+
+    async def get_me(self):
+        class Me:
+            first_name = "FakeBot"
+        return Me()
+
+class LoadGenerator(threading.Thread):
+    """
+    模擬 XQ 對多個商品檔案寫入通知
+
+    以固定速率隨機挑選活躍商品寫入一行，每隔 burst_every 秒一次寫入 burst_size 行
+    （模擬全市場同時觸發）；部分檔案以 Big5 寫入，並可定期截斷檔案。
+    """
+
+    def __init__(self, directory, symbols, rate, duration, burst_every=0, burst_size=0,
+                 big5_ratio=0.0, truncate_every=0, seed=0):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.symbols = symbols
+        self.rate = rate
+        self.duration = duration
+        self.burst_every = burst_every
+        self.burst_size = burst_size
+        self.truncate_every = truncate_every
+        self.random = random.Random(seed)
+        self.big5_symbols = set(self.random.sample(symbols, int(len(symbols) * big5_ratio)))
+        self.written = 0
+        self.sequence = 0
+
+    def write_line(self, symbol):
+        self.sequence += 1
+        encoding = 'big5' if symbol in self.big5_symbols else 'utf-8'
+        line = f"單量大於100 {symbol} BENCH {self.sequence} {time.time():.6f}\r\n"
+        with open(os.path.join(self.directory, f"{symbol}.log"), 'ab') as f:
+            f.write(line.encode(encoding))
+        self.written += 1
+
+    def run(self):
+        started = time.monotonic()
+        next_burst = self.burst_every
+        next_truncate = self.truncate_every
+        interval = 1.0 / self.rate if self.rate else None
+        while True:
+            elapsed = time.monotonic() - started
+            if elapsed >= self.duration:
+                break
+
+            if self.burst_every and elapsed >= next_burst:
+                for symbol in self.random.sample(self.symbols, min(self.burst_size, len(self.symbols))):
+                    self.write_line(symbol)
+                next_burst += self.burst_every
+
+            if self.truncate_every and elapsed >= next_truncate:
+                # XQ 重新建立檔案：清空後再寫入
+                symbol = self.random.choice(self.symbols)
+                open(os.path.join(self.directory, f"{symbol}.log"), 'wb').close()
+                self.write_line(symbol)
+                next_truncate += self.truncate_every
+
+            if interval:
+                self.write_line(self.random.choice(self.symbols))
+                time.sleep(interval)
+            else:
+                time.sleep(0.05)
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def children_cpu_seconds():
+    """已結束的子行程（分片工作行程）使用的 CPU 時間"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def peak_memory_mb():
+    """行程的記憶體峰值 (MB)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位為 KB，macOS 為 bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+async def run_scenario(args):
+    """在目前的行程中執行單一測試情境，回傳結果"""
+    from XQTelegramNotifier import XQDirectoryMonitor
+
+    directory = tempfile.mkdtemp(prefix="xq_bench_")
+    symbols = [f"{1000 + i}.TW" for i in range(args.size)]
+    # 目錄中已存在的歷史檔案
+    for symbol in symbols:
+        with open(os.path.join(directory, f"{symbol}.log"), 'wb') as f:
+            f.write(f"歷史資料 {symbol}\r\n".encode('utf-8') * args.history_lines)
+
+    bot = FakeBot(args.send_delay)
+    # shards4 表示分片模式、4 個工作行程
+    shard_workers = int(args.mode[6:] or 4) if args.mode.startswith("shards") else 0
+    monitor = XQDirectoryMonitor(
+        bot, 1, directory,
+        watch_mode="polling" if shard_workers else args.mode,
+        shard_options={'workers': shard_workers},
+        sender_options={'workers': 4, 'queue_size': 100000, 'global_rate': 100000, 'chat_rate': 100000},
+        batching_options={'enabled': args.batching},
+        dedup_options={'enabled': False}
+    )
+    monitor_task = asyncio.create_task(monitor.start_monitoring())
+    await asyncio.sleep(args.warmup)
+
+    active = symbols[:args.active] if args.active else symbols
+    generator = LoadGenerator(
+        directory, active, args.rate, args.duration,
+        burst_every=args.burst_every, burst_size=args.burst_size,
+        big5_ratio=args.big5_ratio, truncate_every=args.truncate_every, seed=args.seed
+    )
+
+    cpu_started = time.process_time()
+    children_started = children_cpu_seconds()
+    wall_started = time.monotonic()
+    generator.start()
+    while generator.is_alive():
+        await asyncio.sleep(0.1)
+
+    # 等待剩餘的通知送出
+    deadline = time.monotonic() + args.drain
+    while len(bot.latencies) < generator.written and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    # 吞吐量以最後一則送達的時間計算，不含等待遺失通知的時間
+    wall = (bot.last_sent or time.monotonic()) - wall_started
+    cpu = time.process_time() - cpu_started
+
+    monitor.stop_monitoring()
+    await monitor_task
+    # 分片工作行程結束後才能取得它們的 CPU 時間
+    cpu += children_cpu_seconds() - children_started
+
+    latencies = bot.latencies
+    return {
+        'mode': args.mode,
+        'size': args.size,
+        'written': generator.written,
+        'delivered': len(latencies),
+        'messages': bot.messages,
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies) if latencies else None,
+        'throughput': len(latencies) / wall if wall else 0,
+        'cpu_seconds': cpu,
+        'peak_mb': peak_memory_mb()
+    }
+
+def format_seconds(value):
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+def print_results(results):
+    header = f"{'模式':<10}{'檔案數':>8}{'寫入':>8}{'送達':>8}{'訊息':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'行/秒':>9}{'CPU秒':>8}{'峰值MB':>9}"
+    print(header)
+    for r in results:
+        peak = "-" if r['peak_mb'] is None else f"{r['peak_mb']:.1f}"
+        print(
+            f"{r['mode']:<10}{r['size']:>8}{r['written']:>8}{r['delivered']:>8}{r['messages']:>8}"
+            f"{format_seconds(r['p50']):>9}{format_seconds(r['p90']):>9}{format_seconds(r['p99']):>9}"
+            f"{format_seconds(r['max']):>9}{r['throughput']:>9.1f}{r['cpu_seconds']:>8.2f}{peak:>9}"
+        )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="XQ 監控程式效能測試")
+    parser.add_argument("--modes", default="polling,watchdog",
+                        help="要比較的監控模式，以逗號分隔（shards4 表示 4 個工作行程的分片模式）")
+    parser.add_argument("--sizes", default="100,1000", help="目錄中的檔案數量，以逗號分隔")
+    parser.add_argument("--active", type=int, default=50, help="會被寫入的商品數量（0 表示全部）")
+    parser.add_argument("--rate", type=float, default=20, help="每秒寫入的行數")
+    parser.add_argument("--duration", type=float, default=10, help="寫入持續秒數")
+    parser.add_argument("--burst-every", type=float, default=5, help="每隔幾秒一次大量觸發（0 表示不觸發）")
+    parser.add_argument("--burst-size", type=int, default=40, help="每次大量觸發的行數")
+    parser.add_argument("--big5-ratio", type=float, default=0.1, help="以 Big5 寫入的檔案比例")
+    parser.add_argument("--truncate-every", type=float, default=0, help="每隔幾秒截斷一個檔案（0 表示不截斷）")
+    parser.add_argument("--history-lines", type=int, default=100, help="每個歷史檔案的行數")
+    parser.add_argument("--send-delay", type=float, default=0.0, help="假 Bot 每次發送的模擬延遲（秒）")
+    parser.add_argument("--batching", action="store_true", help="啟用合併模式")
+    parser.add_argument("--warmup", type=float, default=2, help="開始寫入前等待監控啟動的秒數")
+    parser.add_argument("--drain", type=float, default=10, help="寫入結束後等待剩餘通知的秒數")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    logging.disable(logging.CRITICAL)
+
+    if args.mode:
+        # 子行程：執行單一情境，讓 CPU 時間與記憶體峰值互不影響
+        print(json.dumps(asyncio.run(run_scenario(args))))
+        return
+
+    results = []
+    passthrough = [arg for arg in sys.argv[1:] if arg != "--json"]
+    for size in [int(size) for size in args.sizes.split(",")]:
+        for mode in args.modes.split(","):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *passthrough, "--mode", mode, "--size", str(size)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_results(results)
+
+if __name__ == "__main__":
+    main()
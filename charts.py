@@ -0,0 +1,170 @@
+import os
+import re
+import time
+import zlib
+import struct
+import asyncio
+import fnmatch
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from dedup import symbol_from_file
+
+logger = logging.getLogger(__name__)
+
+TAIL_BYTES_PER_LINE = 256  # 讀取檔案結尾時每行預估的位元組數
+
+BACKGROUND = (255, 255, 255)
+BAR = (158, 170, 186)
+LAST_BAR = (220, 53, 69)
+AVERAGE = (40, 40, 40)
+
+class ChartRenderer:
+    """
+    為量能類的通知產生走勢小圖（sparkline）
+
+    圖片由商品 .log 檔最近 lines 行的數值畫成，在獨立的行程池中繪製，不佔用事件迴圈。
+    結果依（商品、時間區間）放在有上限的 LRU 快取中，同一商品短時間內大量通知只畫一次；
+    同時繪製數達到 max_renders 或發送佇列超過 max_queue 時不畫圖，只送文字。
+    """
+
+    def __init__(self, pattern="*", match=None, lines=60, bucket=60, cache_size=128, max_renders=2,
+                 max_queue=50, processes=1, width=320, height=80):
+        self.file_matcher = re.compile(fnmatch.translate(pattern), re.IGNORECASE)
+        self.match = re.compile(match) if match else None
+        self.lines = lines
+        self.bucket = bucket
+        self.cache_size = cache_size
+        self.max_renders = max_renders
+        self.max_queue = max_queue
+        self.size = (width, height)
+        self.cache = OrderedDict()  # (商品, 時間區間) -> 繪製中或已完成的 Future
+        self.active = 0
+        self.pool = ProcessPoolExecutor(max_workers=processes)
+
+    def wants(self, file_name, text):
+        """此通知是否要附上圖片"""
+        return bool(self.file_matcher.match(file_name)) and (self.match is None or bool(self.match.search(text)))
+
+    def request(self, file_path, parser, detected_at, queue_depth=0):
+        """
+        取得圖片的 Future（結果為 PNG bytes）；負載過高時回傳 None，只送文字
+
+        不會等待繪製完成，發送端在送出前才等待結果。
+        """
+        symbol = symbol_from_file(file_path.name)
+        key = (symbol, int(detected_at // self.bucket))
+        future = self.cache.get(key)
+        if future is not None:
+            self.cache.move_to_end(key)
+            metrics.chart_cache_hits.inc()
+            return future
+
+        if self.active >= self.max_renders:
+            metrics.charts_skipped.inc(reason="busy")
+            return None
+        if queue_depth > self.max_queue:
+            metrics.charts_skipped.inc(reason="queue")
+            return None
+
+        self.active += 1
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(
+            self.pool, render_file_chart, str(file_path), parser, self.lines, self.size
+        )
+        future.add_done_callback(lambda done: self._render_done(key, done, started))
+        self.cache[key] = future
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return future
+
+    def _render_done(self, key, future, started):
+        self.active -= 1
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error is not None or future.result() is None:
+            # 失敗或沒有數值的結果不保留，之後的通知會重新繪製
+            if self.cache.get(key) is future:
+                del self.cache[key]
+            if error is not None:
+                logger.warning(f"繪製 {key[0]} 走勢圖失敗: {error}")
+                metrics.charts_skipped.inc(reason="error")
+            return
+        metrics.charts_rendered.inc()
+        metrics.chart_render_duration.observe(time.perf_counter() - started)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.cache.clear()
+
+def render_file_chart(path, parser, lines, size):
+    """
+    讀取檔案最後 lines 行的數值並畫成 PNG（在行程池中執行）
+
+    沒有足夠的數值時回傳 None。
+    """
+    file_name = os.path.basename(path)
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        start = max(0, end - lines * TAIL_BYTES_PER_LINE)
+        f.seek(start)
+        data = f.read(end - start)
+    raw_lines = data.splitlines()
+    if start > 0 and raw_lines:
+        raw_lines = raw_lines[1:]  # 第一行可能不完整
+
+    values = []
+    for raw in raw_lines[-lines:]:
+        try:
+            line = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            line = raw.decode('big5', errors='replace')
+        value = parser.parse(file_name, line.strip()).get('value')
+        if isinstance(value, float):
+            values.append(value)
+    if len(values) < 2:
+        return None
+    return render_sparkline(values, *size)
+
+def render_sparkline(values, width=320, height=80):
+    """把數值畫成長條圖，最後一筆以紅色標示，並畫出平均線；回傳 PNG bytes"""
+    pixels = [bytearray(BACKGROUND * width) for _ in range(height)]
+    low = min(0.0, min(values))
+    high = max(values)
+    span = (high - low) or 1.0
+    margin = 4
+    usable = height - 2 * margin
+    slot = (width - 2 * margin) / len(values)
+    bar_width = max(1, int(slot) - 1)
+
+    for index, value in enumerate(values):
+        color = LAST_BAR if index == len(values) - 1 else BAR
+        top = height - margin - max(1, round((value - low) / span * usable))
+        left = margin + int(index * slot)
+        for y in range(top, height - margin):
+            row = pixels[y]
+            for x in range(left, min(left + bar_width, width - margin)):
+                row[x * 3:x * 3 + 3] = bytes(color)
+
+    average = sum(values) / len(values)
+    y = height - margin - round((average - low) / span * usable)
+    if 0 <= y < height:
+        for x in range(margin, width - margin, 4):  # 虛線
+            pixels[y][x * 3:x * 3 + 6] = bytes(AVERAGE * 2)
+    return encode_png(pixels, width, height)
+
+def encode_png(rows, width, height):
+    """將 RGB 像素列編碼成 PNG"""
+    raw = b''.join(b'\x00' + bytes(row[:width * 3]) for row in rows)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw, 6))
+        + chunk(b'IEND', b'')
+    )
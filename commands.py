@@ -0,0 +1,232 @@
+import time
+import asyncio
+import logging
+from datetime import datetime
+from telegram.error import Conflict, NetworkError, TimedOut
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_LAST = 50  # /last 最多列出的通知數
+MAX_REPLY_CHARS = 4096  # Telegram 單則訊息上限
+STALE_AFTER = 60  # 超過這個秒數的指令視為過期（例如服務停止期間累積的指令）
+
+HELP_TEXT = (
+    "可用指令:\n"
+    "/status - 服務狀態\n"
+    "/stats - 統計摘要\n"
+    "/last <n> - 最近 n 則通知\n"
+    "/mute <商品> <分鐘> - 暫停推播指定商品（0 分鐘取消）\n"
+    "/mute - 列出靜音中的商品\n"
+    "/unmute <商品> - 取消靜音"
+)
+
+class TelegramUpdateSource:
+    """
+    以 getUpdates 長輪詢接收訊息
+
+    每次請求帶入 offset（上一次最後一則的 update_id + 1），Telegram 會同時確認並
+    捨棄之前的更新；只訂閱 message 類型，沒有新訊息時伺服器最多保留連線 timeout 秒
+    （python-telegram-bot 會把 timeout 加到讀取逾時上）。
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def get_updates(self, offset, timeout):
+        updates = await self.bot.get_updates(offset=offset, timeout=timeout, allowed_updates=["message"])
+        results = []
+        for update in updates:
+            message = update.message
+            if message is None or not message.text:
+                results.append((update.update_id, None, None, None))
+                continue
+            results.append((update.update_id, message.chat_id, message.text, message.date.timestamp()))
+        return results
+
+class LocalUpdateSource:
+    """
+    本機的假更新來源，供測試使用
+
+    push() 放入一則訊息，get_updates() 與 Telegram 相同：回傳 offset 之後的更新，
+    沒有更新時最多等待 timeout 秒。
+    """
+
+    def __init__(self):
+        self.updates = []
+        self.next_id = 1
+        self.offsets = []  # 每次請求帶入的 offset，方便檢查
+        self.changed = asyncio.Event()
+
+    def push(self, chat_id, text, date=None):
+        self.updates.append((self.next_id, chat_id, text, date or time.time()))
+        self.next_id += 1
+        self.changed.set()
+
+    async def get_updates(self, offset, timeout):
+        self.offsets.append(offset)
+        if offset is not None:
+            self.updates = [update for update in self.updates if update[0] >= offset]
+        if not self.updates:
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self.updates)
+
+class BotCommands:
+    """
+    處理聊天室傳給 Bot 的指令（/status、/mute、/stats、/last）
+
+    在同一個事件迴圈中以獨立的工作長輪詢更新；指令只讀取記憶體中的狀態或
+    有索引的歷史資料庫，回覆經由發送佇列送出，不會延遲檔案偵測。
+    只接受路由中的聊天室與 allowed_chat_ids 傳來的指令。
+    """
+
+    def __init__(self, monitor, update_source, allowed_chat_ids=(), poll_timeout=30):
+        self.monitor = monitor
+        self.update_source = update_source
+        self.allowed_chat_ids = {str(chat_id) for chat_id in allowed_chat_ids}
+        self.poll_timeout = poll_timeout
+        self.offset = None
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        delay = 1
+        while True:
+            try:
+                updates = await self.update_source.get_updates(self.offset, self.poll_timeout)
+                delay = 1
+            except asyncio.CancelledError:
+                raise
+            except Conflict as e:
+                # 同一個 Bot Token 有其他程式在接收更新（例如設定介面的「取得 Chat ID」）
+                logger.warning(f"其他程式正在接收 Bot 更新，{delay} 秒後重試: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+            except (TimedOut, NetworkError) as e:
+                logger.debug(f"接收 Bot 指令時網路錯誤，{delay} 秒後重試: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+            except Exception as e:
+                logger.error(f"接收 Bot 指令失敗: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+
+            for update_id, chat_id, text, date in updates:
+                self.offset = update_id + 1
+                if text is None:
+                    continue
+                try:
+                    await self.handle(chat_id, text, date)
+                except Exception as e:
+                    logger.error(f"處理 Bot 指令時發生錯誤: {text[:50]} - {e}")
+
+    async def handle(self, chat_id, text, date=None):
+        """處理單一訊息，不是指令或來源不允許時忽略"""
+        if not text.startswith("/"):
+            return
+        if date is not None and time.time() - date > STALE_AFTER:
+            logger.info(f"略過過期的指令: {text[:50]}")
+            return
+        if not self.is_allowed(chat_id):
+            logger.warning(f"略過未授權聊天室的指令: {chat_id} {text[:50]}")
+            return
+
+        parts = text.split()
+        command = parts[0][1:].split("@")[0].lower()  # 群組中的指令可能是 /status@BotName
+        metrics.commands_handled.inc(command=command)
+        reply = self.execute(chat_id, command, parts[1:])
+        await self.monitor.sender.enqueue(chat_id, reply[:MAX_REPLY_CHARS])
+
+    def is_allowed(self, chat_id):
+        chat_id = str(chat_id)
+        return chat_id in self.allowed_chat_ids or chat_id in {
+            str(allowed) for allowed in self.monitor.router.chat_ids()
+        }
+
+    def execute(self, chat_id, command, args):
+        """執行指令，回傳回覆內容"""
+        if command == "status":
+            return self.status()
+        if command == "stats":
+            return f"📈 {metrics.stats_line()}"
+        if command == "last":
+            return self.last(chat_id, args)
+        if command == "mute":
+            return self.mute(args)
+        if command == "unmute" and len(args) == 1:
+            return self.mute([args[0], "0"])
+        return HELP_TEXT
+
+    def status(self):
+        status = self.monitor.status()
+        uptime = int(status['uptime'])
+        lines = [
+            f"{'⏸ 已暫停' if status['paused'] else '✅ 監控中'} ({status['watch_mode']})",
+            f"執行時間: {uptime // 3600}:{uptime % 3600 // 60:02d}:{uptime % 60:02d}",
+            f"追蹤檔案: {status['tracked_files']}",
+            f"通知: {status['alerts']}，已送出: {status['sent']}，錯誤: {status['errors']}",
+            f"發送佇列: {status['queue_depth']}"
+        ]
+        if status['next_open']:
+            lines.append(f"交易時段外，下次開盤: {status['next_open'].replace('T', ' ')}")
+        if status['muted']:
+            lines.append(f"靜音中: {', '.join(status['muted'])}")
+        return "\n".join(lines)
+
+    def last(self, chat_id, args):
+        """最近 n 則送到這個聊天室的通知"""
+        try:
+            count = int(args[0]) if args else 5
+        except ValueError:
+            return "用法: /last <n>"
+        count = max(1, min(count, MAX_LAST))
+
+        archive = self.monitor.archive
+        if archive:
+            archive.flush()
+            rows = [
+                (datetime.fromtimestamp(ts).strftime("%m-%d %H:%M:%S"), file_name, text)
+                for ts, symbol, file_name, text in archive.query(chat_id=chat_id, limit=count)
+            ]
+        else:
+            alerts = [alert for alert in self.monitor.recent_alerts if str(chat_id) in alert['chat_ids']]
+            rows = [(alert['time'][5:], alert['file'], alert['text']) for alert in alerts[-count:]]
+        if not rows:
+            return "目前沒有通知紀錄"
+        return "\n\n".join(f"{when} {file_name}\n{text}" for when, file_name, text in rows)
+
+    def mute(self, args):
+        if not args:
+            mutes = self.monitor.active_mutes()
+            if not mutes:
+                return "目前沒有靜音中的商品"
+            return "靜音中:\n" + "\n".join(
+                f"{symbol} 至 {datetime.fromtimestamp(until):%H:%M}" for symbol, until in sorted(mutes.items())
+            )
+        try:
+            symbol, minutes = args[0], float(args[1])
+        except (IndexError, ValueError):
+            return "用法: /mute <商品> <分鐘>"
+        if minutes < 0:
+            return "分鐘數不可為負數"
+
+        self.monitor.mute(symbol, minutes)
+        if minutes == 0:
+            return f"🔔 {symbol} 已取消靜音"
+        until = datetime.fromtimestamp(self.monitor.muted[symbol])
+        return f"🔕 {symbol} 靜音至 {until:%H:%M}"
@@ -0,0 +1,95 @@
+import json
+import socket
+import asyncio
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 9109
+
+class ControlServer:
+    """
+    本機控制通道（localhost TCP，每行一個 JSON 請求與回應）
+
+    提供 status、metrics、alerts、pause、resume 與 shutdown 指令，
+    供圖形介面或其他程式查詢及控制執行中的服務。
+    """
+
+    COMMANDS = ('status', 'metrics', 'alerts', 'pause', 'resume', 'shutdown')
+
+    def __init__(self, monitor, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.monitor = monitor
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        logger.info(f"控制通道已啟動: {self.host}:{self.port}")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    response = self.execute(request.get('command'), request)
+                except (ValueError, AttributeError) as e:
+                    response = {'ok': False, 'error': f"無效的請求: {e}"}
+                writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.debug(f"處理控制請求時發生錯誤: {e}")
+        finally:
+            writer.close()
+
+    def execute(self, command, request):
+        """執行單一指令，回傳可序列化成 JSON 的結果"""
+        if command not in self.COMMANDS:
+            return {'ok': False, 'error': f"未知的指令: {command}"}
+
+        monitor = self.monitor
+        if command == 'pause':
+            monitor.pause()
+        elif command == 'resume':
+            monitor.resume()
+        elif command == 'shutdown':
+            logger.info("收到控制通道的停止指令")
+            monitor.stop_monitoring()
+        elif command == 'metrics':
+            return {'ok': True, 'summary': metrics.stats_line(), 'text': metrics.metrics.render()}
+        elif command == 'alerts':
+            limit = int(request.get('limit', 20))
+            return {'ok': True, 'alerts': list(monitor.recent_alerts)[-limit:]}
+        return {'ok': True, 'status': monitor.status()}
+
+def control_request(command, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=1.0, **args):
+    """
+    對執行中的服務送出一個指令並回傳結果（同步版本，供圖形介面使用）
+
+    服務沒有執行時丟出 OSError。
+    """
+    with socket.create_connection((host, port), timeout=timeout) as conn:
+        conn.sendall(json.dumps(dict(args, command=command)).encode('utf-8') + b'\n')
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    if not data:
+        raise ConnectionError("控制通道沒有回應")
+    return json.loads(data)
@@ -0,0 +1,175 @@
+"""
+XQDirectoryMonitor 當機復原測試
+
+持續對多個商品檔案寫入帶編號的通知，同時在隨機時間點以 SIGKILL（Windows 為
+TerminateProcess）強制結束監控程式並重新啟動；最後讓監控程式把剩餘通知送完，
+檢查每一則通知是否恰好送達一次。
+
+假的 Telegram Bot 收到訊息後立即寫入磁碟，模擬「對方已收到」。唯一允許的重複是
+被強制結束時已送出、但確認尚未寫入日誌的訊息（每次最多 workers 則）。
+
+範例：
+    python crash_test.py --kills 20 --rate 50
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+
+CRASH_LINE = re.compile(r'CRASH (\d+)')
+WORKERS = 2
+
+class RecordingBot:
+    """把收到的通知編號立即寫入磁碟的假 Bot"""
+
+    def __init__(self, record_path, send_delay=0.0):
+        self.fd = os.open(record_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        self.send_delay = send_delay
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.send_delay:
+            await asyncio.sleep(random.uniform(0, self.send_delay))
+        numbers = CRASH_LINE.findall(text)
+        if numbers:
+            os.write(self.fd, ("\n".join(numbers) + "\n").encode('ascii'))
+            os.fsync(self.fd)
+
+    async def get_me(self):
+        class Me:
+            first_name = "RecordingBot"
+        return Me()
+
+class Writer(threading.Thread):
+    """以固定速率對隨機檔案寫入帶編號的通知"""
+
+    def __init__(self, directory, files, rate, seed=0):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.files = files
+        self.rate = rate
+        self.random = random.Random(seed)
+        self.written = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.written += 1
+            file_name = self.random.choice(self.files)
+            with open(os.path.join(self.directory, file_name), 'ab') as f:
+                f.write(f"單量大於100 CRASH {self.written}\r\n".encode('utf-8'))
+            time.sleep(1.0 / self.rate)
+
+async def run_child(args):
+    """子行程：執行監控程式直到被結束"""
+    from XQTelegramNotifier import XQDirectoryMonitor
+
+    bot = RecordingBot(os.path.join(args.child, "delivered.txt"), args.send_delay)
+    monitor = XQDirectoryMonitor(
+        bot, 1, os.path.join(args.child, "local"),
+        watch_mode=args.mode, settle_window=0,
+        sender_options={'workers': WORKERS, 'global_rate': 100000, 'chat_rate': 100000},
+        batching_options={'enabled': args.batching},
+        dedup_options={'enabled': False}
+    )
+    await monitor.start_monitoring()
+
+def start_child(args, directory):
+    command = [sys.executable, os.path.abspath(__file__), "--child", directory, "--mode", args.mode,
+               "--send-delay", str(args.send_delay)]
+    if args.batching:
+        command.append("--batching")
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def delivered_counts(directory):
+    path = os.path.join(directory, "delivered.txt")
+    if not os.path.exists(path):
+        return Counter()
+    with open(path, 'r', encoding='ascii') as f:
+        return Counter(int(line) for line in f if line.strip())
+
+def run(args):
+    directory = tempfile.mkdtemp(prefix="xq_crash_")
+    local = os.path.join(directory, "local")
+    os.makedirs(local)
+    files = [f"{2000 + i}.TW.log" for i in range(args.files)]
+    for file_name in files:
+        open(os.path.join(local, file_name), 'wb').close()
+
+    rng = random.Random(args.seed)
+    # 第一次啟動先建立基準，之後寫入的內容都應該被推播
+    child = start_child(args, directory)
+    time.sleep(args.startup)
+    writer = Writer(local, files, args.rate, args.seed)
+    writer.start()
+
+    for kill in range(args.kills):
+        time.sleep(rng.uniform(args.min_uptime, args.max_uptime))
+        child.kill()
+        child.wait()
+        print(f"第 {kill + 1}/{args.kills} 次強制結束，已寫入 {writer.written} 則")
+        child = start_child(args, directory)
+
+    writer.stopped.set()
+    writer.join()
+
+    # 等待剩餘通知送達
+    deadline = time.monotonic() + args.drain
+    while time.monotonic() < deadline:
+        if len(delivered_counts(directory)) >= writer.written:
+            break
+        time.sleep(0.5)
+    child.kill()
+    child.wait()
+
+    counts = delivered_counts(directory)
+    missing = sorted(set(range(1, writer.written + 1)) - set(counts))
+    duplicates = {number: count for number, count in counts.items() if count > 1}
+    allowed = args.kills * WORKERS
+    result = {
+        'directory': directory,
+        'written': writer.written,
+        'delivered': len(counts),
+        'missing': len(missing),
+        'duplicates': sum(count - 1 for count in duplicates.values()),
+        'allowed_duplicates': allowed,
+        'missing_sample': missing[:20],
+        'duplicate_sample': sorted(duplicates)[:20]
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return not missing and result['duplicates'] <= allowed
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="XQ 監控程式當機復原測試")
+    parser.add_argument("--kills", type=int, default=10, help="強制結束的次數")
+    parser.add_argument("--files", type=int, default=20, help="商品檔案數量")
+    parser.add_argument("--rate", type=float, default=30, help="每秒寫入的行數")
+    parser.add_argument("--mode", default="polling", help="監控模式 (polling / watchdog)")
+    parser.add_argument("--batching", action="store_true", help="啟用合併模式")
+    parser.add_argument("--send-delay", type=float, default=0.02, help="假 Bot 每次發送的最大隨機延遲（秒）")
+    parser.add_argument("--min-uptime", type=float, default=0.2, help="每次重新啟動後最短執行秒數")
+    parser.add_argument("--max-uptime", type=float, default=3.0, help="每次重新啟動後最長執行秒數")
+    parser.add_argument("--startup", type=float, default=3.0, help="第一次啟動等待建立基準的秒數")
+    parser.add_argument("--drain", type=float, default=30, help="結束寫入後等待剩餘通知的秒數")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.child:
+        logging.disable(logging.CRITICAL)
+        asyncio.run(run_child(args))
+        return
+    sys.exit(0 if run(args) else 1)
+
+if __name__ == "__main__":
+    main()
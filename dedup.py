@@ -0,0 +1,122 @@
+import re
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE = re.compile(r'\s+')
+
+def symbol_from_file(file_name):
+    """由檔名取得商品代號，例如 2330.TW.log -> 2330.TW"""
+    return file_name[:-4] if file_name.lower().endswith('.log') else file_name
+
+class AlertDeduplicator:
+    """
+    以內容判斷重複通知，有存活時間 (TTL) 且數量有上限的 LRU 快取
+
+    key 為 "file" 時以「正規化後的內容 + 商品代號」判斷；為 "content" 時只看內容，
+    可擋下同一訊號出現在不同商品檔案的情況。最近的紀錄會存到磁碟，重新啟動後仍有效。
+
+    每筆紀錄保存第一次出現的時間，以目前的 ttl 判斷是否過期（修改 ttl 立即生效）；
+    重複出現時移到最後，超過 max_entries 時先淘汰最久沒有出現的紀錄。
+    """
+
+    def __init__(self, persist_path, ttl=60, max_entries=10000, key="file"):
+        self.persist_path = Path(persist_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.key = key
+        self.entries = OrderedDict()  # 雜湊 -> 第一次出現的時間（最久沒有出現的在最前面）
+        self.suppressed = 0
+        self.dirty = False
+
+    def make_key(self, file_name, line):
+        normalized = WHITESPACE.sub(' ', line).strip()
+        if self.key != "content":
+            normalized = f"{symbol_from_file(file_name)}\x00{normalized}"
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+    def is_duplicate(self, file_name, line):
+        """回傳此通知是否在 TTL 內出現過；沒出現過（或已過期）則記錄下來"""
+        now = time.time()
+        self.expire(now)
+
+        key = self.make_key(file_name, line)
+        seen_at = self.entries.get(key)
+        if seen_at is not None and now - seen_at < self.ttl:
+            self.entries.move_to_end(key)
+            self.suppressed += 1
+            return True
+
+        self.entries[key] = now
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.dirty = True
+        return False
+
+    def expire(self, now):
+        """
+        從最久沒有出現的一端移除已過期的紀錄
+
+        重複出現過的紀錄會移到後面，後面仍可能有過期的紀錄；它們在查詢時以各自的
+        時間判斷，並在 purge 或被淘汰時移除。
+        """
+        while self.entries:
+            key, seen_at = next(iter(self.entries.items()))
+            if now - seen_at < self.ttl:
+                break
+            self.entries.popitem(last=False)
+            self.dirty = True
+
+    def purge(self, now):
+        """檢查所有紀錄，移除已過期的紀錄"""
+        expired = [key for key, seen_at in self.entries.items() if now - seen_at >= self.ttl]
+        for key in expired:
+            del self.entries[key]
+        if expired:
+            self.dirty = True
+
+    def configure(self, ttl, max_entries):
+        """套用新的 ttl 與數量上限；ttl 變更時重新檢查全部紀錄"""
+        if ttl != self.ttl:
+            self.ttl = ttl
+            self.purge(time.time())
+        self.max_entries = max_entries
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.dirty = True
+
+    def load(self):
+        """載入上次保存、仍在 TTL 內的紀錄"""
+        try:
+            if self.persist_path.exists():
+                with open(self.persist_path, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                now = time.time()
+                # 檔案中保存的是到期時間，與舊版格式相同
+                for key, expires in saved:
+                    if expires > now:
+                        self.entries[key] = expires - self.ttl
+                logger.info(f"載入重複通知紀錄: {len(self.entries)} 筆")
+        except Exception as e:
+            logger.error(f"載入重複通知紀錄時發生錯誤: {e}")
+
+    def save(self):
+        """有變更時保存目前的紀錄"""
+        if not self.dirty:
+            return
+        try:
+            self.purge(time.time())
+            # 使用臨時檔案避免寫入時程式崩潰導致檔案損壞
+            temp_file = self.persist_path.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump([(key, seen_at + self.ttl) for key, seen_at in self.entries.items()], f)
+            temp_file.replace(self.persist_path)
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"儲存重複通知紀錄時發生錯誤: {e}")
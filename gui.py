@@ -4,19 +4,29 @@ import json
 import os
 import subprocess
 import time
+import queue
+import threading
+from control import control_request, DEFAULT_HOST, DEFAULT_PORT
 
 class XQManager:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("XQ Telegram Manager")
-        self.root.geometry("400x500")
+        self.root.geometry("400x560")
         self.root.resizable(False, False)
 
         self.process = None
         self.is_running = False
+        self.is_paused = False
+        self.control_address = (DEFAULT_HOST, DEFAULT_PORT)
+        self.status_results = queue.Queue()  # 背景查詢的結果，由主執行緒套用
+        self.status_polling = False
+        self.status_epoch = 0  # 啟動或停止服務後遞增，捨棄之前發出的查詢結果
+        self.stopping = False  # 背景執行緒正在停止服務
 
         self.create_widgets()
         self.load_config()
+        self.update_buttons()
         self.update_status()
 
     def create_widgets(self):
@@ -65,6 +75,13 @@ class XQManager:
                                  bg='#f44336', fg='white', width=10, state='disabled')
         self.stop_btn.pack(side='left', padx=5)
 
+        self.pause_btn = tk.Button(btn_frame2, text="Pause", command=self.toggle_pause,
+                                  width=10, state='disabled')
+        self.pause_btn.pack(side='left', padx=5)
+
+        self.detail_label = tk.Label(service_frame, text="", fg='gray')
+        self.detail_label.pack(pady=(10, 0))
+
         # Test
         test_frame = tk.LabelFrame(self.root, text="Test", padx=10, pady=10)
         test_frame.pack(fill='x', padx=20, pady=10)
@@ -93,6 +110,7 @@ class XQManager:
                 fg='gray').pack(pady=10)
 
     def load_config(self):
+        self.load_control_address()
         try:
             if os.path.exists('config.json'):
                 with open('config.json', 'r', encoding='utf-8') as f:
@@ -116,15 +134,23 @@ class XQManager:
         except:
             pass
 
-        config = {
-            "telegram_bot_token": token,
-            "telegram_chat_id": chat_id,
-            "watch_directory": "./local"
-        }
+        # 保留設定檔中其他進階設定
+        config = {"watch_directory": "./local"}
+        try:
+            if os.path.exists('config.json'):
+                with open('config.json', 'r', encoding='utf-8') as f:
+                    config.update(json.load(f))
+        except:
+            pass
+
+        config["telegram_bot_token"] = token
+        config["telegram_chat_id"] = chat_id
 
         try:
-            with open('config.json', 'w', encoding='utf-8') as f:
+            # 先寫入臨時檔案再替換，執行中的服務不會讀到寫到一半的設定
+            with open('config.json.tmp', 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=2, ensure_ascii=False)
+            os.replace('config.json.tmp', 'config.json')
 
             os.makedirs('local', exist_ok=True)
             messagebox.showinfo("Success", "Config saved successfully!")
@@ -166,33 +192,81 @@ class XQManager:
         if not os.path.exists('config.json'):
             messagebox.showerror("Error", "Please save config first")
             return
+        self.load_control_address()
 
         try:
+            # 日誌由服務寫入 logs/ 下的輪替檔案，不使用管線以免緩衝區寫滿時卡住服務
             self.process = subprocess.Popen(
                 ["python", "XQTelegramNotifier.py"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
             )
             self.is_running = True
+            self.status_epoch += 1
             self.update_buttons()
             messagebox.showinfo("Success", "Service started!")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to start: {e}")
 
     def stop_service(self):
-        if not self.is_running:
+        if not self.is_running or self.stopping:
             return
 
-        try:
-            if self.process:
-                self.process.terminate()
-                self.process.wait(timeout=5)
+        # 等待服務結束最多要 20 秒，在背景執行緒等待，完成後由 root.after 回到主執行緒更新介面
+        self.stopping = True
+        self.status_epoch += 1
+        self.update_buttons()
+        threading.Thread(target=self.stop_worker, args=(self.process,), daemon=True).start()
 
+    def stop_worker(self, process):
+        """在背景執行緒停止服務，不操作 Tk 元件"""
+        try:
+            # 先透過控制通道正常停止（送出佇列中的訊息並保存狀態），失敗時才強制結束
+            try:
+                self.control("shutdown")
+                if process:
+                    process.wait(timeout=15)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                if process:
+                    process.terminate()
+                    process.wait(timeout=5)
+            error = None
+        except Exception as e:
+            error = e
+        self.root.after(0, self.finish_stop, error)
+
+    def finish_stop(self, error):
+        self.stopping = False
+        self.status_epoch += 1
+        if error is None:
+            self.process = None
             self.is_running = False
-            self.update_buttons()
+        self.update_buttons()
+        if error is None:
             messagebox.showinfo("Success", "Service stopped!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to stop: {e}")
+        else:
+            messagebox.showerror("Error", f"Failed to stop: {error}")
+
+    def load_control_address(self):
+        """由 config.json 讀取控制通道位址（載入設定與啟動服務時讀取，不在每次查詢時讀檔）"""
+        service = {}
+        try:
+            with open('config.json', 'r', encoding='utf-8') as f:
+                service = json.load(f).get('service') or {}
+        except:
+            pass
+        self.control_address = (service.get('control_host', DEFAULT_HOST), service.get('control_port', DEFAULT_PORT))
+
+    def control(self, command, **args):
+        """對執行中的服務送出控制指令，服務沒有回應時丟出 OSError"""
+        host, port = self.control_address
+        return control_request(command, host, port, timeout=0.5, **args)
+
+    def toggle_pause(self):
+        try:
+            self.control("resume" if self.is_paused else "pause")
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Service not responding: {e}")
 
     def test_message(self):
         try:
@@ -243,22 +317,67 @@ print("message", file=r"path\\local\\xq_trigger.txt")"""
         messagebox.showinfo("Help", help_text)
 
     def update_buttons(self):
-        if self.is_running:
+        if self.stopping:
+            self.start_btn.config(state='disabled')
+            self.stop_btn.config(state='disabled')
+            self.pause_btn.config(state='disabled')
+            self.status_label.config(text="Stopping...", fg='orange')
+        elif self.is_running:
             self.start_btn.config(state='disabled')
             self.stop_btn.config(state='normal')
-            self.status_label.config(text="Service Running", fg='green')
+            self.pause_btn.config(state='normal', text="Resume" if self.is_paused else "Pause")
+            if self.is_paused:
+                self.status_label.config(text="Service Paused", fg='orange')
+            else:
+                self.status_label.config(text="Service Running", fg='green')
         else:
             self.start_btn.config(state='normal')
             self.stop_btn.config(state='disabled')
+            self.pause_btn.config(state='disabled', text="Pause")
             self.status_label.config(text="Service Stopped", fg='red')
+            self.detail_label.config(text="")
 
     def update_status(self):
-        if self.process and self.process.poll() is not None and self.is_running:
-            self.is_running = False
-            self.update_buttons()
+        # 以控制通道查詢服務狀態；也能偵測到不是由此介面啟動的服務。
+        # 查詢在背景執行緒進行（服務未啟動時 Windows 連線要 0.5-2 秒才被拒絕），
+        # 主執行緒只套用已完成的結果，介面不會卡住
+        while not self.status_results.empty():
+            self.show_status(*self.status_results.get_nowait())
+        if not self.status_polling:
+            self.status_polling = True
+            threading.Thread(target=self.poll_status, args=(self.status_epoch,), daemon=True).start()
 
         self.root.after(1000, self.update_status)
 
+    def poll_status(self, epoch):
+        """在背景執行緒查詢狀態，結果交給主執行緒（Tk 元件只能在主執行緒操作）"""
+        try:
+            status = self.control("status")["status"]
+        except (OSError, ValueError, KeyError):
+            status = None
+        self.status_results.put((epoch, status))
+        self.status_polling = False
+
+    def show_status(self, epoch, status):
+        if epoch != self.status_epoch or self.stopping:
+            return  # 啟動或停止服務前發出的查詢，結果已過時；停止期間由 finish_stop 更新
+        if status is not None:
+            self.is_running = True
+            self.is_paused = status["paused"]
+            self.detail_label.config(
+                text=f"Files: {status['tracked_files']}  Sent: {status['sent']}  "
+                     f"Queue: {status['queue_depth']}  Errors: {status['errors']}"
+            )
+        else:
+            process_alive = self.process is not None and self.process.poll() is None
+            if self.is_running and not process_alive:
+                self.process = None
+            self.is_running = process_alive
+            self.is_paused = False
+            if process_alive:
+                self.detail_label.config(text="Starting...")
+        self.update_buttons()
+
     def run(self):
         self.root.mainloop()
 
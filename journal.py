@@ -0,0 +1,173 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class AlertJournal:
+    """
+    偵測到的通知的預寫日誌 (write-ahead journal)
+
+    每則通知（每個聊天室一筆）先以遞增序號記錄，並與檔案狀態在同一個交易中
+    寫入，因此重新啟動後「已讀取的位移」與「待發送的通知」必定一致；確認送達
+    後標記為 sent。寫入採群組提交：累積的通知、確認與檔案狀態一次寫入並 fsync，
+    發送端等到通知寫入磁碟後才送出。重新啟動時只重送尚未標記的通知。
+
+    資料庫寫入都在專用的寫入執行緒中執行，fsync 不會卡住事件迴圈；append、ack
+    只在事件迴圈中累積紀錄。
+    """
+
+    def __init__(self, state_store, fsync=True, retention=86400):
+        self.state_store = state_store
+        self.conn = state_store.conn  # 與檔案狀態共用連線，才能在同一個交易中寫入
+        self.retention = retention  # 已送出的紀錄保留秒數
+        self.conn.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "seq INTEGER PRIMARY KEY, chat_id TEXT, file_name TEXT, text TEXT, message TEXT, "
+            "detected_at REAL, status TEXT DEFAULT 'pending', acked_at REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS journal_status ON journal (status, seq)")
+        self.conn.commit()
+
+        last_seq = self.conn.execute("SELECT MAX(seq) FROM journal").fetchone()[0] or 0
+        self.next_seq = last_seq + 1
+        self.durable_seq = last_seq  # 已寫入磁碟的最大序號
+        self.written_unacked = self.count_unacked()  # 已寫入、尚未確認的通知數（供指標使用）
+        self.entries = []  # 尚未寫入的通知
+        self.acks = {}  # seq -> (狀態, 時間)，尚未寫入的確認
+        self.dirty = asyncio.Event()
+        self.committed = asyncio.Event()
+        self.commit_lock = asyncio.Lock()  # 同一時間只有一個提交，失敗時放回的紀錄才不會蓋過較新的寫入
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="xq-journal")
+        self.last_prune = 0
+        self.task = None
+        self.stopping = False
+        metrics.metrics.gauge("xq_journal_unacked", "日誌中尚未確認送達的通知數", self.unacked_count)
+
+    def append(self, chat_id, file_name, text, message, detected_at):
+        """記錄一則通知（先存在記憶體，下次提交時寫入），回傳序號"""
+        seq = self.next_seq
+        self.next_seq += 1
+        self.entries.append((seq, str(chat_id), file_name, text, message, detected_at))
+        self.dirty.set()
+        return seq
+
+    def ack(self, seqs, status='sent'):
+        """標記通知已送達（或放棄發送時為 failed）"""
+        now = time.time()
+        for seq in seqs:
+            self.acks[seq] = (status, now)
+        self.dirty.set()
+
+    async def commit(self):
+        """
+        將累積的通知、確認與檔案狀態以單一交易寫入（在寫入執行緒中執行）
+
+        交易失敗（例如資料庫被鎖定或磁碟已滿）時全部放回，下次提交重新寫入，
+        不會出現檔案位移已保存、通知卻沒有記錄的情況。
+        """
+        async with self.commit_lock:
+            # 在事件迴圈中一次取出，同一次讀取的通知與檔案位移必定在同一個交易中
+            entries, self.entries = self.entries, []
+            acks, self.acks = self.acks, {}
+            states = self.state_store.take_pending()
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self.writer, self.write, entries, acks, states)
+            except Exception:
+                self.entries = entries + self.entries
+                self.acks = {**acks, **self.acks}
+                self.state_store.restore_pending(states)
+                raise
+            if entries:
+                self.durable_seq = entries[-1][0]
+
+        # 喚醒等待寫入完成的發送端
+        committed, self.committed = self.committed, asyncio.Event()
+        committed.set()
+
+    def write(self, entries, acks, states):
+        """在寫入執行緒中執行的交易"""
+        with self.state_store.lock:
+            with metrics.journal_commit_duration.time():
+                with self.conn:
+                    if entries:
+                        self.conn.executemany(
+                            "INSERT INTO journal (seq, chat_id, file_name, text, message, detected_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            entries
+                        )
+                    if acks:
+                        self.conn.executemany(
+                            "UPDATE journal SET status = ?, acked_at = ? WHERE seq = ?",
+                            [(status, acked_at, seq) for seq, (status, acked_at) in acks.items()]
+                        )
+                    self.state_store.write_states(states)
+            if entries or acks:
+                self.written_unacked = self.count_unacked()
+            self.prune()
+
+    async def run(self):
+        """群組提交：有新紀錄時讓出一次事件迴圈，把同一輪累積的紀錄一起寫入"""
+        while not self.stopping:
+            await self.dirty.wait()
+            await asyncio.sleep(0)
+            self.dirty.clear()
+            try:
+                await self.commit()
+            except Exception as e:
+                logger.error(f"寫入通知日誌時發生錯誤: {e}")
+                await asyncio.sleep(1)
+                self.dirty.set()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """停止群組提交並寫入剩餘紀錄（不取消進行中的提交，避免寫入結果遺失）"""
+        try:
+            if self.task:
+                self.stopping = True
+                self.dirty.set()
+                await self.task
+                self.task = None
+            await self.commit()
+        finally:
+            self.writer.shutdown()
+
+    async def wait_durable(self, seq):
+        """等待指定序號的通知寫入磁碟"""
+        while seq > self.durable_seq:
+            await self.committed.wait()
+
+    async def pending(self):
+        """依序回傳所有尚未確認送達的通知 (seq, chat_id, message, detected_at)"""
+        await self.commit()
+        return await asyncio.get_running_loop().run_in_executor(self.writer, self.read_pending)
+
+    def read_pending(self):
+        with self.state_store.lock:
+            return self.conn.execute(
+                "SELECT seq, chat_id, message, detected_at FROM journal WHERE status = 'pending' ORDER BY seq"
+            ).fetchall()
+
+    def count_unacked(self):
+        return self.conn.execute("SELECT COUNT(*) FROM journal WHERE status = 'pending'").fetchone()[0]
+
+    def unacked_count(self):
+        return max(0, self.written_unacked + len(self.entries) - len(self.acks))
+
+    def prune(self):
+        """每分鐘最多一次，刪除超過保留時間的已送達紀錄（由寫入執行緒呼叫）"""
+        now = time.time()
+        if now - self.last_prune < 60:
+            return
+        self.last_prune = now
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM journal WHERE status != 'pending' AND acked_at < ?", (now - self.retention,)
+            )
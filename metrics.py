@@ -0,0 +1,230 @@
+import time
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Counter:
+    """只會增加的計數器，可附帶標籤"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}  # 標籤 tuple -> 數值
+        self.lock = threading.Lock()  # 可能在 I/O 執行緒中累加
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self):
+        return sum(self.values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()) or [((), 0)]:
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Gauge:
+    """由回呼函式即時取得目前數值的量表"""
+
+    def __init__(self, name, help_text, func):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+
+    def value(self):
+        try:
+            return self.func()
+        except Exception:
+            return 0
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.value()}"]
+
+class Histogram:
+    """固定區間的直方圖"""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.count += 1
+            self.sum += value
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+    def time(self):
+        """以 with 區塊量測耗時"""
+        return _Timer(self)
+
+    def quantile(self, q):
+        """由區間估計百分位數（回傳所在區間的上限）"""
+        if not self.count:
+            return None
+        target = self.count * q
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+class Registry:
+    """集中管理所有指標，輸出 Prometheus 文字格式"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help_text):
+        return self.metrics.setdefault(name, Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, func):
+        """註冊量表；同名量表會被新的回呼取代（例如重新啟動監控時）"""
+        self.metrics[name] = Gauge(name, help_text, func)
+        return self.metrics[name]
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+# 全域指標
+metrics = Registry()
+scan_duration = metrics.histogram("xq_scan_duration_seconds", "目錄完整掃描耗時")
+files_scanned = metrics.counter("xq_files_scanned_total", "掃描過的檔案數")
+files_changed = metrics.counter("xq_files_changed_total", "有新增內容的檔案數")
+bytes_read = metrics.counter("xq_bytes_read_total", "讀取的位元組數")
+files_reset = metrics.counter("xq_files_reset_total", "被截斷、替換或改寫而從頭讀取的檔案數")
+files_removed = metrics.counter("xq_files_removed_total", "已刪除而停止追蹤的檔案數")
+alerts_detected = metrics.counter("xq_alerts_detected_total", "偵測到的通知行數")
+alerts_dropped = metrics.counter("xq_alerts_dropped_total", "被規則丟棄的通知行數")
+alerts_muted = metrics.counter("xq_alerts_muted_total", "因商品靜音而略過的通知行數")
+commands_handled = metrics.counter("xq_commands_total", "處理的 Bot 指令數")
+charts_rendered = metrics.counter("xq_charts_rendered_total", "繪製完成的走勢圖數")
+chart_cache_hits = metrics.counter("xq_chart_cache_hits_total", "使用快取的走勢圖數")
+charts_skipped = metrics.counter("xq_charts_skipped_total", "負載過高或失敗而只送文字的次數")
+chart_render_duration = metrics.histogram("xq_chart_render_seconds", "走勢圖繪製耗時（含行程間傳遞）")
+shard_scans = metrics.counter("xq_shard_scans_total", "各分片的掃描次數")
+shard_scan_seconds = metrics.counter("xq_shard_scan_seconds_total", "各分片的掃描總耗時（秒）")
+shard_lines = metrics.counter("xq_shard_lines_total", "各分片讀取到的通知行數")
+shard_restarts = metrics.counter("xq_shard_restarts_total", "分片工作行程重新啟動次數")
+shard_rebalances = metrics.counter("xq_shard_rebalances_total", "分片重新分配檔案的次數")
+shard_stale_results = metrics.counter("xq_shard_stale_results_total", "重新分配後被丟棄的舊分片結果")
+session_wakeups = metrics.counter("xq_session_wakeups_total", "進入交易時段而恢復掃描的次數")
+alert_latency = metrics.histogram("xq_alert_latency_seconds", "從偵測到送出 Telegram 的延遲")
+telegram_sent = metrics.counter("xq_telegram_sent_total", "成功送出的 Telegram 訊息數")
+telegram_errors = metrics.counter("xq_telegram_errors_total", "Telegram 發送錯誤數")
+telegram_retries = metrics.counter("xq_telegram_retries_total", "Telegram 發送重試次數")
+route_alerts = metrics.counter("xq_route_alerts_total", "各路由的通知數")
+state_save_duration = metrics.histogram(
+    "xq_state_save_duration_seconds", "儲存檔案狀態耗時",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+journal_commit_duration = metrics.histogram(
+    "xq_journal_commit_duration_seconds", "通知日誌群組提交（含 fsync）耗時",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5)
+)
+
+class MetricsServer:
+    """在本機提供 /metrics HTTP 端點（Prometheus 文字格式）"""
+
+    def __init__(self, host="127.0.0.1", port=9108):
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        logger.info(f"指標端點已啟動: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # 讀完標頭
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = "200 OK", metrics.render().encode('utf-8')
+            else:
+                status, body = "404 Not Found", b"not found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"處理指標請求時發生錯誤: {e}")
+        finally:
+            writer.close()
+
+def stats_line():
+    """目前指標的單行摘要，供定期寫入日誌"""
+    p50 = alert_latency.quantile(0.5)
+    p99 = alert_latency.quantile(0.99)
+    queue_depth = metrics.metrics.get("xq_send_queue_depth")
+    return (
+        f"掃描 {scan_duration.count} 次 (平均 {scan_duration.sum / scan_duration.count * 1000 if scan_duration.count else 0:.1f}ms), "
+        f"變更檔案 {files_changed.total()}, 讀取 {bytes_read.total()} bytes, "
+        f"通知 {alerts_detected.total()}, 已送出 {telegram_sent.total()}, "
+        f"延遲 p50<={p50 if p50 is not None else '-'}s p99<={p99 if p99 is not None else '-'}s, "
+        f"佇列 {queue_depth.value() if queue_depth else 0}, "
+        f"錯誤 {telegram_errors.total()}, 重試 {telegram_retries.total()}"
+    )
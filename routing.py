@@ -0,0 +1,88 @@
+import re
+import fnmatch
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Route:
+    """
+    一條推播路由：檔名符合 pattern (萬用字元) 或 regex 的通知送到 chat_ids
+
+    路由建立時就先編譯好比對規則，每行通知只需做一次正規表示式比對。
+    """
+
+    def __init__(self, name, chat_ids, pattern=None, regex=None):
+        if not chat_ids:
+            raise ValueError(f"路由 {name} 沒有設定 chat_ids")
+        if pattern and regex:
+            raise ValueError(f"路由 {name} 只能設定 pattern 或 regex 其中一個")
+
+        self.name = name
+        self.chat_ids = list(chat_ids) if isinstance(chat_ids, (list, tuple)) else [chat_ids]
+        try:
+            if regex:
+                self.matcher = re.compile(regex)
+            else:
+                # Windows 檔名不分大小寫
+                self.matcher = re.compile(fnmatch.translate(pattern or '*'), re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"路由 {name} 的比對規則無效: {e}")
+        self.alerts = 0  # 此路由累計的通知數
+
+    def matches(self, file_name):
+        return self.matcher.search(file_name) is not None
+
+class Router:
+    """依檔名把通知分派到一條或多條路由，比對結果依檔名快取"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.cache = {}  # file_name -> 符合的路由列表
+        self.last_reported = {}
+
+    @classmethod
+    def from_config(cls, routes_config, default_chat_id=None):
+        """
+        由設定檔建立路由
+
+        沒有設定 routes 時，所有檔案都送到 telegram_chat_id（舊版行為）。
+        設定錯誤時丟出 ValueError。
+        """
+        if not routes_config:
+            if not default_chat_id:
+                raise ValueError("沒有設定 routes，也沒有設定 telegram_chat_id")
+            return cls([Route("default", [default_chat_id])])
+
+        routes = []
+        for index, route_config in enumerate(routes_config):
+            if not isinstance(route_config, dict):
+                raise ValueError(f"第 {index + 1} 條路由格式錯誤")
+            routes.append(Route(
+                route_config.get("name", f"route{index + 1}"),
+                route_config.get("chat_ids", route_config.get("chat_id")),
+                pattern=route_config.get("pattern"),
+                regex=route_config.get("regex")
+            ))
+        return cls(routes)
+
+    def match(self, file_name):
+        """回傳符合檔名的路由列表"""
+        routes = self.cache.get(file_name)
+        if routes is None:
+            routes = [route for route in self.routes if route.matches(file_name)]
+            self.cache[file_name] = routes
+        return routes
+
+    def chat_ids(self):
+        """所有路由用到的 Chat ID（不重複，保持順序）"""
+        return list(dict.fromkeys(chat_id for route in self.routes for chat_id in route.chat_ids))
+
+    def report(self):
+        """回傳自上次呼叫後有新通知的路由統計 {路由名稱: (新增, 累計)}"""
+        changes = {}
+        for route in self.routes:
+            previous = self.last_reported.get(route.name, 0)
+            if route.alerts != previous:
+                changes[route.name] = (route.alerts - previous, route.alerts)
+                self.last_reported[route.name] = route.alerts
+        return changes
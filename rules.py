@@ -0,0 +1,215 @@
+import re
+import fnmatch
+import logging
+from datetime import datetime, time as dtime
+
+from dedup import symbol_from_file
+
+logger = logging.getLogger(__name__)
+
+NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+TEMPLATE_FIELD = re.compile(r'\{(\w+)\}')
+
+class Parser:
+    """
+    依檔名套用的欄位擷取規則
+
+    regex 使用具名群組擷取欄位，或以 template（例如 "{message}{value} {symbol}"）
+    描述一行的格式；載入時就編譯成正規表示式。
+    """
+
+    def __init__(self, pattern="*", regex=None, template=None):
+        if regex and template:
+            raise ValueError("parser 只能設定 regex 或 template 其中一個")
+        self.file_matcher = re.compile(fnmatch.translate(pattern), re.IGNORECASE)
+        try:
+            if template:
+                regex = _template_to_regex(template)
+            self.regex = re.compile(regex) if regex else None
+        except re.error as e:
+            raise ValueError(f"parser 的比對規則無效: {e}")
+
+    def parse(self, file_name, line):
+        """回傳擷取到的欄位；數字欄位會轉成 float"""
+        fields = {'file': file_name, 'symbol': symbol_from_file(file_name), 'message': line, 'line': line}
+        numbers = NUMBER.findall(line)
+        if numbers:
+            fields['value'] = float(numbers[0])
+
+        if self.regex:
+            match = self.regex.search(line)
+            if match:
+                for name, value in match.groupdict().items():
+                    if value is None:
+                        continue
+                    value = value.strip()
+                    try:
+                        fields[name] = float(value) if NUMBER.fullmatch(value) else value
+                    except ValueError:
+                        fields[name] = value
+        return fields
+
+class Rule:
+    """
+    單一規則：條件全部符合時執行 action
+
+    action 為 drop（丟棄並停止）、accept（保留並停止）、route（改送到 chat_ids）
+    或 format（以 template 重新排版）；route 與 format 會繼續套用後面的規則。
+    """
+
+    ACTIONS = ('drop', 'accept', 'route', 'format')
+
+    def __init__(self, config):
+        self.name = config.get('name', config.get('action', ''))
+        self.action = config.get('action')
+        if self.action not in self.ACTIONS:
+            raise ValueError(f"規則 {self.name} 的 action 必須是 {', '.join(self.ACTIONS)} 其中之一")
+
+        self.chat_ids = config.get('chat_ids')
+        if self.action == 'route' and not self.chat_ids:
+            raise ValueError(f"規則 {self.name} 為 route 但沒有設定 chat_ids")
+        if self.chat_ids is not None and not isinstance(self.chat_ids, list):
+            self.chat_ids = [self.chat_ids]
+
+        self.template = config.get('template')
+        if self.action == 'format' and not self.template:
+            raise ValueError(f"規則 {self.name} 為 format 但沒有設定 template")
+
+        self.file_matcher = None
+        if config.get('files'):
+            self.file_matcher = re.compile(fnmatch.translate(config['files']), re.IGNORECASE)
+        self.symbols = set(config['symbols']) if config.get('symbols') else None
+        self.exclude_symbols = set(config.get('exclude_symbols') or ())
+        self.field = config.get('field', 'value')
+        self.min = config.get('min')
+        self.max = config.get('max')
+        try:
+            self.match = re.compile(config['match']) if config.get('match') else None
+        except re.error as e:
+            raise ValueError(f"規則 {self.name} 的 match 無效: {e}")
+        self.window = _parse_window(config['time']) if config.get('time') else None
+        self.hits = 0
+
+    def matches(self, fields, now):
+        if self.file_matcher and not self.file_matcher.match(fields['file']):
+            return False
+        if self.symbols is not None and fields['symbol'] not in self.symbols:
+            return False
+        if fields['symbol'] in self.exclude_symbols:
+            return False
+        if self.min is not None or self.max is not None:
+            value = fields.get(self.field)
+            if not isinstance(value, float):
+                return False
+            if self.min is not None and value < self.min:
+                return False
+            if self.max is not None and value > self.max:
+                return False
+        if self.match and not self.match.search(fields['line']):
+            return False
+        if self.window and not _in_window(self.window, now):
+            return False
+        return True
+
+class Decision:
+    """規則引擎的結果：要發送的文字與（可選的）指定聊天室"""
+
+    def __init__(self, text, chat_ids=None, fields=None):
+        self.text = text
+        self.chat_ids = chat_ids
+        self.fields = fields or {}
+
+class RuleEngine:
+    """在發送前解析並過濾通知；parser 與規則都在載入時編譯"""
+
+    def __init__(self, parsers=None, rules=None):
+        self.parsers = parsers or []
+        self.rules = rules or []
+        self.parser_cache = {}  # file_name -> parser
+        self.dropped = 0
+
+    @classmethod
+    def from_config(cls, parsers_config=None, rules_config=None):
+        """由設定檔建立規則引擎，設定錯誤時丟出 ValueError"""
+        parsers = [
+            Parser(item.get('pattern', '*'), regex=item.get('regex'), template=item.get('template'))
+            for item in parsers_config or []
+        ]
+        rules = [Rule(item) for item in rules_config or []]
+        return cls(parsers, rules)
+
+    def parser_for(self, file_name):
+        if file_name not in self.parser_cache:
+            self.parser_cache[file_name] = next(
+                (parser for parser in self.parsers if parser.file_matcher.match(file_name)), None
+            )
+        return self.parser_cache[file_name]
+
+    def field_parser(self, file_name):
+        """此檔案使用的 Parser（沒有符合的設定時使用預設的數字擷取）"""
+        return self.parser_for(file_name) or _DEFAULT_PARSER
+
+    def evaluate(self, file_name, line, now=None):
+        """回傳 Decision，被規則丟棄時回傳 None"""
+        fields = self.field_parser(file_name).parse(file_name, line)
+        if not self.rules:
+            return Decision(line, fields=fields)
+
+        now = now or datetime.now().time()
+        text = line
+        chat_ids = None
+        for rule in self.rules:
+            if not rule.matches(fields, now):
+                continue
+            rule.hits += 1
+            if rule.action == 'drop':
+                self.dropped += 1
+                return None
+            if rule.action == 'accept':
+                break
+            if rule.action == 'route':
+                chat_ids = rule.chat_ids
+            elif rule.action == 'format':
+                try:
+                    text = rule.template.format_map(_Fields(fields))
+                except (ValueError, TypeError) as e:
+                    # 例如數字格式套用在缺少的欄位上，保留原本的文字
+                    logger.warning(f"規則 {rule.name} 排版失敗: {e}")
+        return Decision(text, chat_ids, fields)
+
+class _Fields(dict):
+    """格式化時缺少的欄位以空字串代替"""
+
+    def __missing__(self, key):
+        return ""
+
+_DEFAULT_PARSER = Parser()
+
+def _template_to_regex(template):
+    """把 "{message}{value} {symbol}" 這類格式轉成具名群組的正規表示式"""
+    parts = []
+    position = 0
+    for match in TEMPLATE_FIELD.finditer(template):
+        parts.append(re.escape(template[position:match.start()]).replace(r'\ ', r'\s+'))
+        name = match.group(1)
+        if name == 'value':
+            parts.append(r'(?P<value>-?\d+(?:\.\d+)?)')
+        else:
+            parts.append(f'(?P<{name}>.*?)')
+        position = match.end()
+    parts.append(re.escape(template[position:]).replace(r'\ ', r'\s+'))
+    return '^' + ''.join(parts) + '$'
+
+def _parse_window(window):
+    """["09:00", "13:30"] -> (time, time)"""
+    try:
+        start, end = (dtime.fromisoformat(value) for value in window)
+    except (TypeError, ValueError):
+        raise ValueError(f"時間區間格式錯誤: {window}，應為 [\"HH:MM\", \"HH:MM\"]")
+    return start, end
+
+def _in_window(window, now):
+    start, end = window
+    if start <= end:
+        return start <= now <= end
+    return now >= start or now <= end  # 跨午夜的區間
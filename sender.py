@@ -0,0 +1,213 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter, NetworkError, TimedOut
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_CAPTION = 1024  # Telegram 圖片說明的字數上限
+
+class TokenBucket:
+    """非同步權杖桶，用來限制每秒發送數量"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate  # 每秒補充的權杖數
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        """取得一個權杖，不足時等待"""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class TelegramSender:
+    """
+    非同步發送佇列
+
+    偵測端只負責把訊息排入有上限的佇列；由數個工作協程依照全域與每個聊天室
+    的速率限制發送，遇到 RetryAfter 或網路錯誤時退避重試。訊息對應的通知已記錄在
+    journal（AlertJournal）中，寫入磁碟後才發送，送達後在 journal 中確認。
+
+    workers 為同時進行中的請求數上限（共用 Bot 的連線池）。同一聊天室同時只有
+    一個工作協程發送：其他工作協程取到該聊天室的訊息時交給它依序送出，自己
+    繼續處理其他聊天室，不會為了等待某個聊天室而閒置。
+    """
+
+    def __init__(self, bot, journal, workers=4, queue_size=1000,
+                 global_rate=25, chat_rate=1, max_retries=5, photo_timeout=5.0):
+        self.bot = bot
+        self.journal = journal
+        self.queue = asyncio.Queue()
+        self.capacity = asyncio.Semaphore(queue_size)  # 尚未送達的訊息上限（背壓）
+        self.pending = 0  # 佇列中、等待中與發送中的訊息數
+        self.worker_count = workers
+        self.workers = []
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self.active_chats = {}  # 正在發送的聊天室 -> 等待依序發送的訊息
+        self.max_retries = max_retries
+        self.photo_timeout = photo_timeout  # 等待走勢圖的最長秒數，逾時只送文字
+        self.stats = {'sent': 0, 'failed': 0, 'retries': 0, 'last_latency': None}
+
+    async def start(self):
+        """啟動工作協程並重新排入上次未送達的訊息"""
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+        metrics.metrics.gauge("xq_send_queue_depth", "發送佇列中的訊息數", lambda: self.pending)
+
+        # 工作協程先啟動，未送達的訊息超過佇列上限時才不會卡住
+        pending = await self.journal.pending()
+        if pending:
+            logger.info(f"重新發送上次未送達的訊息: {len(pending)} 則")
+        for seq, chat_id, text, detected_at in pending:
+            await self.enqueue(chat_id, text, detected_at, [seq])
+
+    def set_limits(self, global_rate=25, chat_rate=1, max_retries=5, **ignored):
+        """套用新的速率限制；佇列與暫存中的訊息不受影響（workers、queue_size 需重新啟動）"""
+        if global_rate != self.global_bucket.rate:
+            self.global_bucket = TokenBucket(global_rate)
+        if chat_rate != self.chat_rate:
+            self.chat_rate = chat_rate
+            self.chat_buckets = {}
+        self.max_retries = max_retries
+
+    async def enqueue(self, chat_id, text, detected_at=None, seqs=(), photo=None):
+        """
+        排入一則訊息；佇列已滿時會等待（背壓）
+
+        seqs 為這則訊息包含的通知在 journal 中的序號（合併模式下可能有多個）。
+        photo 為繪製中的圖片（結果為 PNG bytes 的 Future），有圖片時以圖片加說明送出。
+        """
+        detected_at = detected_at or time.time()
+        await self.capacity.acquire()
+        self.pending += 1
+        self.queue.put_nowait((list(seqs), chat_id, text, detected_at, photo))
+
+    async def stop(self, timeout=10):
+        """等待佇列清空後停止；逾時未送出的訊息在 journal 中仍未確認，下次啟動再送"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"發送佇列尚有 {self.pending} 則訊息未送出，將於下次啟動時重送")
+
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def worker(self):
+        while True:
+            item = await self.queue.get()
+            chat = str(item[1])
+            if chat in self.active_chats:
+                # 其他工作協程正在發送這個聊天室的訊息，交給它依序送出
+                self.active_chats[chat].append(item)
+                continue
+
+            backlog = self.active_chats[chat] = deque([item])
+            try:
+                while backlog:
+                    seqs, chat_id, text, detected_at, photo = backlog.popleft()
+                    try:
+                        # 通知寫入磁碟前不發送，避免程式中斷後重新讀取而重複發送
+                        if seqs:
+                            await self.journal.wait_durable(max(seqs))
+                        if photo is not None:
+                            photo = await self.wait_photo(photo, text)
+                        await self.deliver(seqs, chat_id, text, detected_at, photo)
+                    finally:
+                        self.pending -= 1
+                        self.capacity.release()
+                        self.queue.task_done()
+            finally:
+                del self.active_chats[chat]
+
+    async def wait_photo(self, photo, text):
+        """等待圖片繪製完成；逾時、失敗或說明太長時回傳 None（只送文字）"""
+        if len(text) > MAX_CAPTION:
+            return None
+        try:
+            # 同一張圖可能由多則訊息共用，逾時不可取消繪製
+            return await asyncio.wait_for(asyncio.shield(photo), self.photo_timeout)
+        except asyncio.TimeoutError:
+            metrics.charts_skipped.inc(reason="timeout")
+        except Exception:
+            pass  # 錯誤已由 ChartRenderer 記錄
+        return None
+
+    async def deliver(self, seqs, chat_id, text, detected_at, photo=None):
+        """發送單則訊息，必要時退避重試"""
+        chat_bucket = self.chat_buckets.setdefault(str(chat_id), TokenBucket(self.chat_rate))
+        delay = 1
+        for attempt in range(self.max_retries + 1):
+            await self.global_bucket.acquire()
+            await chat_bucket.acquire()
+            try:
+                if photo is not None:
+                    await self.bot.send_photo(chat_id=chat_id, photo=photo, caption=text)
+                else:
+                    await self.bot.send_message(chat_id=chat_id, text=text)
+            except RetryAfter as e:
+                wait = _retry_after_seconds(e)
+                logger.warning(f"Telegram 限制發送頻率，{wait} 秒後重試")
+                self.stats['retries'] += 1
+                metrics.telegram_errors.inc(kind="retry_after")
+                metrics.telegram_retries.inc()
+                await asyncio.sleep(wait)
+                continue
+            except (BadRequest, Forbidden, ChatMigrated) as e:
+                # BadRequest 是 NetworkError 的子類別，需先處理：Chat ID 錯誤、訊息過長、
+                # Bot 被封鎖或群組已升級，重試也無效，標記為失敗，重新啟動後不再重送
+                if isinstance(e, ChatMigrated):
+                    logger.error(f"聊天室 {chat_id} 已升級為超級群組，請把 Chat ID 改為 {e.new_chat_id}")
+                else:
+                    logger.error(f"發送 Telegram 訊息失敗: {e}")
+                self.stats['failed'] += 1
+                metrics.telegram_errors.inc(kind="rejected")
+                self.journal.ack(seqs, status='failed')
+                return False
+            except (TimedOut, NetworkError) as e:
+                logger.warning(f"發送 Telegram 訊息時網路錯誤，{delay} 秒後重試: {e}")
+                self.stats['retries'] += 1
+                metrics.telegram_errors.inc(kind="network")
+                metrics.telegram_retries.inc()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+            except Exception as e:
+                # 其他錯誤（例如 Chat ID 錯誤）重試也無效，直接放棄
+                logger.error(f"發送 Telegram 訊息失敗: {e}")
+                self.stats['failed'] += 1
+                metrics.telegram_errors.inc(kind="fatal")
+                self.journal.ack(seqs, status='failed')
+                return False
+
+            latency = time.time() - detected_at
+            self.stats['sent'] += 1
+            self.stats['last_latency'] = latency
+            metrics.telegram_sent.inc()
+            metrics.alert_latency.observe(latency)
+            self.journal.ack(seqs)
+            logger.info(f"✅ 訊息已發送到 Telegram (偵測到送出 {latency:.2f} 秒)")
+            return True
+
+        # 重試次數用盡：在 journal 中保持未確認，下次啟動時再送
+        logger.error(f"發送 Telegram 訊息重試 {self.max_retries} 次仍失敗，保留待下次重送")
+        self.stats['failed'] += 1
+        return False
+
+def _retry_after_seconds(error):
+    """RetryAfter.retry_after 可能是秒數或 timedelta"""
+    retry_after = error.retry_after
+    if hasattr(retry_after, 'total_seconds'):
+        return retry_after.total_seconds()
+    return float(retry_after)
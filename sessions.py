@@ -0,0 +1,118 @@
+import logging
+from datetime import date, datetime, timedelta, time as dtime
+
+logger = logging.getLogger(__name__)
+
+# 證交所盤前委託 08:30 起，盤後定價與零股交易至 14:30
+DEFAULT_SESSIONS = [["08:30", "14:30"]]
+DEFAULT_WEEKDAYS = [1, 2, 3, 4, 5]  # ISO 星期：1 = 星期一
+LOOKAHEAD_DAYS = 60  # 尋找下一個交易時段最多往後找幾天
+
+class TradingCalendar:
+    """
+    交易時段與休市日
+
+    sessions 為 [["HH:MM", "HH:MM"], ...]（同一天內的區間），weekdays 為開市的 ISO 星期，
+    holidays 為休市日期 "YYYY-MM-DD"（例如證交所每年公告的休市日）。
+    """
+
+    def __init__(self, sessions=None, weekdays=None, holidays=()):
+        self.sessions = [_parse_session(session) for session in (sessions or DEFAULT_SESSIONS)]
+        self.sessions.sort()
+        self.weekdays = set(weekdays or DEFAULT_WEEKDAYS)
+        try:
+            self.holidays = {date.fromisoformat(day) for day in holidays}
+        except (TypeError, ValueError):
+            raise ValueError(f"休市日格式錯誤: {holidays}，應為 \"YYYY-MM-DD\"")
+
+    def is_trading_day(self, day):
+        return day.isoweekday() in self.weekdays and day not in self.holidays
+
+    def in_session(self, now):
+        if not self.is_trading_day(now.date()):
+            return False
+        current = now.time()
+        return any(start <= current < end for start, end in self.sessions)
+
+    def next_open(self, now):
+        """下一個交易時段開始的時間；正在交易時段中時回傳 now"""
+        if self.in_session(now):
+            return now
+        for days in range(LOOKAHEAD_DAYS + 1):
+            day = now.date() + timedelta(days=days)
+            if not self.is_trading_day(day):
+                continue
+            for start, _ in self.sessions:
+                opening = datetime.combine(day, start)
+                if opening > now:
+                    return opening
+        return None
+
+    def seconds_until_open(self, now):
+        opening = self.next_open(now)
+        return None if opening is None else (opening - now).total_seconds()
+
+class SessionSchedule:
+    """
+    依交易時段決定掃描頻率
+
+    交易時段內每 session_interval 秒掃描（watchdog 模式下即時處理事件）；時段外每
+    idle_interval 秒執行一次心跳（suspend 為 True 時心跳不掃描檔案），並在下一個時段
+    開始時醒來補上休眠期間的新增內容。
+    """
+
+    def __init__(self, calendar, session_interval=0.5, idle_interval=60, suspend=False):
+        self.calendar = calendar
+        self.session_interval = session_interval
+        self.idle_interval = idle_interval
+        self.suspend = suspend
+        self.active = None  # 上次檢查時是否在交易時段內
+
+    def update(self, now=None):
+        """檢查目前是否在交易時段內；剛進入時段時回傳 True（需要完整掃描一次）"""
+        now = now or datetime.now()
+        active = self.calendar.in_session(now)
+        woke = active and self.active is False
+        if active != self.active:
+            if active:
+                logger.info(f"進入交易時段，每 {self.session_interval} 秒檢查一次")
+            else:
+                opening = self.calendar.next_open(now)
+                mode = "暫停掃描" if self.suspend else f"每 {self.idle_interval} 秒檢查一次"
+                logger.info(
+                    f"交易時段外，{mode}"
+                    + (f"，下次開盤 {opening:%Y-%m-%d %H:%M}" if opening else "")
+                )
+            self.active = active
+        return woke
+
+    def scanning(self):
+        """目前是否要掃描檔案"""
+        return bool(self.active) or not self.suspend
+
+    def interval(self, now=None):
+        """到下次檢查前應等待的秒數（時段外會在下一個時段開始時醒來）"""
+        if self.active:
+            return self.session_interval
+        until_open = self.calendar.seconds_until_open(now or datetime.now())
+        if until_open is None:
+            return self.idle_interval
+        return max(0.0, min(self.idle_interval, until_open))
+
+def build_schedule(options):
+    """由設定建立 SessionSchedule；未啟用時回傳 None"""
+    if not options.get("enabled", False):
+        return None
+    calendar = TradingCalendar(options.get("sessions"), options.get("weekdays"), options.get("holidays", ()))
+    return SessionSchedule(
+        calendar, options.get("session_interval", 0.5), options.get("idle_interval", 60), options.get("suspend", False)
+    )
+
+def _parse_session(session):
+    try:
+        start, end = (dtime.fromisoformat(value) for value in session)
+    except (TypeError, ValueError):
+        raise ValueError(f"交易時段格式錯誤: {session}，應為 [\"HH:MM\", \"HH:MM\"]")
+    if start >= end:
+        raise ValueError(f"交易時段的開始時間必須早於結束時間: {session}")
+    return start, end
@@ -0,0 +1,339 @@
+import os
+import re
+import copy
+import json
+import asyncio
+import logging
+from datetime import time as dtime
+
+from routing import Router
+from rules import RuleEngine
+from sessions import TradingCalendar
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    "telegram_bot_token": "YOUR_BOT_TOKEN_HERE",
+    "telegram_chat_id": "YOUR_CHAT_ID_HERE",
+    "watch_directory": "./local",
+    "watch_mode": "polling",
+    "reconcile_interval": 30,
+    "settle_window": 0.5,
+    "sender": {
+        "workers": 4,
+        "queue_size": 1000,
+        "global_rate": 25,
+        "chat_rate": 1,
+        "max_retries": 5
+    },
+    "batching": {
+        "enabled": False,
+        "window": 2.0,
+        "max_lines": 20,
+        "max_chars": 4096,
+        "max_latency": 5.0
+    },
+    "io_workers": 4,
+    "http": {
+        "pool_size": 8,
+        "http_version": "1.1",
+        "connect_timeout": 5.0,
+        "read_timeout": 10.0,
+        "write_timeout": 10.0,
+        "pool_timeout": 5.0
+    },
+    "tail_buffer": 1048576,
+    "dedup": {
+        "enabled": True,
+        "ttl": 60,
+        "max_entries": 10000,
+        "key": "file"
+    },
+    "metrics": {
+        "port": 0,
+        "host": "127.0.0.1",
+        "log_interval": 60
+    },
+    "service": {
+        "control_host": "127.0.0.1",
+        "control_port": 9109,
+        "log_file": "logs/xq_notifier.log",
+        "log_max_bytes": 5242880,
+        "log_backups": 5
+    },
+    "journal": {
+        "fsync": True,
+        "retention": 86400
+    },
+    "archive": {
+        "enabled": True,
+        "retention_days": 365,
+        "digest_time": "",
+        "digest_chat_ids": []
+    },
+    "commands": {
+        "enabled": False,
+        "poll_timeout": 30,
+        "allowed_chat_ids": []
+    },
+    "charts": {
+        "enabled": False,
+        "pattern": "*",
+        "match": "",
+        "lines": 60,
+        "bucket": 60,
+        "cache_size": 128,
+        "max_renders": 2,
+        "max_queue": 50,
+        "processes": 1,
+        "timeout": 5.0,
+        "width": 320,
+        "height": 80
+    },
+    "shards": {
+        "workers": 0,
+        "interval": 1.0,
+        "replicas": 100
+    },
+    "schedule": {
+        "enabled": False,
+        "sessions": [["08:30", "14:30"]],
+        "weekdays": [1, 2, 3, 4, 5],
+        "holidays": [],
+        "session_interval": 0.5,
+        "idle_interval": 60,
+        "suspend": False
+    }
+}
+
+# 這些設定只在啟動時使用，修改後需要重新啟動
+RESTART_REQUIRED = (
+    "telegram_bot_token", "watch_mode", "io_workers", "metrics.host", "metrics.port",
+    "sender.workers", "sender.queue_size", "service", "journal", "archive.enabled",
+    "commands.enabled", "commands.poll_timeout", "http", "charts", "shards"
+)
+
+def load_config(config_file):
+    """
+    讀取並驗證設定檔，回傳補上預設值的設定
+
+    設定錯誤時丟出 ValueError，訊息說明哪一項設定有問題。
+    """
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            loaded = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{config_file} 不是有效的 JSON: {e}")
+    if not isinstance(loaded, dict):
+        raise ValueError(f"{config_file} 的內容必須是 JSON 物件")
+
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    for key, value in loaded.items():
+        if isinstance(config.get(key), dict) and isinstance(value, dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+
+    validate_config(config)
+    return config
+
+def validate_config(config):
+    """檢查設定是否有效，無效時丟出 ValueError"""
+    bot_token = config.get("telegram_bot_token")
+    if not bot_token or bot_token == "YOUR_BOT_TOKEN_HERE":
+        raise ValueError("請在 config.json 中設定有效的 Telegram Bot Token")
+
+    chat_id = config.get("telegram_chat_id")
+    if not config.get("routes") and (not chat_id or chat_id == "YOUR_CHAT_ID_HERE"):
+        raise ValueError("請在 config.json 中設定有效的 Telegram Chat ID")
+
+    if config["watch_mode"] not in ("polling", "watchdog"):
+        raise ValueError("watch_mode 必須是 polling 或 watchdog")
+
+    for key in ("reconcile_interval", "settle_window"):
+        _check_number(config, key, 0)
+    _check_number(config, "io_workers", 1, integer=True)
+    _check_number(config, "tail_buffer", 4096, integer=True)
+
+    for section, defaults in DEFAULT_CONFIG.items():
+        if not isinstance(defaults, dict):
+            continue
+        if not isinstance(config[section], dict):
+            raise ValueError(f"{section} 必須是 JSON 物件")
+        unknown = sorted(set(config[section]) - set(defaults))
+        if unknown:
+            raise ValueError(f"{section} 有不認得的設定: {', '.join(unknown)}")
+
+    for name in ("batching.enabled", "dedup.enabled", "journal.fsync", "archive.enabled", "commands.enabled",
+                 "charts.enabled", "schedule.enabled", "schedule.suspend"):
+        if not isinstance(config_value(config, name), bool):
+            raise ValueError(f"{name} 必須是 true 或 false")
+
+    _check_number(config, "sender.workers", 1, integer=True)
+    _check_number(config, "sender.queue_size", 1, integer=True)
+    _check_number(config, "sender.max_retries", 0, integer=True)
+    for key in ("global_rate", "chat_rate"):
+        _check_number(config, f"sender.{key}", 0, exclusive=True)
+
+    for key in ("window", "max_latency"):
+        _check_number(config, f"batching.{key}", 0, exclusive=True)
+    _check_number(config, "batching.max_lines", 1, integer=True)
+    # 每則合併訊息預留 200 字元給標題與檔名，且不能超過 Telegram 單則訊息的 4096 字元
+    _check_number(config, "batching.max_chars", 256, maximum=4096, integer=True)
+
+    _check_number(config, "dedup.ttl", 0, exclusive=True)
+    _check_number(config, "dedup.max_entries", 1, integer=True)
+    if config["dedup"]["key"] not in ("file", "content"):
+        raise ValueError("dedup.key 必須是 \"file\" 或 \"content\"")
+
+    _check_number(config, "journal.retention", 0)
+    _check_number(config, "archive.retention_days", 1, integer=True)
+
+    # 連接埠為 0 時不啟用該功能
+    _check_number(config, "metrics.port", 0, maximum=65535, integer=True)
+    _check_number(config, "metrics.log_interval", 0)
+    _check_number(config, "service.control_port", 0, maximum=65535, integer=True)
+    _check_number(config, "service.log_max_bytes", 1, integer=True)
+    _check_number(config, "service.log_backups", 0, integer=True)
+
+    if config["archive"]["digest_time"]:
+        try:
+            dtime.fromisoformat(config["archive"]["digest_time"])
+        except (TypeError, ValueError):
+            raise ValueError("archive.digest_time 格式錯誤，應為 \"HH:MM\"")
+    for name in ("archive.digest_chat_ids", "commands.allowed_chat_ids"):
+        if not isinstance(config_value(config, name), list):
+            raise ValueError(f"{name} 必須是列表")
+    _check_number(config, "commands.poll_timeout", 0, integer=True)
+
+    if config["http"]["http_version"] not in ("1.1", "2"):
+        raise ValueError("http.http_version 必須是 \"1.1\" 或 \"2\"")
+    if not isinstance(config["http"]["pool_size"], int) or config["http"]["pool_size"] < config["sender"]["workers"]:
+        raise ValueError("http.pool_size 必須是整數且不小於 sender.workers")
+    for key in ("connect_timeout", "read_timeout", "write_timeout", "pool_timeout"):
+        _check_number(config, f"http.{key}", 0, exclusive=True)
+
+    if config["charts"]["match"]:
+        try:
+            re.compile(config["charts"]["match"])
+        except re.error as e:
+            raise ValueError(f"charts.match 不是有效的正規表示式: {e}")
+    for key in ("lines", "bucket", "cache_size", "max_renders", "max_queue", "processes", "width", "height"):
+        _check_number(config, f"charts.{key}", 1, integer=True)
+    _check_number(config, "charts.timeout", 0, exclusive=True)
+
+    _check_number(config, "shards.workers", 0, integer=True)
+    _check_number(config, "shards.interval", 0, exclusive=True)
+    _check_number(config, "shards.replicas", 1, integer=True)
+
+    for key in ("session_interval", "idle_interval"):
+        _check_number(config, f"schedule.{key}", 0, exclusive=True)
+    if not isinstance(config["schedule"]["sessions"], list) or not config["schedule"]["sessions"]:
+        raise ValueError("schedule.sessions 必須是非空的列表")
+    if not isinstance(config["schedule"]["weekdays"], list) or not config["schedule"]["weekdays"] or not all(
+        day in range(1, 8) for day in config["schedule"]["weekdays"]
+    ):
+        raise ValueError("schedule.weekdays 必須是 1 (星期一) 到 7 (星期日) 的列表")
+    if not isinstance(config["schedule"]["holidays"], list):
+        raise ValueError("schedule.holidays 必須是列表")
+
+    # 路由、規則與交易時段實際建立一次，確保格式正確
+    build_router(config)
+    build_rule_engine(config)
+    TradingCalendar(config["schedule"]["sessions"], config["schedule"]["weekdays"], config["schedule"]["holidays"])
+
+def _check_number(config, name, minimum, maximum=None, integer=False, exclusive=False):
+    """
+    檢查 "section.key" 是否為數值且不小於 minimum（exclusive 時必須大於 minimum）
+
+    integer 為 True 時只接受整數；JSON 的 true/false 不算數值。
+    """
+    value = config_value(config, name)
+    valid = isinstance(value, int if integer else (int, float)) and not isinstance(value, bool)
+    if valid:
+        valid = value > minimum if exclusive else value >= minimum
+    if valid and maximum is not None:
+        valid = value <= maximum
+    if not valid:
+        kind = "整數" if integer else "數值"
+        limit = f"大於 {minimum}" if exclusive else f"不小於 {minimum}"
+        if maximum is not None:
+            limit += f" 且不大於 {maximum}"
+        raise ValueError(f"{name} 必須是{limit}的{kind}")
+
+def watch_directories(config):
+    """設定中的監控目錄列表"""
+    directories = config.get("watch_directories") or config["watch_directory"]
+    return list(directories) if isinstance(directories, (list, tuple)) else [directories]
+
+def build_router(config):
+    return Router.from_config(config.get("routes"), config.get("telegram_chat_id"))
+
+def build_rule_engine(config):
+    return RuleEngine.from_config(config.get("parsers"), config.get("rules"))
+
+def config_value(config, name):
+    """以 "section.key" 取得巢狀設定值"""
+    value = config
+    for part in name.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+def write_default_config(config_file):
+    """建立範例設定檔"""
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(DEFAULT_CONFIG, f, indent=2, ensure_ascii=False)
+
+class ConfigWatcher:
+    """
+    監看設定檔，內容變更時重新載入並套用
+
+    每隔 interval 秒檢查一次修改時間；新的設定無效時保留目前設定並記錄錯誤。
+    """
+
+    def __init__(self, config_file, config, apply, interval=2):
+        self.config_file = config_file
+        self.config = config
+        self.apply = apply  # async def apply(new_config)
+        self.interval = interval
+        self.mtime_ns = self._mtime_ns()
+
+    def _mtime_ns(self):
+        try:
+            return os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            return None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            mtime_ns = self._mtime_ns()
+            if mtime_ns is None or mtime_ns == self.mtime_ns:
+                continue
+            self.mtime_ns = mtime_ns
+            await self.reload()
+
+    async def reload(self):
+        """重新載入設定；成功回傳 True"""
+        try:
+            new_config = load_config(self.config_file)
+        except Exception as e:
+            logger.error(f"設定檔有誤，維持目前設定: {e}")
+            return False
+
+        if new_config == self.config:
+            return True
+
+        for key in RESTART_REQUIRED:
+            if config_value(new_config, key) != config_value(self.config, key):
+                logger.warning(f"設定 {key} 已變更，需重新啟動服務才會生效")
+
+        try:
+            await self.apply(new_config)
+        except Exception as e:
+            logger.error(f"套用新設定時發生錯誤，維持目前設定: {e}")
+            return False
+
+        self.config = new_config
+        logger.info("已套用新的設定檔")
+        return True
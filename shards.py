@@ -0,0 +1,403 @@
+"""
+多行程分片監控
+
+商品數量很多時（例如上市櫃全部 2000 多檔），單一事件迴圈逐一掃描所有 .log 檔會成為瓶頸。
+分片模式以檔名的一致性雜湊把檔案分配給 N 個工作行程：每個工作行程只列出目錄並對
+自己負責的檔案取得 stat 與讀取新增內容，把結果送回主行程；主行程以單一的調度器依序
+套用規則、記錄 journal 並發送，通知與檔案位移仍在同一次提交中寫入。
+
+工作行程結束時，它負責的檔案由其他工作行程接手；重新啟動後再移回（一致性雜湊只
+移動該分片的檔案）。每個分片的掃描次數、耗時、讀取量與通知行數都會回報。
+"""
+import os
+import time
+import queue
+import bisect
+import asyncio
+import hashlib
+import logging
+import threading
+import multiprocessing
+from pathlib import Path
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+REPORTED_COUNTERS = ('bytes_read', 'files_reset')  # 工作行程內累加、需轉交主行程的指標
+
+def hash_key(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+class HashRing:
+    """一致性雜湊環：每個分片在環上有 replicas 個虛擬節點，檔名對應到順時針的下一個節點"""
+
+    def __init__(self, shards, replicas=100):
+        points = sorted((hash_key(f"shard-{shard}#{i}"), shard) for shard in shards for i in range(replicas))
+        self.keys = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def shard_for(self, file_name):
+        if not self.keys:
+            return None
+        index = bisect.bisect(self.keys, hash_key(file_name)) % len(self.keys)
+        return self.shards[index]
+
+class ShardCoordinator:
+    """
+    啟動並監督分片工作行程，把它們的結果交給監控程式依序處理
+
+    每個工作行程有一個遞增的世代編號（incarnation）；結果只有來自檔案目前的負責分片、
+    且世代相符時才會處理，重新分配前已送出的舊結果會被丟棄，由新的負責分片從主行程
+    記錄的位移重新讀取，不會重複也不會遺漏。
+    """
+
+    def __init__(self, monitor, workers=4, interval=1.0, replicas=100, ready_timeout=15):
+        self.monitor = monitor
+        self.worker_count = workers
+        self.base_interval = interval  # 未啟用交易時段排程時的掃描間隔
+        self.interval = interval
+        self.replicas = replicas
+        self.ready_timeout = ready_timeout
+        # 主行程有多個執行緒與開啟中的資料庫，一律以 spawn 啟動工作行程
+        self.context = multiprocessing.get_context("spawn")
+        self.results = self.context.Queue()
+        self.processes = {}  # 分片 -> 工作行程
+        self.controls = {}  # 分片 -> 控制佇列
+        self.incarnations = {}  # 分片 -> 目前的世代
+        self.live = set()  # 已就緒的分片
+        self.ring = HashRing([], replicas)
+        self.restart_at = {}  # 分片 -> 下次可重新啟動的時間
+        self.restart_delay = {}
+        self.inbox = None
+        self.receiver = None
+        self.dispatcher = None
+        self.all_ready = None
+        self.paused = False
+        self.stats = {shard: _empty_stats() for shard in range(workers)}
+        self.last_report = (time.monotonic(), {})
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.inbox = asyncio.Queue()
+        self.all_ready = asyncio.Event()
+        self.receiver = threading.Thread(
+            target=self.receive, args=(loop,), name="xq-shard-receiver", daemon=True
+        )
+        self.receiver.start()
+        self.dispatcher = asyncio.create_task(self.dispatch())
+
+        for shard in range(self.worker_count):
+            self.spawn(shard)
+        try:
+            await asyncio.wait_for(self.all_ready.wait(), self.ready_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"部分分片未在 {self.ready_timeout} 秒內就緒: {len(self.live)}/{self.worker_count}")
+        self.rebalance()
+        logger.info(f"分片模式已啟動: {self.worker_count} 個工作行程")
+
+    async def stop(self):
+        for control in self.controls.values():
+            control.put(('stop',))
+        for shard, process in self.processes.items():
+            await asyncio.get_running_loop().run_in_executor(None, process.join, 5)
+            if process.is_alive():
+                logger.warning(f"分片 {shard} 未正常結束，強制終止")
+                process.terminate()
+        self.results.put(None)  # 結束接收執行緒
+        if self.dispatcher:
+            self.dispatcher.cancel()
+            await asyncio.gather(self.dispatcher, return_exceptions=True)
+        # 尚未處理的結果直接捨棄：位移沒有前進，下次啟動會重新讀取
+        self.processes = {}
+        self.controls = {}
+        self.live.clear()
+
+    def spawn(self, shard):
+        incarnation = self.incarnations.get(shard, 0) + 1
+        self.incarnations[shard] = incarnation
+        control = self.context.Queue()
+        process = self.context.Process(
+            target=run_shard,
+            args=(shard, incarnation, control, self.results, self.monitor.settle_tracker.settle_window,
+                  self.monitor.tail_buffer, self.interval, self.replicas),
+            name=f"xq-shard-{shard}", daemon=True
+        )
+        process.start()
+        self.processes[shard] = process
+        self.controls[shard] = control
+
+    def receive(self, loop):
+        """在獨立執行緒中讀取工作行程的結果，轉交給事件迴圈"""
+        while True:
+            message = self.results.get()
+            if message is None:
+                return
+            loop.call_soon_threadsafe(self.inbox.put_nowait, message)
+
+    async def dispatch(self):
+        """依到達順序處理所有分片的結果"""
+        monitor = self.monitor
+        while True:
+            message = await self.inbox.get()
+            kind, shard, incarnation = message[:3]
+            if incarnation != self.incarnations.get(shard):
+                metrics.shard_stale_results.inc()
+                continue  # 已結束的工作行程留下的結果
+            try:
+                if kind == 'changes':
+                    file_key, new_lines, new_state, is_new_file, detected_at = message[3:]
+                    if self.ring.shard_for(Path(file_key).name) != shard or shard not in self.live:
+                        metrics.shard_stale_results.inc()
+                        continue  # 檔案已分配給其他分片
+                    self.stats[shard]['lines'] += len(new_lines)
+                    metrics.shard_lines.inc(len(new_lines), shard=str(shard))
+                    lock = monitor.file_locks.setdefault(file_key, asyncio.Lock())
+                    async with lock:
+                        await monitor.handle_changes(
+                            Path(file_key), file_key, new_lines, new_state, is_new_file, detected_at
+                        )
+                elif kind == 'scan':
+                    self.record_scan(shard, message[3])
+                elif kind == 'deleted':
+                    await monitor.forget_deleted_files(message[3])
+                elif kind == 'ready':
+                    self.live.add(shard)
+                    self.restart_delay.pop(shard, None)
+                    if self.all_ready.is_set():
+                        logger.info(f"分片 {shard} 已重新啟動，重新分配檔案")
+                        self.rebalance()
+                    elif len(self.live) == self.worker_count:
+                        self.all_ready.set()
+            except Exception as e:
+                logger.error(f"處理分片 {shard} 的結果時發生錯誤: {e}")
+
+    def rebalance(self):
+        """依目前就緒的分片重新建立雜湊環，並把各分片新負責的檔案狀態交給它"""
+        self.ring = HashRing(sorted(self.live), self.replicas)
+        assigned = {shard: {} for shard in self.live}
+        for file_key, state in self.monitor.file_states.items():
+            shard = self.ring.shard_for(Path(file_key).name)
+            if shard is not None:
+                assigned[shard][file_key] = state
+        directories = [str(directory) for directory in self.monitor.watch_directories]
+        for shard in self.live:
+            self.controls[shard].put(('assign', sorted(self.live), assigned[shard], directories, self.paused))
+        metrics.shard_rebalances.inc()
+        logger.info("分片檔案分配: " + ", ".join(
+            f"{shard}={len(files)}" for shard, files in sorted(assigned.items())
+        ))
+
+    def supervise(self):
+        """重新啟動已結束的工作行程，並同步暫停狀態與掃描間隔（由監控迴圈每秒呼叫）"""
+        now = time.monotonic()
+        for shard, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            if shard in self.live:
+                self.live.discard(shard)
+                self.rebalance()
+            if shard not in self.restart_at:
+                # 連續失敗時拉長重新啟動的間隔
+                self.restart_delay[shard] = min(self.restart_delay.get(shard, 0.5) * 2, 60)
+                self.restart_at[shard] = now + self.restart_delay[shard]
+                logger.error(
+                    f"分片 {shard} 已結束 (exit code {process.exitcode})，由其他分片接手，"
+                    f"{self.restart_delay[shard]:.0f} 秒後重新啟動"
+                )
+            elif now >= self.restart_at[shard]:
+                del self.restart_at[shard]
+                self.stats[shard]['restarts'] += 1
+                metrics.shard_restarts.inc(shard=str(shard))
+                self.spawn(shard)
+
+        # 交易時段外暫停掃描時與暫停相同：工作行程保留位移，恢復後補上期間的內容
+        paused = not self.monitor.should_scan()
+        if paused != self.paused:
+            self.paused = paused
+            for control in self.controls.values():
+                control.put(('pause', self.paused))
+        interval = self.monitor.scan_interval(self.base_interval)
+        if interval != self.interval:
+            self.interval = interval
+            for control in self.controls.values():
+                control.put(('interval', self.interval))
+
+    def record_scan(self, shard, report):
+        stats = self.stats[shard]
+        stats['scans'] += 1
+        stats['scan_seconds'] += report['seconds']
+        stats['files'] = report['files']
+        stats['bytes'] += report['counters'].get('bytes_read', 0)
+        metrics.shard_scans.inc(shard=str(shard))
+        metrics.shard_scan_seconds.inc(report['seconds'], shard=str(shard))
+        metrics.scan_duration.observe(report['seconds'])
+        metrics.files_scanned.inc(report['files'])
+        for name, values in report['counters'].items():
+            counter = getattr(metrics, name)
+            if isinstance(values, dict):
+                for reason, amount in values.items():
+                    counter.inc(amount, reason=reason)
+            else:
+                counter.inc(values)
+
+    def summary(self):
+        """各分片自上次呼叫以來的吞吐量"""
+        now = time.monotonic()
+        last_time, last_stats = self.last_report
+        elapsed = max(now - last_time, 1e-9)
+        results = []
+        for shard, stats in sorted(self.stats.items()):
+            previous = last_stats.get(shard, _empty_stats())
+            scans = stats['scans'] - previous['scans']
+            results.append({
+                'shard': shard,
+                'live': shard in self.live,
+                'files': stats['files'],
+                'scan_ms': (stats['scan_seconds'] - previous['scan_seconds']) / scans * 1000 if scans else 0,
+                'lines_per_sec': (stats['lines'] - previous['lines']) / elapsed,
+                'bytes_per_sec': (stats['bytes'] - previous['bytes']) / elapsed,
+                'restarts': stats['restarts']
+            })
+        self.last_report = (now, {shard: dict(stats) for shard, stats in self.stats.items()})
+        return results
+
+    def status(self):
+        """各分片的累計統計，供狀態查詢"""
+        return [
+            dict(stats, shard=shard, live=shard in self.live, pid=self.processes[shard].pid if shard in self.processes else None)
+            for shard, stats in sorted(self.stats.items())
+        ]
+
+    def log_summary(self):
+        for item in self.summary():
+            logger.info(
+                f"分片 {item['shard']}{'' if item['live'] else ' (離線)'}: {item['files']} 個檔案, "
+                f"掃描 {item['scan_ms']:.1f}ms, {item['lines_per_sec']:.1f} 行/秒, "
+                f"{item['bytes_per_sec'] / 1024:.1f} KB/秒, 重新啟動 {item['restarts']} 次"
+            )
+
+def _empty_stats():
+    return {'files': 0, 'scans': 0, 'scan_seconds': 0.0, 'lines': 0, 'bytes': 0, 'restarts': 0}
+
+def run_shard(shard, incarnation, control, results, settle_window, tail_buffer, interval, replicas):
+    """
+    分片工作行程：只處理雜湊環分配給自己的檔案
+
+    每次掃描只列出目錄（不呼叫 stat），對自己負責的檔案取得 stat 並讀取新增內容，
+    依序送回主行程；自己負責的檔案狀態保存在記憶體，重新分配時由主行程提供。
+    """
+    # 延遲匯入，避免主行程匯入本模組時循環匯入
+    from XQTelegramNotifier import (
+        SettleTracker, file_changed, list_log_files, read_appended_lines, scan_directories, stat_files
+    )
+
+    tracker = SettleTracker(settle_window)
+    ring = None
+    states = {}
+    directories = []
+    paused = False
+    last_counters = _counter_snapshot()
+    next_scan = time.monotonic()
+    results.put(('ready', shard, incarnation))
+
+    while True:
+        # 等到下次掃描的時間，期間隨時處理主行程的指令（還沒被分配檔案前不掃描）
+        try:
+            while True:
+                message = control.get(timeout=max(0.0, next_scan - time.monotonic()))
+                if message[0] == 'stop':
+                    return
+                if message[0] == 'pause':
+                    paused = message[1]
+                elif message[0] == 'interval':
+                    # 間隔縮短時（例如進入交易時段）提前下次掃描
+                    interval = message[1]
+                    next_scan = min(next_scan, time.monotonic() + interval)
+                elif message[0] == 'assign':
+                    live, assigned, directories, paused = message[1:]
+                    ring = HashRing(live, replicas)
+                    states = {
+                        key: state for key, state in states.items()
+                        if ring.shard_for(Path(key).name) == shard and os.path.dirname(key) in directories
+                    }
+                    for file_key, state in assigned.items():
+                        if file_key not in states:
+                            states[file_key] = state  # 新分配到的檔案，從主行程記錄的位移開始
+        except queue.Empty:
+            pass
+        started = time.monotonic()
+        next_scan = started + interval
+        if ring is None:
+            continue
+
+        if not paused:
+            file_paths = scan_directories(directories, list_log_files)
+            owned = [file_path for file_path in file_paths if ring.shard_for(file_path.name) == shard]
+            seen = set()
+            for file_path, stat in stat_files(owned):
+                file_key = str(file_path)
+                seen.add(file_key)
+                state = states.get(file_key)
+                is_new_file = file_changed(state, stat)
+                if is_new_file is None:
+                    continue
+                detected_at = time.time()
+                # 一次新增的內容超過 tail_buffer 時分段讀取，每段各自送回主行程
+                while True:
+                    try:
+                        settled = tracker.is_settled(file_key, stat)
+                        new_lines, new_state = read_appended_lines(
+                            file_path, state, include_partial=settled, tail_buffer=tail_buffer
+                        )
+                    except OSError as e:
+                        logger.error(f"讀取檔案失敗: {file_path.name} - {e}")
+                        break
+                    if is_new_file and not new_lines and new_state['offset'] < stat.st_size:
+                        break  # 新檔案仍在寫入中，下次再處理
+                    if new_state != state:
+                        states[file_key] = new_state
+                        results.put((
+                            'changes', shard, incarnation, file_key, new_lines, new_state, is_new_file, detected_at
+                        ))
+                    if new_state['offset'] >= stat.st_size:
+                        tracker.clear(file_key)
+                        break
+                    if state is not None and new_state['offset'] == state['offset']:
+                        break  # 只剩未完成的行
+                    state, is_new_file = new_state, False
+
+            deleted = [
+                key for key in states
+                if key not in seen and os.path.dirname(key) in directories and os.path.isdir(os.path.dirname(key))
+            ]
+            for file_key in deleted:
+                del states[file_key]
+                tracker.clear(file_key)
+            if deleted:
+                results.put(('deleted', shard, incarnation, deleted))
+
+            counters = _counter_snapshot()
+            results.put(('scan', shard, incarnation, {
+                'seconds': time.monotonic() - started,
+                'files': len(owned),
+                'counters': _counter_delta(last_counters, counters)
+            }))
+            last_counters = counters
+
+def _counter_snapshot():
+    return {name: dict(getattr(metrics, name).values) for name in REPORTED_COUNTERS}
+
+def _counter_delta(before, after):
+    """兩次快照之間各計數器的增加量；有 reason 標籤的計數器回傳 {reason: 增加量}"""
+    delta = {}
+    for name, values in after.items():
+        changes = {key: value - before[name].get(key, 0) for key, value in values.items()}
+        changes = {key: value for key, value in changes.items() if value}
+        if not changes:
+            continue
+        if all(key == () for key in changes):
+            delta[name] = changes[()]
+        else:
+            delta[name] = {dict(key).get('reason', ''): value for key, value in changes.items()}
+    return delta
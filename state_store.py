@@ -0,0 +1,167 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+class FileStateStore:
+    """
+    以 SQLite (WAL 模式) 儲存每個檔案的精簡狀態
+
+    每個檔案只記錄 offset、size、mtime_ns、inode、最後一行的雜湊與偵測到的編碼，
+    不再保存完整內容；更新先累積在記憶體，flush 時以單一交易寫入。
+    連線與通知日誌共用，日誌在寫入執行緒中提交，使用連線前需持有 lock。
+    """
+
+    FIELDS = ('offset', 'size', 'mtime_ns', 'inode', 'last_line_hash', 'encoding', 'tail_hash')
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.pending = {}  # 尚未寫入的更新
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_states ("
+            "file_key TEXT PRIMARY KEY, offset INTEGER, size INTEGER, "
+            "mtime_ns INTEGER, inode INTEGER, last_line_hash TEXT, encoding TEXT, tail_hash TEXT)"
+        )
+        # 舊版資料庫沒有 encoding、tail_hash 欄位
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(file_states)")}
+        for column in ('encoding', 'tail_hash'):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE file_states ADD COLUMN {column} TEXT")
+        self.conn.commit()
+
+    def load(self):
+        """載入所有檔案狀態，回傳 {file_key: 狀態}"""
+        states = {}
+        with self.lock:
+            for row in self.conn.execute(f"SELECT file_key, {', '.join(self.FIELDS)} FROM file_states"):
+                states[row[0]] = dict(zip(self.FIELDS, row[1:]))
+        return states
+
+    def update(self, file_key, state):
+        """記錄一筆待寫入的狀態更新"""
+        self.pending[file_key] = state
+
+    def delete(self, file_key):
+        """記錄一筆待刪除的狀態"""
+        self.pending[file_key] = None
+
+    def flush(self):
+        """將累積的更新以單一交易寫入，回傳寫入筆數；寫入失敗時更新保留到下次"""
+        pending = self.take_pending()
+        try:
+            with self.lock, self.conn:
+                return self.write_states(pending)
+        except Exception:
+            self.restore_pending(pending)
+            raise
+
+    def take_pending(self):
+        """取出累積的更新；交易失敗時需以 restore_pending 放回"""
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def restore_pending(self, pending):
+        """放回寫入失敗的更新，取出之後才記錄的更新較新，優先保留"""
+        self.pending = {**pending, **self.pending}
+
+    def write_states(self, pending):
+        """在目前的交易中寫入更新（由呼叫端持有 lock 並提交），回傳寫入筆數"""
+        if not pending:
+            return 0
+
+        upserts = [
+            (key,) + tuple(state.get(field) for field in self.FIELDS)
+            for key, state in pending.items() if state is not None
+        ]
+        deletes = [(key,) for key, state in pending.items() if state is None]
+        if upserts:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO file_states (file_key, {', '.join(self.FIELDS)}) "
+                f"VALUES (?{', ?' * len(self.FIELDS)})",
+                upserts
+            )
+        if deletes:
+            self.conn.executemany("DELETE FROM file_states WHERE file_key = ?", deletes)
+        return len(pending)
+
+    def close(self):
+        """寫入剩餘更新並關閉資料庫"""
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+
+    def migrate_from_json(self, json_path):
+        """
+        從舊版 .xq_file_states.json 一次性轉移狀態
+
+        舊格式保存完整內容，這裡只用它推算位移；轉移完成後把 JSON 改名為
+        .migrated，避免重複轉移。回傳轉移的檔案數。
+        """
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return 0
+
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                old_states = json.load(f)
+        except Exception as e:
+            logger.error(f"讀取舊版狀態檔案失敗，略過轉移: {e}")
+            return 0
+
+        migrated = 0
+        for file_key, old_state in old_states.items():
+            try:
+                stat = os.stat(file_key)
+            except OSError:
+                continue  # 檔案已不存在
+
+            self.update(file_key, {
+                'offset': _legacy_offset(file_key, old_state, stat),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'inode': stat.st_ino,
+                'last_line_hash': None,
+                'encoding': None,
+                'tail_hash': None
+            })
+            migrated += 1
+
+        self.flush()
+        json_path.replace(json_path.with_name(json_path.name + '.migrated'))
+        logger.info(f"已從舊版狀態檔案轉移 {migrated} 個檔案")
+        return migrated
+
+def _legacy_offset(file_key, old_state, stat):
+    """由舊版狀態推算已處理到的位元組位移"""
+    if 'offset' in old_state:
+        return old_state['offset']
+
+    content = old_state.get('content', '')
+    if not content or stat.st_mtime <= old_state.get('modified', 0):
+        # 檔案沒有變更，視為已處理到結尾
+        return stat.st_size
+
+    # 檔案在停機期間有更新：找出舊內容結束的位置，之後的內容才算新增。
+    # 舊版以文字模式讀取，\r\n 已變成 \n；XQ 在 Windows 寫入的是 \r\n，兩種都要比對
+    with open(file_key, 'rb') as f:
+        data = f.read()
+    for encoding in ('utf-8', 'big5'):
+        try:
+            encoded = content.encode(encoding)
+        except UnicodeEncodeError:
+            continue
+        for candidate in (encoded.replace(b'\n', b'\r\n'), encoded):
+            index = data.find(candidate)
+            if index >= 0:
+                return index + len(candidate)
+    logger.warning(f"找不到舊版狀態記錄的內容，停機期間的新增內容不會推播: {Path(file_key).name}")
+    return stat.st_size
@@ -0,0 +1,120 @@
+import os
+import copy
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+import settings
+from XQTelegramNotifier import XQDirectoryMonitor
+
+class ApplyConfigTest(unittest.TestCase):
+    """重新載入設定時，任何一步失敗都維持目前的設定"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+        self.watch = self.root / "local"
+        self.watch.mkdir()
+        self.config = copy.deepcopy(settings.DEFAULT_CONFIG)
+        self.config.update(telegram_bot_token="1:token", telegram_chat_id="100", watch_directory=str(self.watch))
+        self.monitor = XQDirectoryMonitor(
+            None, "100", self.watch, router=settings.build_router(self.config),
+            dedup_options=self.config["dedup"]
+        )
+
+    def tearDown(self):
+        self.monitor.executor.shutdown()
+        self.directory.cleanup()
+
+    def reload(self, **changes):
+        config = copy.deepcopy(self.config)
+        config.update(changes)
+        asyncio.run(self.monitor.apply_config(config))
+
+    def assert_unchanged(self, router, deduplicator):
+        self.assertEqual(self.monitor.chat_id, "100")
+        self.assertIs(self.monitor.router, router)
+        self.assertIs(self.monitor.deduplicator, deduplicator)
+        self.assertEqual(self.monitor.deduplicator.ttl, 60)
+        self.assertIsNone(self.monitor.schedule)
+        self.assertEqual(self.monitor.watch_directories, [self.watch])
+
+    def test_bad_directory_keeps_current_config(self):
+        blocker = self.root / "blocker"
+        blocker.write_text("not a directory")
+        router, deduplicator = self.monitor.router, self.monitor.deduplicator
+        with self.assertRaises(OSError):
+            self.reload(
+                telegram_chat_id="200", dedup=dict(self.config["dedup"], ttl=5),
+                schedule=dict(self.config["schedule"], enabled=True),
+                watch_directories=[str(self.watch), str(blocker / "sub")]
+            )
+        self.assert_unchanged(router, deduplicator)
+
+    def test_bad_dedup_option_keeps_current_config(self):
+        router, deduplicator = self.monitor.router, self.monitor.deduplicator
+        with self.assertRaises(TypeError):
+            self.reload(telegram_chat_id="200", dedup=dict(self.config["dedup"], unknown=1))
+        self.assert_unchanged(router, deduplicator)
+
+    def test_added_directory_records_existing_files(self):
+        extra = self.root / "extra"
+        extra.mkdir()
+        (extra / "2330.TW.log").write_text("old\n")
+        self.reload(telegram_chat_id="200", watch_directories=[str(self.watch), str(extra)])
+        self.assertEqual(self.monitor.chat_id, "200")
+        self.assertEqual(self.monitor.watch_directories, [self.watch, extra])
+        state = self.monitor.file_states[str(extra / "2330.TW.log")]
+        self.assertEqual(state['offset'], os.path.getsize(extra / "2330.TW.log"))
+
+class ValidateConfigTest(unittest.TestCase):
+    """設定檔中的未知設定與超出範圍的數值在載入時就被拒絕"""
+
+    def setUp(self):
+        self.config = copy.deepcopy(settings.DEFAULT_CONFIG)
+        self.config.update(telegram_bot_token="1:token", telegram_chat_id="100")
+
+    def assert_rejected(self, section, **changes):
+        config = copy.deepcopy(self.config)
+        config[section].update(changes)
+        with self.assertRaises(ValueError):
+            settings.validate_config(config)
+
+    def test_default_config_is_valid(self):
+        settings.validate_config(self.config)
+
+    def test_unknown_keys_are_rejected(self):
+        for section, defaults in settings.DEFAULT_CONFIG.items():
+            if isinstance(defaults, dict):
+                with self.subTest(section=section):
+                    self.assert_rejected(section, unknown=1)
+        with self.assertRaisesRegex(ValueError, "ttl_seconds"):
+            settings.validate_config(dict(self.config, dedup=dict(self.config["dedup"], ttl_seconds=5)))
+
+    def test_invalid_values_are_rejected(self):
+        cases = [
+            ("sender", "workers", 0), ("sender", "workers", 1.5), ("sender", "queue_size", 0),
+            ("sender", "max_retries", -1), ("sender", "max_retries", "5"),
+            ("batching", "enabled", "yes"), ("batching", "window", 0), ("batching", "max_lines", 0),
+            ("batching", "max_chars", 5000), ("batching", "max_chars", 100), ("batching", "max_latency", -1),
+            ("dedup", "ttl", 0), ("dedup", "max_entries", True), ("dedup", "key", "line"),
+            ("journal", "retention", -1), ("metrics", "port", 70000), ("metrics", "port", "9108"),
+            ("service", "control_port", -1), ("service", "control_port", 1.5),
+        ]
+        for section, key, value in cases:
+            with self.subTest(section=section, key=key, value=value):
+                self.assert_rejected(section, **{key: value})
+
+    def test_load_config_rejects_unknown_key(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config_file = Path(directory) / "config.json"
+            config_file.write_text(
+                '{"telegram_bot_token": "1:token", "telegram_chat_id": "100", "sender": {"worker": 8}}',
+                encoding="utf-8"
+            )
+            with self.assertRaisesRegex(ValueError, "sender"):
+                settings.load_config(config_file)
+
+if __name__ == "__main__":
+    unittest.main()
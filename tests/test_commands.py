@@ -0,0 +1,148 @@
+import time
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+from routing import Router
+from archive import AlertArchive
+from commands import BotCommands, LocalUpdateSource
+from XQTelegramNotifier import XQDirectoryMonitor
+
+class FakeSender:
+    def __init__(self):
+        self.replies = []
+
+    async def enqueue(self, chat_id, text, *args, **kwargs):
+        self.replies.append((chat_id, text))
+
+class FakeJournal:
+    def __init__(self):
+        self.seq = 0
+
+    def append(self, *args):
+        self.seq += 1
+        return self.seq
+
+class BotCommandsTest(unittest.TestCase):
+    """以 LocalUpdateSource 模擬 Telegram 的 getUpdates 測試 Bot 指令"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.monitor = XQDirectoryMonitor(
+            None, "100", Path(self.directory.name), router=Router.from_config(None, "100"),
+            dedup_options={'enabled': False}
+        )
+        self.monitor.sender = FakeSender()
+        self.source = LocalUpdateSource()
+        self.commands = BotCommands(self.monitor, self.source, allowed_chat_ids=[200], poll_timeout=1)
+
+    def tearDown(self):
+        self.monitor.executor.shutdown()
+        self.directory.cleanup()
+
+    def run_updates(self, *updates):
+        """放入訊息，等指令處理完畢後回傳回覆"""
+        async def scenario():
+            self.commands.start()
+            for update in updates:
+                self.source.push(*update)
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if self.commands.offset == self.source.next_id:
+                    break
+            await self.commands.stop()
+
+        asyncio.run(scenario())
+        return self.monitor.sender.replies
+
+    def test_status_and_help(self):
+        replies = self.run_updates((100, "/status"), (200, "/help@XQBot"))
+        self.assertEqual([chat_id for chat_id, _ in replies], [100, 200])
+        self.assertIn("監控中", replies[0][1])
+        self.assertIn("/mute", replies[1][1])
+
+    def test_ignores_unauthorized_stale_and_plain_messages(self):
+        replies = self.run_updates((999, "/status"), (100, "/stats", time.time() - 600), (100, "hello"))
+        self.assertEqual(replies, [])
+        self.assertEqual(self.commands.offset, 4)  # 略過的訊息仍然確認
+
+    def test_mute_and_unmute(self):
+        replies = self.run_updates((100, "/mute 2330.TW 5"), (100, "/mute"), (100, "/unmute 2330.TW"))
+        self.assertIn("2330.TW 靜音至", replies[0][1])
+        self.assertIn("2330.TW 至", replies[1][1])
+        self.assertIn("已取消靜音", replies[2][1])
+        self.assertEqual(self.monitor.active_mutes(), {})
+
+    def test_last_without_alerts(self):
+        replies = self.run_updates((100, "/last 3"), (100, "/last x"))
+        self.assertEqual([text for _, text in replies], ["目前沒有通知紀錄", "用法: /last <n>"])
+
+    def test_offsets_acknowledge_previous_updates(self):
+        async def scenario():
+            self.source.push(100, "a")
+            first = await self.source.get_updates(None, 0)
+            self.source.push(100, "b")
+            second = await self.source.get_updates(first[-1][0] + 1, 0)
+            third = await self.source.get_updates(second[-1][0] + 1, 0.05)
+            return first, second, third
+
+        first, second, third = asyncio.run(scenario())
+        self.assertEqual([update[2] for update in first], ["a"])
+        self.assertEqual([update[2] for update in second], ["b"])
+        self.assertEqual(third, [])
+        self.assertEqual(self.source.offsets, [None, 2, 3])
+
+class LastCommandRoutingTest(unittest.TestCase):
+    """/last 只列出送到提出指令的聊天室的通知"""
+
+    ROUTES = [
+        {"name": "tw", "pattern": "*.TW.log", "chat_ids": [100]},
+        {"name": "us", "pattern": "*.US.log", "chat_ids": [200]},
+        {"name": "etf", "pattern": "0050.TW.log", "chat_ids": [200]}
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+        self.monitor = XQDirectoryMonitor(
+            None, None, self.root, router=Router.from_config(self.ROUTES), dedup_options={'enabled': False}
+        )
+        self.monitor.journal = FakeJournal()
+        self.commands = BotCommands(self.monitor, LocalUpdateSource())
+
+    def tearDown(self):
+        if self.monitor.archive:
+            self.monitor.archive.close()
+        self.monitor.executor.shutdown()
+        self.directory.cleanup()
+
+    def alert(self, file_name, line):
+        self.monitor.prepare_alerts(self.root / file_name, line, False, time.time())
+
+    def check_last(self):
+        self.alert("2330.TW.log", "tw alert")
+        self.alert("AAPL.US.log", "us alert")
+        self.alert("0050.TW.log", "both alert")
+        tw = self.commands.execute(100, "last", ["10"])
+        us = self.commands.execute(200, "last", ["10"])
+        self.assertIn("tw alert", tw)
+        self.assertIn("both alert", tw)
+        self.assertNotIn("us alert", tw)
+        self.assertIn("us alert", us)
+        self.assertIn("both alert", us)
+        self.assertNotIn("tw alert", us)
+        self.assertEqual(self.commands.execute(300, "last", []), "目前沒有通知紀錄")
+
+    def test_last_from_archive(self):
+        self.monitor.archive = AlertArchive(self.root / ".xq_archive.db")
+        self.check_last()
+        self.monitor.recent_alerts.clear()  # 確認結果來自歷史資料庫
+        self.assertNotIn("us alert", self.commands.execute(100, "last", ["10"]))
+        self.assertIn("tw alert", self.commands.execute(100, "last", ["10"]))
+
+    def test_last_from_recent_alerts(self):
+        self.check_last()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from dedup import AlertDeduplicator
+
+class AlertDeduplicatorTest(unittest.TestCase):
+    """重複通知過濾：LRU 淘汰與以目前 ttl 判斷的到期時間"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / ".xq_dedup.json"
+        self.now = 1000.0
+        patcher = mock.patch("dedup.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def seen(self, deduplicator, line):
+        return deduplicator.is_duplicate("2330.TW.log", line)
+
+    def test_hit_keeps_entry_over_least_recently_seen(self):
+        deduplicator = AlertDeduplicator(self.path, ttl=60, max_entries=2)
+        self.assertFalse(self.seen(deduplicator, "a"))
+        self.assertFalse(self.seen(deduplicator, "b"))
+        self.assertTrue(self.seen(deduplicator, "a"))  # a 移到最後，b 成為最久沒有出現的
+        self.assertFalse(self.seen(deduplicator, "c"))
+        self.assertTrue(self.seen(deduplicator, "a"))
+        self.assertFalse(self.seen(deduplicator, "b"))
+        self.assertEqual(deduplicator.suppressed, 2)
+
+    def test_expiry_uses_first_seen_time(self):
+        deduplicator = AlertDeduplicator(self.path, ttl=60)
+        self.seen(deduplicator, "a")
+        self.now += 30
+        self.seen(deduplicator, "b")
+        self.assertTrue(self.seen(deduplicator, "a"))  # a 移到 b 之後
+        self.now += 31
+        self.assertFalse(self.seen(deduplicator, "a"))  # 第一次出現已超過 60 秒
+        self.assertTrue(self.seen(deduplicator, "b"))
+
+    def test_ttl_change_applies_to_existing_entries(self):
+        deduplicator = AlertDeduplicator(self.path, ttl=60)
+        self.seen(deduplicator, "a")
+        self.seen(deduplicator, "b")
+        self.now += 10
+        deduplicator.configure(5, 10000)
+        self.assertEqual(len(deduplicator.entries), 0)
+        self.assertFalse(self.seen(deduplicator, "a"))
+
+        deduplicator.configure(120, 10000)
+        self.now += 100
+        self.assertTrue(self.seen(deduplicator, "a"))
+
+    def test_lower_max_entries_evicts_least_recently_seen(self):
+        deduplicator = AlertDeduplicator(self.path, ttl=60)
+        for line in ("a", "b", "c"):
+            self.seen(deduplicator, line)
+        self.seen(deduplicator, "a")
+        deduplicator.configure(60, 2)
+        self.assertTrue(self.seen(deduplicator, "a"))
+        self.assertTrue(self.seen(deduplicator, "c"))
+        self.assertFalse(self.seen(deduplicator, "b"))
+
+    def test_save_and_load_keep_unexpired_entries(self):
+        deduplicator = AlertDeduplicator(self.path, ttl=60)
+        self.seen(deduplicator, "a")
+        self.now += 40
+        self.seen(deduplicator, "b")
+        deduplicator.save()
+
+        self.now += 30
+        restored = AlertDeduplicator(self.path, ttl=60)
+        restored.load()
+        self.assertFalse(self.seen(restored, "a"))
+        self.assertTrue(self.seen(restored, "b"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from journal import AlertJournal
+from state_store import FileStateStore
+
+STATE = {'offset': 10, 'size': 10, 'mtime_ns': 1, 'inode': 1, 'last_line_hash': None, 'encoding': None,
+         'tail_hash': None}
+
+class JournalCommitFailureTest(unittest.TestCase):
+    """提交失敗（資料庫被其他連線鎖定）時通知與檔案狀態都要保留到下次提交"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.directory.name) / ".xq_file_states.db"
+        self.store = FileStateStore(self.db_path)
+        self.store.conn.execute("PRAGMA busy_timeout=0")  # 被鎖定時立即失敗
+        self.journal = AlertJournal(self.store)
+        self.locker = sqlite3.connect(str(self.db_path))
+
+    def tearDown(self):
+        self.journal.writer.shutdown()
+        self.locker.close()
+        self.store.conn.close()
+        self.directory.cleanup()
+
+    def lock(self):
+        self.locker.execute("BEGIN IMMEDIATE")
+
+    def unlock(self):
+        self.locker.rollback()
+
+    def commit(self):
+        asyncio.run(self.journal.commit())
+
+    def journal_rows(self):
+        return self.store.conn.execute("SELECT seq, status FROM journal ORDER BY seq").fetchall()
+
+    def file_keys(self):
+        return [row[0] for row in self.store.conn.execute("SELECT file_key FROM file_states")]
+
+    def test_failed_commit_keeps_entries_and_states(self):
+        seq = self.journal.append(1, "a.log", "a1", "a1", 0.0)
+        self.store.update("a.log", STATE)
+        self.lock()
+        with self.assertRaises(sqlite3.OperationalError):
+            self.commit()
+        self.assertEqual(self.journal.durable_seq, 0)
+        self.unlock()
+
+        self.commit()
+        self.assertEqual(self.journal_rows(), [(seq, 'pending')])
+        self.assertEqual(self.file_keys(), ["a.log"])
+        self.assertEqual(self.journal.durable_seq, seq)
+
+    def test_failed_commit_keeps_acks_and_newer_states(self):
+        seq = self.journal.append(1, "a.log", "a1", "a1", 0.0)
+        self.commit()
+        self.journal.ack([seq])
+        self.store.update("a.log", dict(STATE, offset=5))
+        self.lock()
+        with self.assertRaises(sqlite3.OperationalError):
+            self.commit()
+        self.unlock()
+
+        self.store.update("a.log", dict(STATE, offset=20))  # 失敗後才記錄的更新較新
+        self.commit()
+        self.assertEqual(self.journal_rows(), [(seq, 'sent')])
+        self.assertEqual(self.store.load()["a.log"]["offset"], 20)
+
+    def test_failed_flush_keeps_states(self):
+        self.store.update("a.log", STATE)
+        self.lock()
+        with self.assertRaises(sqlite3.OperationalError):
+            self.store.flush()
+        self.unlock()
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(self.file_keys(), ["a.log"])
+
+    def test_sender_wakes_after_retry(self):
+        async def scenario():
+            self.journal.start()
+            try:
+                self.lock()
+                seq = self.journal.append(1, "a.log", "a1", "a1", 0.0)
+                await asyncio.sleep(0.2)  # 第一次提交失敗
+                self.unlock()
+                await asyncio.wait_for(self.journal.wait_durable(seq), 5)
+                return seq
+            finally:
+                await self.journal.stop()
+
+        seq = asyncio.run(scenario())
+        self.assertEqual(self.journal_rows(), [(seq, 'pending')])
+
+    def test_commit_runs_off_the_event_loop_thread(self):
+        threads = []
+        write_states = self.store.write_states
+        self.store.write_states = lambda pending: threads.append(threading.current_thread()) or write_states(pending)
+        seq = self.journal.append(1, "a.log", "a1", "a1", 0.0)
+        self.store.update("a.log", STATE)
+        self.commit()
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+        self.assertEqual(self.journal_rows(), [(seq, 'pending')])
+        self.assertEqual(self.journal.unacked_count(), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError
+
+from sender import TelegramSender
+
+class FakeJournal:
+    def __init__(self):
+        self.acks = []
+
+    def ack(self, seqs, status='sent'):
+        self.acks.append((list(seqs), status))
+
+class FailingBot:
+    """每次發送都丟出指定的錯誤"""
+
+    def __init__(self, error):
+        self.error = error
+        self.attempts = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.attempts += 1
+        raise self.error
+
+class DeliverErrorTest(unittest.TestCase):
+    """重試也無效的錯誤不重試，標記為失敗，重新啟動後不再重送"""
+
+    def deliver(self, error):
+        bot, journal = FailingBot(error), FakeJournal()
+        sender = TelegramSender(bot, journal, global_rate=1000, chat_rate=1000, max_retries=2)
+        delivered = asyncio.run(sender.deliver([7], 1, "text", 0.0))
+        return delivered, bot.attempts, journal.acks
+
+    def test_bad_request_is_not_retried(self):
+        self.assertEqual(self.deliver(BadRequest("Chat not found")), (False, 1, [([7], 'failed')]))
+
+    def test_forbidden_is_not_retried(self):
+        self.assertEqual(self.deliver(Forbidden("bot was blocked")), (False, 1, [([7], 'failed')]))
+
+    def test_chat_migrated_is_not_retried(self):
+        self.assertEqual(self.deliver(ChatMigrated(-100123)), (False, 1, [([7], 'failed')]))
+
+    def test_network_error_is_retried_and_kept(self):
+        original_sleep = asyncio.sleep
+
+        async def no_sleep(delay, *args):
+            await original_sleep(0)
+
+        with mock.patch.object(asyncio, "sleep", no_sleep):
+            # 重試用盡時不確認，留在通知日誌中下次啟動重送
+            self.assertEqual(self.deliver(NetworkError("connection reset")), (False, 3, []))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from state_store import FileStateStore
+
+class MigrateFromJsonTest(unittest.TestCase):
+    """舊版 .xq_file_states.json（保存完整內容）轉移時推算出的位移"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+        self.store = FileStateStore(self.root / ".xq_file_states.db")
+
+    def tearDown(self):
+        self.store.conn.close()
+        self.directory.cleanup()
+
+    def migrate(self, data, old_state):
+        path = self.root / "2330.TW.log"
+        path.write_bytes(data)
+        json_path = self.root / ".xq_file_states.json"
+        json_path.write_text(json.dumps({str(path): old_state}), encoding='utf-8')
+        self.assertEqual(self.store.migrate_from_json(json_path), 1)
+        self.assertTrue(json_path.with_name(json_path.name + ".migrated").exists())
+        return self.store.load()[str(path)]['offset']
+
+    def old_state(self, content):
+        # 舊版以文字模式讀取並去除頭尾空白，\r\n 已變成 \n
+        return {'content': content, 'modified': 1}
+
+    def test_crlf_content_offset(self):
+        old = b"2330 buy 1\r\n2330 buy 2\r\n2330 buy 3\r\n"
+        offset = self.migrate(old + b"2330 buy 4\r\n", self.old_state("2330 buy 1\n2330 buy 2\n2330 buy 3"))
+        self.assertEqual(offset, len(old) - 2)
+
+    def test_lf_content_offset(self):
+        old = b"a1\na2\n"
+        offset = self.migrate(old + b"a3\n", self.old_state("a1\na2"))
+        self.assertEqual(offset, len(old) - 1)
+
+    def test_big5_crlf_content_offset(self):
+        old = "第一行\r\n第二行\r\n".encode('big5')
+        offset = self.migrate(old + "第三行\r\n".encode('big5'), self.old_state("第一行\n第二行"))
+        self.assertEqual(offset, len(old) - 2)
+
+    def test_unknown_content_falls_back_to_end(self):
+        data = b"b1\nb2\n"
+        self.assertEqual(self.migrate(data, self.old_state("something else")), len(data))
+
+    def test_saved_offset_is_kept(self):
+        self.assertEqual(self.migrate(b"a1\na2\n", {'offset': 3}), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+import metrics
+from XQTelegramNotifier import XQDirectoryMonitor, file_changed, read_appended_lines, resume_offset
+
+def reset_count(reason):
+    return metrics.files_reset.values.get((('reason', reason),), 0)
+
+class ReadAppendedLinesTest(unittest.TestCase):
+    """read_appended_lines / resume_offset 對各種檔案變化的處理"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / "2330.TW.log"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, data, mode='ab'):
+        with open(self.path, mode) as f:
+            f.write(data)
+
+    def read(self, state, **kwargs):
+        return read_appended_lines(self.path, state, **kwargs)
+
+    def test_new_file_reads_from_start(self):
+        self.write(b"a1\na2\n")
+        lines, state = self.read(None)
+        self.assertEqual(lines, ["a1", "a2"])
+        self.assertEqual(state['offset'], 6)
+
+    def test_append_reads_only_new_lines(self):
+        self.write(b"a1\n")
+        _, state = self.read(None)
+        self.write(b"a2\na3\n")
+        lines, state = self.read(state)
+        self.assertEqual(lines, ["a2", "a3"])
+        self.assertEqual(state['offset'], 9)
+
+    def test_partial_line_waits_until_settled(self):
+        self.write(b"a1\na2")
+        lines, state = self.read(None)
+        self.assertEqual((lines, state['offset']), (["a1"], 3))
+        lines, state = self.read(state, include_partial=True)
+        self.assertEqual((lines, state['offset']), (["a2"], 5))
+
+    def test_crlf_and_big5(self):
+        self.write("第一行\r\n".encode('big5'))
+        lines, state = self.read(None)
+        self.assertEqual(lines, ["第一行"])
+        self.assertEqual(state['encoding'], 'big5')
+
+    def test_truncate_reads_from_start(self):
+        self.write(b"a1\na2\na3\n")
+        _, state = self.read(None)
+        before = reset_count('truncated')
+        self.write(b"b1\n", mode='wb')
+        lines, state = self.read(state)
+        self.assertEqual(lines, ["b1"])
+        self.assertEqual(reset_count('truncated'), before + 1)
+
+    def test_truncate_and_regrow_reads_from_start(self):
+        self.write(b"a1\na2\n")
+        _, state = self.read(None)
+        before = reset_count('rewritten')
+        self.write(b"b1\nb2\nb3\n", mode='wb')  # 截斷後又寫到比原位移更大
+        lines, _ = self.read(state)
+        self.assertEqual(lines, ["b1", "b2", "b3"])
+        self.assertEqual(reset_count('rewritten'), before + 1)
+
+    def test_same_length_rewrite_reads_from_start(self):
+        self.write(b"a1\na2\n")
+        _, state = self.read(None)
+        before = reset_count('rewritten')
+        self.write(b"b1\nb2\n", mode='r+b')  # 大小不變、內容不同
+        lines, _ = self.read(state)
+        self.assertEqual(lines, ["b1", "b2"])
+        self.assertEqual(reset_count('rewritten'), before + 1)
+
+    def test_replaced_file_reads_from_start(self):
+        self.write(b"a1\na2\n")
+        _, state = self.read(None)
+        replacement = self.path.with_name("replacement.tmp")
+        replacement.write_bytes(b"b1\nb2\nb3\nb4\n")
+        os.replace(replacement, self.path)
+        before = reset_count('replaced')
+        lines, _ = self.read(state)
+        self.assertEqual(lines, ["b1", "b2", "b3", "b4"])
+        self.assertEqual(reset_count('replaced'), before + 1)
+
+    def test_unchanged_prefix_keeps_offset(self):
+        self.write(b"a1\na2\n")
+        _, state = self.read(None)
+        self.write(b"a3\n")
+        with open(self.path, 'rb') as f:
+            self.assertEqual(resume_offset(f, self.path, state, os.stat(self.path)), 6)
+
+    def test_backlog_larger_than_tail_buffer_is_read_in_chunks(self):
+        self.write(b"a0\n")
+        _, state = self.read(None)
+        self.write(b"".join(b"line %04d\n" % i for i in range(1000)))  # 每行 10 bytes，共約 10KB
+        lines, offsets = [], []
+        while state['offset'] < os.path.getsize(self.path):
+            chunk, state = self.read(state, tail_buffer=4096)
+            self.assertLessEqual(len(chunk) * 10, 4096)
+            lines.extend(chunk)
+            offsets.append(state['offset'])
+        self.assertEqual(lines, ["line %04d" % i for i in range(1000)])  # 不略過任何一行
+        self.assertGreater(len(offsets), 2)
+        self.assertTrue(all((offset - 3) % 10 == 0 for offset in offsets))  # 每段停在換行之後
+
+    def test_line_longer_than_tail_buffer_is_not_stuck(self):
+        self.write(b"x" * 5000 + b"\nshort\n")
+        lines, state = self.read(None, tail_buffer=4096)
+        self.assertEqual(state['offset'], 4096)
+        lines, state = self.read(state, tail_buffer=4096)
+        self.assertEqual(lines[-1], "short")
+        self.assertEqual(state['offset'], 5007)
+
+class ProcessFileBacklogTest(unittest.TestCase):
+    """監控端一次處理完超過 tail_buffer 的新增內容，每段各自提交"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.watch = Path(self.directory.name)
+        self.monitor = XQDirectoryMonitor(
+            None, "100", self.watch, dedup_options={'enabled': False}, tail_buffer=4096
+        )
+        self.handled = []
+
+        async def handle_changes(file_path, file_key, new_lines, new_state, is_new_file, detected_at):
+            self.handled.append((new_lines, is_new_file))
+            self.monitor.file_states[file_key] = new_state
+
+        self.monitor.handle_changes = handle_changes
+
+    def tearDown(self):
+        self.monitor.executor.shutdown()
+        self.directory.cleanup()
+
+    def test_all_lines_are_delivered(self):
+        path = self.watch / "2330.TW.log"
+        path.write_bytes(b"".join(b"line %05d\n" % i for i in range(5000)))  # 約 55KB
+        asyncio.run(self.monitor.process_file(path))
+        lines = [line for chunk, _ in self.handled for line in chunk]
+        self.assertEqual(lines, ["line %05d" % i for i in range(5000)])
+        self.assertEqual([is_new for _, is_new in self.handled][:2], [True, False])
+        self.assertEqual(self.monitor.file_states[str(path)]['offset'], path.stat().st_size)
+
+class ForgetDeletedFilesTest(unittest.TestCase):
+    """已刪除的檔案停止追蹤，重新建立時視為新檔案"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.watch = Path(self.directory.name)
+        self.monitor = XQDirectoryMonitor(None, "100", self.watch, dedup_options={'enabled': False})
+
+    def tearDown(self):
+        self.monitor.executor.shutdown()
+        self.directory.cleanup()
+
+    def test_deleted_file_is_forgotten_and_recreated_as_new(self):
+        path = self.watch / "2330.TW.log"
+        path.write_bytes(b"a1\n")
+        _, state = read_appended_lines(path, None)
+        self.monitor.file_states[str(path)] = state
+        missing_dir_key = str(self.watch / "gone" / "2454.TW.log")
+        self.monitor.file_states[missing_dir_key] = state
+
+        path.unlink()
+        asyncio.run(self.monitor.forget_deleted_files([str(path), missing_dir_key]))
+        self.assertNotIn(str(path), self.monitor.file_states)
+        self.assertIn(missing_dir_key, self.monitor.file_states)  # 目錄無法存取時保留狀態
+
+        path.write_bytes(b"b1\n")
+        self.assertIs(file_changed(self.monitor.file_states.get(str(path)), os.stat(path)), True)
+        lines, _ = read_appended_lines(path, self.monitor.file_states.get(str(path)))
+        self.assertEqual(lines, ["b1"])
+
+if __name__ == "__main__":
+    unittest.main()